@@ -1,13 +1,27 @@
-from flask import Flask, g
+import atexit
+import logging
+import time
+from flask import Flask, g, jsonify, request
 from flask_cors import CORS
 
+from lib.cache import LocalCacheBackend, ResponseCache, connect_cache_backend
+from lib.compression import BROTLI_QUALITY, GZIP_LEVEL, MIN_COMPRESS_SIZE, Compression
 from lib.db import Db
+from lib.history import BackgroundReset
+from lib.metrics import DEFAULT_SLOW_QUERY_MS, Metrics, QueryStats, slow_query_logger
+from lib.review_buffer import ReviewBuffer
+from lib.serialization import json_provider
+from lib.shards import LEARNER_HEADER, MAX_CONNECTIONS, Shards
+from lib.word_sets import WordSets
 
 import routes.words
 import routes.groups
 import routes.study_sessions
 import routes.dashboard
 import routes.study_activities
+import routes.cache
+import routes.export
+import routes.metrics
 
 def get_allowed_origins(app):
     try:
@@ -33,13 +47,90 @@ def create_app(test_config=None):
     
     if test_config is None:
         app.config.from_mapping(
-            DATABASE='words.db'
+            DATABASE='words.db',
+            DB_POOL=False,  # Reuse per-worker WAL connections instead of reconnecting per request
+            REVIEW_BUFFER=False,  # Acknowledge reviews immediately and write them in the background
+            RESPONSE_CACHE=False  # Serve read-mostly GET routes from a cache invalidated on writes
         )
+        # FLASK_DATABASE=/path/to/words.db etc. override the defaults
+        app.config.from_prefixed_env()
     else:
         app.config.update(test_config)
+
+    # jsonify() through orjson when it is installed (JSON_ORJSON=False opts out)
+    app.json = json_provider(app, use_orjson=app.config.get('JSON_ORJSON', True))
     
+    # Learner shards: with SHARDS_DIRECTORY set, the study history of the
+    # learner named by the X-Learner-Id header lives in a shard file of its
+    # own (one per learner, or SHARD_COHORTS files shared by hash)
+    shards = None
+    if app.config.get('SHARDS_DIRECTORY'):
+        shards = Shards(app.config['SHARDS_DIRECTORY'], cohorts=app.config.get('SHARD_COHORTS', 0))
+
     # Initialize database first since we need it for CORS configuration
-    app.db = Db(database=app.config['DATABASE'])
+    app.db = Db(
+        database=app.config['DATABASE'],
+        pool=app.config.get('DB_POOL', False),
+        pragmas=app.config.get('DB_PRAGMAS'),
+        archive=app.config.get('ARCHIVE_DATABASE'),
+        shards=shards,
+        shard_connections=app.config.get('SHARD_CONNECTIONS', MAX_CONNECTIONS)
+    )
+    
+    # gzip/brotli for JSON bodies of at least COMPRESS_MIN_SIZE bytes, as
+    # negotiated on Accept-Encoding; versioned and cached bodies keep their
+    # compressed copies
+    app.compression = Compression(
+        enabled=app.config.get('COMPRESSION', True),
+        min_size=app.config.get('COMPRESS_MIN_SIZE', MIN_COMPRESS_SIZE),
+        gzip_level=app.config.get('COMPRESS_GZIP_LEVEL', GZIP_LEVEL),
+        brotli_quality=app.config.get('COMPRESS_BROTLI_QUALITY', BROTLI_QUALITY)
+    )
+    app.after_request(app.compression.after_request)
+
+    # Response cache for read-mostly GET routes: in-process, or shared between
+    # workers through the server started by `invoke cache-server`
+    backend = None
+    if app.config.get('RESPONSE_CACHE'):
+        if app.config.get('RESPONSE_CACHE_ADDRESS'):
+            backend = connect_cache_backend(
+                app.config['RESPONSE_CACHE_ADDRESS'],
+                app.config.get('RESPONSE_CACHE_AUTHKEY', b'lang-portal')
+            )
+        else:
+            backend = LocalCacheBackend(
+                max_entries=app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 1024),
+                max_bytes=app.config.get('RESPONSE_CACHE_MAX_BYTES', 16 * 1024 * 1024)
+            )
+    app.response_cache = ResponseCache(backend)
+
+    # Word id bitmaps of groups and review states for multi-group sessions,
+    # rebuilt when a group's version moves on
+    app.word_sets = WordSets(max_groups=app.config.get('WORD_SETS_MAX_GROUPS', 256))
+
+    # Write-behind buffer for POST /study_sessions/<id>/review. It replays
+    # reviews left in the spill file by a previous run before accepting new ones
+    app.review_buffer = None
+    if app.config.get('REVIEW_BUFFER'):
+        app.review_buffer = ReviewBuffer(
+            app.db,
+            spill_path=app.config.get('REVIEW_BUFFER_PATH', 'review_buffer.ndjson'),
+            flush_interval_ms=app.config.get('REVIEW_BUFFER_FLUSH_MS', 200),
+            flush_items=app.config.get('REVIEW_BUFFER_FLUSH_ITEMS', 500),
+            max_items=app.config.get('REVIEW_BUFFER_MAX_ITEMS', 10000),
+            fsync=app.config.get('REVIEW_BUFFER_FSYNC', False),
+            on_flush=lambda by_session: app.response_cache.invalidate('reviews', 'sessions')
+        ).start()
+        # Drain the queue on a clean shutdown
+        atexit.register(app.review_buffer.close)
+    
+    # Finishes the history resets that POST /api/study-sessions/reset could
+    # not complete within RESET_BUDGET_MS
+    app.history_reset = BackgroundReset(
+        app.db,
+        on_finish=lambda: app.response_cache.invalidate('reviews', 'sessions')
+    )
+    atexit.register(app.history_reset.close)
     
     # Get allowed origins from study_activities table
     allowed_origins = get_allowed_origins(app)
@@ -53,10 +144,62 @@ def create_app(test_config=None):
         r"/*": {
             "origins": allowed_origins,
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"]
+            "allow_headers": ["Content-Type", "Authorization", LEARNER_HEADER]
         }
     })
 
+    # Route latency and per-request SQL accounting, exported on GET /metrics.
+    # Statements slower than SLOW_QUERY_MS are logged with their query plan
+    app.metrics = None
+    if app.config.get('METRICS', True):
+        app.metrics = Metrics(slow_query_ms=app.config.get('SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS))
+        if app.config.get('SLOW_QUERY_LOG'):
+            slow_query_logger.addHandler(logging.FileHandler(app.config['SLOW_QUERY_LOG']))
+
+    # Runs before the routes open their connection, and before the response
+    # cache builds its key
+    @app.before_request
+    def route_learner():
+        if app.db.shards is None:
+            return None
+        try:
+            g.shard = app.db.shards.route(request.headers.get(LEARNER_HEADER))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return None
+
+    @app.before_request
+    def start_request_metrics():
+        if app.metrics is not None:
+            g.request_started = time.perf_counter()
+            g.sql_stats = QueryStats(app.metrics.slow_seconds)
+
+    @app.after_request
+    def add_server_timing(response):
+        stats = g.get('sql_stats')
+        if stats is not None:
+            g.response_status = response.status_code
+            response.headers['Server-Timing'] = stats.server_timing()
+        return response
+
+    # Runs before close_db, once streamed responses are done with the connection
+    @app.teardown_request
+    def record_request_metrics(exception):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return
+        connection = g.get('db')
+        if connection is not None:
+            connection.stats = None
+        stats.finish()
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        app.metrics.record_request(
+            route, request.method, g.get('response_status', 500),
+            time.perf_counter() - g.request_started, stats
+        )
+        if stats.slow and connection is not None:
+            app.metrics.log_slow_queries(connection, route, stats)
+
     # Close database connection
     @app.teardown_appcontext
     def close_db(exception):
@@ -68,6 +211,9 @@ def create_app(test_config=None):
     routes.study_sessions.load(app)
     routes.dashboard.load(app)
     routes.study_activities.load(app)
+    routes.cache.load(app)
+    routes.export.load(app)
+    routes.metrics.load(app)
     
     return app
 
@@ -0,0 +1,164 @@
+import bisect
+import json
+import re
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from collections import deque
+
+# In-memory prefix index over the normalized romaji/pinyin of every word.
+# Keys are kept in one sorted list with a parallel array of word ids; a
+# lookup is a bisect to the first key >= prefix and a walk while keys still
+# start with it. Loaded on first use and refreshed from words (new ids) and
+# word_changes (edits and deletions, migration 008) before each lookup.
+
+MAX_SUGGESTIONS = 50
+
+# Above this many new words a refresh re-sorts instead of inserting one by one
+BULK_REFRESH = 1000
+
+TONE_NUMBER = re.compile(r'(?<=[^\W\d_])[1-5]')  # ni3hao3
+SEPARATORS = re.compile(r'[\W_]+')  # spaces, apostrophes, hyphens
+ASCII_SEPARATORS = str.maketrans('', '', ''.join(chr(code) for code in range(128) if not chr(code).isalnum()))
+
+def normalize(text):
+  # Lowercase, fold ü (and v, u:) to v, strip tone marks and tone numbers,
+  # and drop spaces and punctuation: 'Nǚ hái', 'nv3hai2' and 'nvhai' all
+  # become 'nvhai'
+  text = (text or '').lower().replace('u:', 'v')
+  if text.isascii():
+    # Fast path for plain romaji, the bulk of what gets indexed
+    text = text.translate(ASCII_SEPARATORS)
+  else:
+    text = unicodedata.normalize('NFKD', text).replace('u\u0308', 'v')  # decomposed ü
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = SEPARATORS.sub('', text)
+  if not text.isalpha():
+    text = TONE_NUMBER.sub('', text)
+  return text
+
+class AutocompleteIndex:
+  def __init__(self):
+    self._keys = None  # None until the first lookup loads the index
+    self._ids = array('q')
+    self._max_id = 0
+    self._seq = 0
+    self._loaded_at = None
+    self._refreshes = 0
+    self._timings = deque(maxlen=1000)
+    self._lock = threading.Lock()
+
+  def suggest(self, cursor, prefix, limit=10):
+    # Word ids whose normalized romaji starts with the (normalized) prefix,
+    # in key order
+    with self._lock:
+      self.refresh(cursor)
+      started = time.perf_counter()
+      keys, ids = self._keys, self._ids
+      result = []
+      position = bisect.bisect_left(keys, prefix)
+      while position < len(keys) and len(result) < limit and keys[position].startswith(prefix):
+        result.append(ids[position])
+        position += 1
+      self._timings.append(time.perf_counter() - started)
+      return result
+
+  def refresh(self, cursor):
+    if self._keys is None:
+      self._load(cursor)
+      return
+    max_id, seq, min_seq = cursor.execute('''
+      SELECT (SELECT COALESCE(MAX(id), 0) FROM words),
+             (SELECT COALESCE(MAX(seq), 0) FROM word_changes),
+             (SELECT MIN(seq) FROM word_changes)
+    ''').fetchone()
+    if max_id == self._max_id and seq == self._seq:
+      return
+    if seq > self._seq:
+      # The log was pruned past our position: start over
+      if min_seq is None or min_seq > self._seq + 1:
+        self._load(cursor)
+        return
+      self._apply_changes(cursor)
+    self._add_new_words(cursor)
+    self._refreshes += 1
+
+  def stats(self):
+    with self._lock:
+      loaded = self._keys is not None
+      keys = self._keys or []
+      timings = sorted(self._timings)
+      def percentile(fraction):
+        return round(timings[min(int(len(timings) * fraction), len(timings) - 1)] * 1e6, 1) if timings else None
+      key_bytes = sys.getsizeof(keys) + sum(sys.getsizeof(key) for key in keys)
+      id_bytes = sys.getsizeof(self._ids)
+      return {
+        'loaded': loaded,
+        'entries': len(keys),
+        'memory_bytes': key_bytes + id_bytes if loaded else 0,
+        'key_bytes': key_bytes if loaded else 0,
+        'id_bytes': id_bytes if loaded else 0,
+        'loaded_at': self._loaded_at,
+        'refreshes': self._refreshes,
+        'lookup_us_p50': percentile(0.5),
+        'lookup_us_p99': percentile(0.99)
+      }
+
+  def _load(self, cursor):
+    self._max_id, self._seq = cursor.execute('''
+      SELECT (SELECT COALESCE(MAX(id), 0) FROM words),
+             (SELECT COALESCE(MAX(seq), 0) FROM word_changes)
+    ''').fetchone()
+    entries = sorted(
+      (normalize(romaji), word_id)
+      for word_id, romaji in cursor.execute('SELECT id, romaji FROM words WHERE id <= ?', (self._max_id,))
+    )
+    self._keys = [key for key, _ in entries]
+    self._ids = array('q', (word_id for _, word_id in entries))
+    self._loaded_at = time.strftime('%Y-%m-%d %H:%M:%S')
+
+  def _apply_changes(self, cursor):
+    changes = cursor.execute(
+      'SELECT seq, word_id, old_romaji FROM word_changes WHERE seq > ? ORDER BY seq', (self._seq,)
+    ).fetchall()
+    changed = set()
+    for seq, word_id, old_romaji in changes:
+      self._remove(normalize(old_romaji), word_id)
+      self._seq = seq
+      # Words above _max_id are picked up as new words
+      if word_id <= self._max_id:
+        changed.add(word_id)
+    # Re-add the current spelling of edited words that still exist
+    for word_id, romaji in cursor.execute(
+      'SELECT id, romaji FROM words WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(sorted(changed)),)
+    ).fetchall():
+      self._insert(normalize(romaji), word_id)
+
+  def _add_new_words(self, cursor):
+    rows = cursor.execute('SELECT id, romaji FROM words WHERE id > ? ORDER BY id', (self._max_id,)).fetchall()
+    if not rows:
+      return
+    self._max_id = rows[-1][0]
+    if len(rows) > BULK_REFRESH:
+      entries = sorted(list(zip(self._keys, self._ids)) + [(normalize(romaji), word_id) for word_id, romaji in rows])
+      self._keys = [key for key, _ in entries]
+      self._ids = array('q', (word_id for _, word_id in entries))
+    else:
+      for word_id, romaji in rows:
+        self._insert(normalize(romaji), word_id)
+
+  def _insert(self, key, word_id):
+    position = bisect.bisect_right(self._keys, key)
+    self._keys.insert(position, key)
+    self._ids.insert(position, word_id)
+
+  def _remove(self, key, word_id):
+    position = bisect.bisect_left(self._keys, key)
+    while position < len(self._keys) and self._keys[position] == key:
+      if self._ids[position] == word_id:
+        del self._keys[position]
+        del self._ids[position]
+        return
+      position += 1
@@ -0,0 +1,258 @@
+import functools
+import logging
+import threading
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+from urllib.parse import urlencode
+
+from flask import Response, current_app, g, request
+
+from lib.compression import encoded
+
+logger = logging.getLogger(__name__)
+
+class VersionedBodyCache:
+  # Serialized response bodies keyed by an id and the data version they were
+  # built from. A lookup with a newer version misses, so entries never need
+  # explicit invalidation; the least recently used ones are evicted. An entry
+  # holds the plain body and its compressed encodings (lib/compression),
+  # which go together when the version moves on.
+  def __init__(self, max_entries=64):
+    self.max_entries = max_entries
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key, version, encoding=None):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None or entry[0] != version:
+        return None
+      self._entries.move_to_end(key)
+      return entry[1].get(encoding)
+
+  def put(self, key, version, body, encoding=None):
+    with self._lock:
+      current = self._entries.get(key)
+      # Never replace a newer body with an older one built concurrently
+      if current is not None and current[0] > version:
+        return
+      if current is None or current[0] < version:
+        current = self._entries[key] = (version, {})
+      current[1][encoding] = body
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+# -- route response cache ----------------------------------------------------
+#
+# GET routes are cached under their path and sorted query arguments. Every
+# entry remembers the generation of the tags (tables) it was built from;
+# writes bump the generation of the tags they touch, which turns the
+# matching entries into misses without having to find them.
+
+class LocalCacheBackend:
+  # In-process LRU of serialized responses, bounded by entry count and by the
+  # total size of the bodies
+  def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024):
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self._entries = OrderedDict()
+    self._bytes = 0
+    self._generations = {}
+    self._lock = threading.Lock()
+
+  def lookup(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      generations, status, mimetype, body = entry
+      if any(self._generations.get(tag, 0) != generation for tag, generation in generations.items()):
+        self._remove(key)
+        return None
+      self._entries.move_to_end(key)
+      return status, mimetype, body
+
+  def generations(self, tags):
+    with self._lock:
+      return {tag: self._generations.get(tag, 0) for tag in tags}
+
+  def store(self, key, generations, status, mimetype, body):
+    with self._lock:
+      if len(body) > self.max_bytes:
+        return False
+      # Built from data that has been invalidated in the meantime
+      if any(self._generations.get(tag, 0) != generation for tag, generation in generations.items()):
+        return False
+      self._remove(key)
+      self._entries[key] = (generations, status, mimetype, body)
+      self._bytes += len(body)
+      while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+        self._remove(next(iter(self._entries)))
+      return True
+
+  def invalidate(self, tags):
+    with self._lock:
+      for tag in tags:
+        self._generations[tag] = self._generations.get(tag, 0) + 1
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._bytes = 0
+
+  def info(self):
+    with self._lock:
+      return {
+        'entries': len(self._entries),
+        'bytes': self._bytes,
+        'max_entries': self.max_entries,
+        'max_bytes': self.max_bytes
+      }
+
+  def _remove(self, key):
+    entry = self._entries.pop(key, None)
+    if entry is not None:
+      self._bytes -= len(entry[3])
+
+class _CacheClient(BaseManager):
+  pass
+
+_CacheClient.register('backend')
+
+def parse_address(address):
+  # 'host:port' or a (host, port) tuple
+  if isinstance(address, str):
+    host, _, port = address.rpartition(':')
+    return (host or '127.0.0.1', int(port))
+  return tuple(address)
+
+def cache_server(address, authkey, max_entries=1024, max_bytes=16 * 1024 * 1024):
+  # Server exposing a LocalCacheBackend of this process to other app
+  # processes; call serve_forever() on it
+  backend = LocalCacheBackend(max_entries, max_bytes)
+
+  class CacheServer(BaseManager):
+    pass
+
+  CacheServer.register('backend', callable=lambda: backend)
+  return CacheServer(address=parse_address(address), authkey=authkey).get_server()
+
+def connect_cache_backend(address, authkey):
+  # Proxy with the same methods as LocalCacheBackend
+  client = _CacheClient(address=parse_address(address), authkey=authkey)
+  client.connect()
+  return client.backend()
+
+class ResponseCache:
+  def __init__(self, backend=None):
+    # No backend disables caching; routes and invalidations pass through
+    self.backend = backend
+    self._counters = {}
+    self._errors = 0
+    self._invalidations = 0
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def key():
+    args = urlencode(sorted(request.args.items(multi=True)))
+    # Learners on shards see their own sessions and counters
+    shard = g.get('shard')
+    if shard is not None:
+      return f'{shard}:{request.path}?{args}'
+    return f'{request.path}?{args}'
+
+  def cached(self, *tags):
+    def decorator(view):
+      @functools.wraps(view)
+      def wrapper(*args, **kwargs):
+        if self.backend is None:
+          return view(*args, **kwargs)
+        route = request.url_rule.rule if request.url_rule else request.path
+        key = self.key()
+
+        # Compressed bodies are entries of their own, under the key and the
+        # encoding, validated by the same tags as the plain body
+        encoding = current_app.compression.accepted()
+        generations = None
+        if encoding is not None:
+          entry = self._call('lookup', f'{key}#{encoding}')
+          if entry is not None:
+            self._count(route, 'hits')
+            status, mimetype, body = entry
+            return encoded(Response(body, status=status, mimetype=mimetype), encoding)
+          generations = self._call('generations', tags)
+
+        entry = self._call('lookup', key)
+        if entry is not None:
+          self._count(route, 'hits')
+          status, mimetype, body = entry
+          return self._compressed(key, generations, Response(body, status=status, mimetype=mimetype), encoding)
+
+        self._count(route, 'misses')
+        # Taken before the view runs, so a write that lands in between
+        # makes the stored entry stale instead of hiding the write
+        if generations is None:
+          generations = self._call('generations', tags)
+        response = current_app.make_response(view(*args, **kwargs))
+        if (generations is not None and response.status_code == 200 and not response.direct_passthrough
+            and 'Content-Encoding' not in response.headers):
+          if self._call('store', key, generations, response.status_code, response.mimetype, response.get_data()):
+            self._count(route, 'stores')
+            return self._compressed(key, generations, response, encoding)
+        return response
+      return wrapper
+    return decorator
+
+  def _compressed(self, key, generations, response, encoding):
+    # Compress a plain response when the client accepts an encoding, and
+    # store the compressed body for the next request
+    compression = current_app.compression
+    body = response.get_data()
+    if encoding is None or not response.is_json or len(body) < compression.min_size:
+      return response
+    body = compression.compress(body, encoding)
+    if generations is not None:
+      self._call('store', f'{key}#{encoding}', generations, response.status_code, response.mimetype, body)
+    response.set_data(body)
+    return encoded(response, encoding)
+
+  def invalidate(self, *tags):
+    if self.backend is None:
+      return
+    with self._lock:
+      self._invalidations += 1
+    self._call('invalidate', tags)
+
+  def stats(self):
+    with self._lock:
+      routes = {route: dict(counts) for route, counts in self._counters.items()}
+      hits = sum(counts['hits'] for counts in routes.values())
+      misses = sum(counts['misses'] for counts in routes.values())
+      result = {
+        'enabled': self.backend is not None,
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        'invalidations': self._invalidations,
+        'errors': self._errors,
+        'routes': routes
+      }
+    if self.backend is not None:
+      result['backend'] = self._call('info')
+    return result
+
+  def _count(self, route, counter):
+    with self._lock:
+      counts = self._counters.setdefault(route, {'hits': 0, 'misses': 0, 'stores': 0})
+      counts[counter] += 1
+
+  def _call(self, method, *args):
+    # A shared backend that went away degrades to uncached responses
+    try:
+      return getattr(self.backend, method)(*args)
+    except (OSError, EOFError) as e:
+      with self._lock:
+        self._errors += 1
+      logger.warning('Response cache %s failed: %s', method, e)
+      return None
@@ -0,0 +1,91 @@
+import gzip
+
+from flask import request
+
+try:
+  import brotli
+except ImportError:  # optional: pip install brotli
+  brotli = None
+
+# gzip and brotli response compression negotiated on Accept-Encoding.
+# JSON responses of at least min_size bytes are compressed after the view
+# runs (Compression.after_request). Versioned payloads keep their compressed
+# bodies next to the plain one, in the same cache entry as the version
+# (Compression.versioned), so a repeat request only copies bytes.
+
+# Bodies smaller than this are sent as they are: the saving is a few
+# hundred bytes at most, less than the cost of compressing them
+MIN_COMPRESS_SIZE = 1024
+
+GZIP_LEVEL = 6
+
+# 11 is the maximum but is several times slower than gzip; 5 compresses
+# better than gzip -9 at about the speed of gzip -6
+BROTLI_QUALITY = 5
+
+class Compression:
+  def __init__(self, enabled=True, min_size=MIN_COMPRESS_SIZE, gzip_level=GZIP_LEVEL, brotli_quality=BROTLI_QUALITY):
+    self.enabled = enabled
+    self.min_size = min_size
+    self.gzip_level = gzip_level
+    self.brotli_quality = brotli_quality
+    # In order of preference when the client accepts several equally
+    self.encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+  def accepted(self):
+    # Encoding to use for the current request, or None for the plain body
+    if not self.enabled:
+      return None
+    encoding = request.accept_encodings.best_match(self.encodings)
+    if encoding is None or request.accept_encodings[encoding] <= 0:
+      return None
+    return encoding
+
+  def compress(self, body, encoding):
+    if encoding == 'br':
+      return brotli.compress(body, quality=self.brotli_quality)
+    # mtime=0 keeps the output the same for the same body
+    return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+  def versioned(self, cache, key, version, build):
+    # (body, encoding) of a payload kept in a VersionedBodyCache, in the
+    # encoding the client accepts. build() returns the plain body on a miss;
+    # the compressed body is made once per version and encoding.
+    encoding = self.accepted()
+    if encoding is not None:
+      body = cache.get(key, version, encoding)
+      if body is not None:
+        return body, encoding
+    body = cache.get(key, version)
+    if body is None:
+      body = build()
+      cache.put(key, version, body)
+    if encoding is None or len(body) < self.min_size:
+      return body, None
+    compressed = self.compress(body, encoding)
+    cache.put(key, version, compressed, encoding)
+    return compressed, encoding
+
+  def after_request(self, response):
+    # Compress JSON bodies that no route has encoded already. Streamed
+    # responses (the NDJSON exports) compress themselves.
+    if not self.enabled or not response.is_json or response.is_streamed:
+      return response
+    response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+      return response
+    body = response.get_data()
+    if len(body) < self.min_size:
+      return response
+    encoding = self.accepted()
+    if encoding is not None:
+      response.set_data(self.compress(body, encoding))
+      response.headers['Content-Encoding'] = encoding
+    return response
+
+def encoded(response, encoding):
+  # Mark a response whose body is already in the given encoding
+  response.vary.add('Accept-Encoding')
+  if encoding is not None:
+    response.headers['Content-Encoding'] = encoding
+  return response
@@ -1,16 +1,129 @@
 import sqlite3
 import json
-from flask import g
+import os
+import threading
+from collections import OrderedDict
+from flask import g, has_request_context, request
+
+from lib.history import attach_archive
+from lib.importer import import_words
+from lib.metrics import InstrumentedConnection
+from lib.shards import MAX_CONNECTIONS, uri
+
+# Pragmas applied to every pooled connection. WAL lets the GET routes keep
+# reading while log_review holds the write lock, and NORMAL sync is safe in WAL.
+POOL_PRAGMAS = {
+  'journal_mode': 'WAL',
+  'synchronous': 'NORMAL',
+  'cache_size': -64000,     # 64 MB page cache per connection
+  'mmap_size': 268435456,   # 256 MB memory-mapped I/O
+  'temp_store': 'MEMORY',
+  'busy_timeout': 5000,     # wait up to 5s for the write lock instead of failing
+}
 
 class Db:
-  def __init__(self, database='words.db'):
+  def __init__(self, database='words.db', pool=False, pragmas=None, archive=None, shards=None,
+               shard_connections=MAX_CONNECTIONS):
     self.database = database
+    # Archive database of the review history (lib/history.py), attached to
+    # every connection as `archive`
+    self.archive = archive
+    # Learner shards (lib/shards.py); requests naming a learner get a
+    # connection to its shard instead of the main database
+    self.shards = shards
+    self.shard_connections = shard_connections
     self.connection = None
+    # In pool mode every worker thread keeps its own connections open between
+    # requests instead of reconnecting per app context.
+    self.pool = pool
+    self.pragmas = dict(POOL_PRAGMAS, **(pragmas or {}))
+    self._local = threading.local()
+    self._pooled = []
+    self._pool_lock = threading.Lock()
+
+  def connect(self, readonly=False, shard=None, shared=False):
+    # Pooled handles are only ever used by the thread that opened them, but
+    # close_pool() has to be able to close them from any thread. shared
+    # handles are used by several threads in turn, under the caller's lock.
+    check_same_thread = not (self.pool or shared)
+    if shard is not None:
+      connection = sqlite3.connect(uri(self.shards.path(shard), readonly), uri=True, check_same_thread=check_same_thread, factory=InstrumentedConnection)
+    elif readonly:
+      connection = sqlite3.connect(uri(self.database, readonly=True), uri=True, check_same_thread=check_same_thread, factory=InstrumentedConnection)
+    else:
+      connection = sqlite3.connect(self.database, check_same_thread=check_same_thread, factory=InstrumentedConnection)
+    connection.row_factory = sqlite3.Row  # Return rows as dictionaries
+    if self.pool:
+      for name, value in self.pragmas.items():
+        if readonly and name == 'journal_mode':
+          continue
+        connection.execute(f'PRAGMA {name} = {value}')
+    if shard is not None:
+      self.shards.prepare(connection, self.database, readonly=readonly)
+    elif self.archive:
+      attach_archive(connection, self.archive, readonly=readonly)
+    connection.shard = shard
+    return connection
+
+  def pooled(self, readonly=False, shard=None):
+    if shard is not None:
+      return self.pooled_shard(shard, readonly)
+    key = 'reader' if readonly else 'writer'
+    connection = getattr(self._local, key, None)
+    if connection is None:
+      if readonly:
+        # The writer switches the file to WAL (and creates it if needed)
+        # before the first read-only handle is opened
+        writer = self.pooled()
+        if not os.path.exists(self.database):
+          return writer
+      connection = self.connect(readonly=readonly)
+      setattr(self._local, key, connection)
+      with self._pool_lock:
+        self._pooled.append(connection)
+    return connection
+
+  def pooled_shard(self, shard, readonly=False):
+    # Every worker keeps the connections of the shards it served last, up
+    # to shard_connections, and closes the least recently used beyond that
+    connections = getattr(self._local, 'shards', None)
+    if connections is None:
+      connections = self._local.shards = OrderedDict()
+    key = (shard, readonly)
+    connection = connections.get(key)
+    if connection is not None:
+      connections.move_to_end(key)
+      return connection
+    if readonly:
+      # The writer creates the shard and its tables
+      writer = self.pooled_shard(shard)
+      if not os.path.exists(self.shards.path(shard)):
+        return writer
+    connection = self.connect(readonly=readonly, shard=shard)
+    connections[key] = connection
+    with self._pool_lock:
+      self._pooled.append(connection)
+    while len(connections) > self.shard_connections:
+      _, evicted = connections.popitem(last=False)
+      with self._pool_lock:
+        if evicted in self._pooled:
+          self._pooled.remove(evicted)
+      evicted.close()
+    return connection
 
   def get(self):
     if 'db' not in g:
-      g.db = sqlite3.connect(self.database)
-      g.db.row_factory = sqlite3.Row  # Return rows as dictionaries
+      # Set from the learner id header before the request (see app.py)
+      shard = g.get('shard')
+      if self.pool:
+        # GET routes never write, so they get the read-only handle and
+        # don't queue behind writers for the rollback journal
+        readonly = has_request_context() and request.method in ('GET', 'HEAD')
+        g.db = self.pooled(readonly=readonly, shard=shard)
+      else:
+        g.db = self.connect(shard=shard)
+      # Account the request's statements (see lib/metrics.py)
+      g.db.stats = g.get('sql_stats')
     return g.db
 
   def commit(self):
@@ -23,9 +136,25 @@ class Db:
 
   def close(self):
     db = g.pop('db', None)
-    if db is not None:
+    if db is None:
+      return
+    db.stats = None
+    if self.pool:
+      # Keep the connection for the next request on this worker, but never
+      # leak an uncommitted transaction into it
+      if db.in_transaction:
+        db.rollback()
+    else:
       db.close()
 
+  def close_pool(self):
+    with self._pool_lock:
+      pooled, self._pooled = self._pooled, []
+      # Workers that come back after this get fresh connections
+      self._local = threading.local()
+    for connection in pooled:
+      connection.close()
+
   # Function to load SQL from a file
   def sql(self, filepath):
     with open('sql/' + filepath, 'r') as file:
@@ -68,46 +197,11 @@ class Db:
     self.get().commit()
 
   def import_word_json(self,cursor,group_name,data_json_path):
-      # Insert a new group
-      cursor.execute('''
-        INSERT INTO groups (name) VALUES (?)
-      ''', (group_name,))
-      self.get().commit()
-
-      # Get the ID of the group
-      cursor.execute('SELECT id FROM groups WHERE name = ?', (group_name,))
-      core_verbs_group_id = cursor.fetchone()[0]
-
-      # Insert some sample words (verbs) from JSON file and associate with the group
-      words = self.load_json(data_json_path)
-
-      for word in words:
-        # Insert the word into the words table
-        cursor.execute('''
-          INSERT INTO words (kanji, romaji, english, parts) VALUES (?, ?, ?, ?)
-        ''', (word['kanji'], word['romaji'], word['english'], json.dumps(word['parts'])))
-        
-        # Get the last inserted word's ID
-        word_id = cursor.lastrowid
-
-        # Insert the word-group relationship into word_groups table
-        cursor.execute('''
-          INSERT INTO word_groups (word_id, group_id) VALUES (?, ?)
-        ''', (word_id, core_verbs_group_id))
-      self.get().commit()
-
-      # Update the words_count in the groups table by counting all words in the group
-      cursor.execute('''
-        UPDATE groups
-        SET words_count = (
-          SELECT COUNT(*) FROM word_groups WHERE group_id = ?
-        )
-        WHERE id = ?
-      ''', (core_verbs_group_id, core_verbs_group_id))
-
-      self.get().commit()
+      # Stream the words into the group (created if missing); duplicates of
+      # existing (kanji, romaji) pairs are only attached to the group
+      result = import_words(self.get(), data_json_path, group_names=[group_name])
 
-      print(f"Successfully added {len(words)} verbs to the '{group_name}' group.")
+      print(f"Successfully added {result['inserted']} verbs to the '{group_name}' group.")
 
   # Initialize the database with sample data
   def init(self, app):
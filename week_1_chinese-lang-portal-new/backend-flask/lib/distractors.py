@@ -0,0 +1,208 @@
+from lib.autocomplete import normalize
+from lib.search import TOKEN
+
+# Wrong options for multiple-choice quizzes: for every word, the
+# DISTRACTOR_COUNT other words that sound or mean most alike, kept in
+# word_distractors (migration 013). Comparing every pair of words is out of
+# reach for a large vocabulary, so the candidates of a word come from two
+# index lookups: its neighbours in romaji order (shared beginnings) and the
+# words whose English gloss shares a term with it (words_fts). Only the
+# candidates are scored.
+
+# Distractors stored per word, and the upper bound of ?k=
+DISTRACTOR_COUNT = 10
+
+# Candidates taken from each side of the word in romaji order, and from the
+# gloss matches
+ROMAJI_NEIGHBOURS = 10
+GLOSS_NEIGHBOURS = 20
+
+# Weight of the romaji similarity (1 - edit distance / length) against the
+# gloss similarity (Jaccard over the gloss terms)
+ROMAJI_WEIGHT = 0.6
+GLOSS_WEIGHT = 0.4
+
+# Words whose lists are written per transaction, so that a refresh never
+# holds the write lock for long
+REFRESH_CHUNK = 500
+
+# Gloss terms too common to relate two words
+STOPWORDS = frozenset('a an and as at be by for from in is of on or the to with'.split())
+
+def edit_distance(a, b):
+  # Levenshtein distance with Myers' bit-parallel algorithm: one pass over
+  # b, the columns of the table packed into the bits of an int
+  if not a or not b:
+    return len(a) + len(b)
+  positions = {}
+  for i, char in enumerate(a):
+    positions[char] = positions.get(char, 0) | 1 << i
+  mask = (1 << len(a)) - 1
+  last = 1 << (len(a) - 1)
+  plus, minus, distance = mask, 0, len(a)
+  for char in b:
+    equal = positions.get(char, 0)
+    vertical = equal | minus
+    horizontal = (((equal & plus) + plus) ^ plus) | equal
+    horizontal_plus = minus | (~(horizontal | plus) & mask)
+    horizontal_minus = plus & horizontal
+    if horizontal_plus & last:
+      distance += 1
+    elif horizontal_minus & last:
+      distance -= 1
+    horizontal_plus = ((horizontal_plus << 1) | 1) & mask
+    horizontal_minus = (horizontal_minus << 1) & mask
+    plus = horizontal_minus | (~(vertical | horizontal_plus) & mask)
+    minus = horizontal_plus & vertical
+  return distance
+
+def gloss_terms(english):
+  return {term.lower() for term in TOKEN.findall(english or '')} - STOPWORDS
+
+def features(word):
+  # What a (id, kanji, romaji, english) row is compared on
+  return normalize(word[2]), gloss_terms(word[3])
+
+def similarity(features, other_features):
+  (romaji, terms), (other_romaji, other_terms) = features, other_features
+  longest = max(len(romaji), len(other_romaji)) or 1
+  gloss = len(terms & other_terms) / len(terms | other_terms) if terms | other_terms else 0.0
+  return ROMAJI_WEIGHT * (1 - edit_distance(romaji, other_romaji) / longest) + GLOSS_WEIGHT * gloss
+
+def acceptable(word, other):
+  # Another word with the same kanji or gloss would be a right answer too
+  return (other[0] != word[0] and other[1] != word[1]
+          and (other[3] or '').strip().lower() != (word[3] or '').strip().lower())
+
+def candidates(connection, word):
+  word_id, _, romaji, english = word
+  rows = connection.execute('''
+    SELECT * FROM (
+      SELECT id, kanji, romaji, english FROM words
+      WHERE (romaji, id) > (?, ?)
+      ORDER BY romaji, id LIMIT ?
+    )
+    UNION ALL
+    SELECT * FROM (
+      SELECT id, kanji, romaji, english FROM words
+      WHERE (romaji, id) < (?, ?)
+      ORDER BY romaji DESC, id DESC LIMIT ?
+    )
+  ''', (romaji, word_id, ROMAJI_NEIGHBOURS, romaji, word_id, ROMAJI_NEIGHBOURS)).fetchall()
+
+  terms = sorted(gloss_terms(english))
+  if terms:
+    # Words sharing a gloss term, in index order. They are scored below
+    # anyway, and ranking the matches of a common term by bm25 would cost
+    # more than all the rest of the lookup
+    query = 'english : (' + ' OR '.join(f'"{term}"' for term in terms) + ')'
+    rows += connection.execute('''
+      SELECT w.id, w.kanji, w.romaji, w.english
+      FROM words_fts f
+      JOIN words w ON w.id = f.rowid
+      WHERE words_fts MATCH ?
+      LIMIT ?
+    ''', (query, GLOSS_NEIGHBOURS)).fetchall()
+
+  unique = {tuple(row)[0]: tuple(row) for row in rows}
+  return [row for row in unique.values() if acceptable(word, row)]
+
+def nearest(connection, word):
+  # The DISTRACTOR_COUNT best (score, candidate row) pairs, best first
+  word_features = features(word)
+  scored = [(similarity(word_features, features(other)), other) for other in candidates(connection, word)]
+  scored.sort(key=lambda pair: (-pair[0], pair[1][0]))
+  return scored[:DISTRACTOR_COUNT]
+
+def offer(connection, word_id, distractor_id, score):
+  # Add a distractor to an existing list if it beats the worst one
+  connection.execute('''
+    INSERT OR REPLACE INTO word_distractors (word_id, distractor_id, score) VALUES (?, ?, ?)
+  ''', (word_id, distractor_id, score))
+  connection.execute('''
+    DELETE FROM word_distractors
+    WHERE word_id = ? AND distractor_id NOT IN (
+      SELECT distractor_id FROM word_distractors WHERE word_id = ?
+      ORDER BY score DESC, distractor_id LIMIT ?
+    )
+  ''', (word_id, word_id, DISTRACTOR_COUNT))
+
+def store(connection, word, best):
+  connection.executemany('''
+    INSERT OR REPLACE INTO word_distractors (word_id, distractor_id, score) VALUES (?, ?, ?)
+  ''', [(word[0], other[0], score) for score, other in best])
+
+def refresh(connection, full=False, chunk_size=REFRESH_CHUNK):
+  # Compute the lists of the words that have none yet (all words with
+  # full=True), and offer each new word to the lists of its candidates so
+  # that older words pick up better distractors from new vocabulary.
+  # Every chunk of words commits on its own; an interrupted run leaves the
+  # rest for the next one. Returns the number of words whose list was
+  # computed.
+  if full:
+    return rebuild(connection, chunk_size)
+  pending = [tuple(row) for row in connection.execute('''
+    SELECT w.id, w.kanji, w.romaji, w.english FROM words w
+    WHERE NOT EXISTS (SELECT 1 FROM word_distractors d WHERE d.word_id = w.id)
+  ''')]
+  new_ids = {word[0] for word in pending}
+
+  for start in range(0, len(pending), chunk_size):
+    with connection:
+      for word in pending[start:start + chunk_size]:
+        best = nearest(connection, word)
+        store(connection, word, best)
+        for score, other in best:
+          if other[0] not in new_ids:
+            offer(connection, other[0], word[0], score)
+  return len(pending)
+
+def rebuild(connection, chunk_size=REFRESH_CHUNK):
+  # Recompute every list in word id order. Old lists stay readable until
+  # their word's chunk replaces them, and the progress commits with each
+  # chunk: an unfinished rebuild is resumed instead of started over.
+  with connection:
+    last_word_id, started_at, finished_at = connection.execute(
+      'SELECT last_word_id, started_at, finished_at FROM distractor_rebuilds WHERE id = 1'
+    ).fetchone()
+    if started_at is None or finished_at is not None:
+      last_word_id = 0
+      connection.execute('''
+        UPDATE distractor_rebuilds SET last_word_id = 0, started_at = CURRENT_TIMESTAMP, finished_at = NULL
+        WHERE id = 1
+      ''')
+
+  count = 0
+  while True:
+    with connection:
+      words = [tuple(row) for row in connection.execute('''
+        SELECT id, kanji, romaji, english FROM words WHERE id > ? ORDER BY id LIMIT ?
+      ''', (last_word_id, chunk_size))]
+      if not words:
+        connection.execute('UPDATE distractor_rebuilds SET finished_at = CURRENT_TIMESTAMP WHERE id = 1')
+        return count
+      for word in words:
+        best = nearest(connection, word)
+        connection.execute('DELETE FROM word_distractors WHERE word_id = ?', (word[0],))
+        store(connection, word, best)
+      last_word_id = words[-1][0]
+      connection.execute('UPDATE distractor_rebuilds SET last_word_id = ? WHERE id = 1', (last_word_id,))
+    count += len(words)
+
+def distractors_for(connection, word_id, k):
+  # The k best stored distractors, or computed on the spot for a word whose
+  # list has not been built yet. Returns None for an unknown word.
+  rows = connection.execute('''
+    SELECT w.id, w.kanji, w.romaji, w.english
+    FROM word_distractors d
+    JOIN words w ON w.id = d.distractor_id
+    WHERE d.word_id = ?
+    ORDER BY d.score DESC, d.distractor_id
+    LIMIT ?
+  ''', (word_id, k)).fetchall()
+  if rows:
+    return rows
+  word = connection.execute('SELECT id, kanji, romaji, english FROM words WHERE id = ?', (word_id,)).fetchone()
+  if word is None:
+    return None
+  return [other for _, other in nearest(connection, tuple(word))[:k]]
@@ -0,0 +1,259 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from lib import stats
+
+logger = logging.getLogger(__name__)
+
+# Maintenance of the raw review history in short transactions, so that the
+# app keeps logging reviews in between:
+#
+# - archive() summarizes the sessions idle for longer than the retention
+#   period into per-word, per-day counts (word_review_days) and moves their
+#   review items to the archive database attached as `archive`.
+# - start_reset() clears the summary tables and records the last session
+#   and review ids; run_reset() then deletes everything up to them, one
+#   chunk per transaction. An interrupted reset resumes where it stopped.
+
+# Rows per transaction; a chunk holds the write lock for a few milliseconds
+CHUNK_ROWS = 2000
+
+# Sleep between the chunks of a background reset, so that writers waiting
+# on busy_timeout get the lock between two chunks
+CHUNK_PAUSE_SECONDS = 0.01
+
+ARCHIVE_SCHEMA = [
+  '''
+  CREATE TABLE IF NOT EXISTS archive.word_review_items (
+    id INTEGER PRIMARY KEY,
+    word_id INTEGER NOT NULL,
+    study_session_id INTEGER NOT NULL,
+    correct BOOLEAN NOT NULL,
+    created_at DATETIME
+  )
+  ''',
+  'CREATE INDEX IF NOT EXISTS archive.idx_word_review_items_study_session_id ON word_review_items(study_session_id)',
+]
+
+def attach_archive(connection, path, readonly=False):
+  # Attach the archive database as `archive`, creating it and its table
+  # unless the connection is read-only. Returns whether it is attached.
+  if readonly:
+    if not os.path.exists(path):
+      return False
+    connection.execute('ATTACH DATABASE ? AS archive', (Path(path).resolve().as_uri() + '?mode=ro',))
+    return True
+  connection.execute('ATTACH DATABASE ? AS archive', (path,))
+  for sql in ARCHIVE_SCHEMA:
+    connection.execute(sql)
+  return True
+
+def archive_attached(connection):
+  return any(row[1] == 'archive' for row in connection.execute('PRAGMA database_list'))
+
+def interrupted(deadline, stop):
+  # deadline is a time.monotonic() value, stop a threading.Event
+  return (deadline is not None and time.monotonic() >= deadline) or (stop is not None and stop.is_set())
+
+def archive(connection, days, chunk_rows=CHUNK_ROWS, now=None, deadline=None, stop=None):
+  # Archive the sessions without activity for more than `days`. Stops at
+  # the deadline or when stop is set; the next run continues from there.
+  # Returns the archived sessions and review items, and whether every
+  # session due has been archived.
+  if not archive_attached(connection):
+    raise ValueError('No archive database attached')
+  if reset_status(connection)['pending']:
+    raise ValueError('A history reset is in progress')
+  cutoff = ((now or datetime.now(timezone.utc)) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+  result = {'sessions': 0, 'reviews': 0, 'finished': False}
+
+  while not interrupted(deadline, stop):
+    session_ids = json.dumps([row[0] for row in connection.execute('''
+      SELECT id FROM study_sessions
+      WHERE archived_at IS NULL AND COALESCE(last_activity_at, created_at) < ?
+      ORDER BY id
+      LIMIT ?
+    ''', (cutoff, chunk_rows))])
+    if session_ids == '[]':
+      result['finished'] = True
+      break
+    review_ids = json.dumps([row[0] for row in connection.execute('''
+      SELECT id FROM main.word_review_items
+      WHERE study_session_id IN (SELECT value FROM json_each(?))
+      LIMIT ?
+    ''', (session_ids, chunk_rows))])
+
+    # The copy commits on its own: the archive is another file, and a
+    # transaction over two WAL databases is not atomic across them. Rows
+    # copied by an interrupted run are still in main and copied again.
+    with connection:
+      connection.execute('''
+        INSERT OR REPLACE INTO archive.word_review_items (id, word_id, study_session_id, correct, created_at)
+        SELECT id, word_id, study_session_id, correct, created_at
+        FROM main.word_review_items
+        WHERE id IN (SELECT value FROM json_each(?))
+      ''', (review_ids,))
+    with connection:
+      connection.execute('''
+        INSERT INTO word_review_days (word_id, date, correct, wrong)
+        SELECT word_id, date(created_at, 'localtime'), SUM(correct = 1), SUM(correct = 0)
+        FROM main.word_review_items
+        WHERE id IN (SELECT value FROM json_each(?))
+        GROUP BY 1, 2
+        ON CONFLICT(word_id, date) DO UPDATE SET
+          correct = correct + excluded.correct,
+          wrong = wrong + excluded.wrong
+      ''', (review_ids,))
+      result['reviews'] += connection.execute('''
+        DELETE FROM main.word_review_items WHERE id IN (SELECT value FROM json_each(?))
+      ''', (review_ids,)).rowcount
+      # A session is archived once its last review item has moved
+      result['sessions'] += connection.execute('''
+        UPDATE study_sessions SET archived_at = CURRENT_TIMESTAMP
+        WHERE id IN (SELECT value FROM json_each(?))
+          AND NOT EXISTS (SELECT 1 FROM main.word_review_items WHERE study_session_id = study_sessions.id)
+      ''', (session_ids,)).rowcount
+  return result
+
+def reset_status(connection):
+  row = connection.execute('''
+    SELECT session_id, review_id, started_at, finished_at FROM history_resets WHERE id = 1
+  ''').fetchone()
+  return {
+    'pending': row[2] is not None and row[3] is None,
+    'session_id': row[0],
+    'review_id': row[1],
+    'started_at': row[2],
+    'finished_at': row[3]
+  }
+
+def start_reset(connection):
+  # One transaction: from here on the dashboard is empty, and reviews
+  # logged while the old history is deleted are counted afresh. Calling it
+  # during a reset extends that reset to the newer rows.
+  with connection:
+    connection.execute('''
+      UPDATE history_resets SET
+        session_id = (SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'study_sessions'),
+        review_id = (SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'word_review_items'),
+        started_at = CURRENT_TIMESTAMP,
+        finished_at = NULL
+      WHERE id = 1
+    ''')
+    stats.reset(connection.cursor())
+
+# Deleted in this order: sessions first, so that they leave the listings
+# early, then their review items, the archived ones and the archived counts
+RESET_STEPS = [
+  ('main', '''
+    DELETE FROM study_sessions WHERE id IN (
+      SELECT id FROM study_sessions WHERE id <= :session_id LIMIT :rows
+    )
+  '''),
+  ('main', '''
+    DELETE FROM main.word_review_items WHERE id IN (
+      SELECT id FROM main.word_review_items WHERE id <= :review_id LIMIT :rows
+    )
+  '''),
+  ('archive', '''
+    DELETE FROM archive.word_review_items WHERE id IN (
+      SELECT id FROM archive.word_review_items WHERE id <= :review_id LIMIT :rows
+    )
+  '''),
+  ('main', '''
+    DELETE FROM word_review_days WHERE (word_id, date) IN (
+      SELECT word_id, date FROM word_review_days LIMIT :rows
+    )
+  '''),
+]
+
+def reset_step(connection, chunk_rows=CHUNK_ROWS):
+  # Delete one chunk. Returns the rows deleted, 0 once nothing is left, in
+  # which case the reset is marked finished.
+  status = reset_status(connection)
+  if not status['pending']:
+    return 0
+  params = {'session_id': status['session_id'], 'review_id': status['review_id'], 'rows': chunk_rows}
+  attached = archive_attached(connection)
+  with connection:
+    for database, sql in RESET_STEPS:
+      if database == 'archive' and not attached:
+        continue
+      deleted = connection.execute(sql, params).rowcount
+      if deleted:
+        return deleted
+    connection.execute('UPDATE history_resets SET finished_at = CURRENT_TIMESTAMP WHERE id = 1')
+  return 0
+
+def run_reset(connection, chunk_rows=CHUNK_ROWS, deadline=None, stop=None, pause=0):
+  # Delete chunks until the reset has finished (returns True) or until the
+  # deadline or stop (returns False)
+  while not interrupted(deadline, stop):
+    if not reset_step(connection, chunk_rows):
+      return True
+    if pause:
+      time.sleep(pause)
+  return False
+
+class BackgroundReset:
+  # Finishes the resets that a request could not complete within its
+  # budget, one database (the main one or a learner shard) after the other,
+  # on connections of its own
+  def __init__(self, db, chunk_rows=CHUNK_ROWS, on_finish=None):
+    self.db = db
+    self.chunk_rows = chunk_rows
+    self.on_finish = on_finish
+    self._thread = None
+    self._pending = []
+    self._stop = threading.Event()
+    self._lock = threading.Lock()
+
+  def start(self, shard=None):
+    with self._lock:
+      if shard not in self._pending:
+        self._pending.append(shard)
+      if self._thread is not None:
+        return
+      self._stop.clear()
+      self._thread = threading.Thread(target=self._run, name='history-reset', daemon=True)
+      self._thread.start()
+
+  def running(self):
+    return self._thread is not None and self._thread.is_alive()
+
+  def _next(self):
+    # The thread only ends under the lock, so start() never queues a shard
+    # that nobody picks up
+    with self._lock:
+      if not self._pending or self._stop.is_set():
+        self._thread = None
+        return None, False
+      return self._pending.pop(0), True
+
+  def _run(self):
+    while True:
+      shard, more = self._next()
+      if not more:
+        return
+      connection = None
+      try:
+        connection = self.db.connect(shard=shard)
+        if run_reset(connection, self.chunk_rows, stop=self._stop, pause=CHUNK_PAUSE_SECONDS) and self.on_finish:
+          self.on_finish()
+      except Exception:
+        logger.exception('History reset failed; it resumes with the next reset')
+      finally:
+        if connection is not None:
+          connection.close()
+
+  def close(self, timeout=None):
+    # Stop after the current chunk; the resets stay pending
+    self._stop.set()
+    thread = self._thread
+    if thread is not None:
+      thread.join(timeout)
@@ -0,0 +1,249 @@
+import csv
+import json
+import os
+import re
+import time
+
+# Streaming bulk importer for word lists. Records are read incrementally
+# (JSON array, NDJSON or CSV), deduplicated on (kanji, romaji) against the
+# file and the existing vocabulary, and inserted in executemany batches
+# inside a single transaction. Once an import has read DEFER_INDEXES_AFTER
+# records the secondary indexes of words and word_groups are dropped until
+# the end; below that, rebuilding them over the whole table would cost more
+# than maintaining them row by row. The full-text index is filled in one
+# statement at the end too, instead of by its per-row trigger.
+#
+# An import runs in a transaction of its own, or in a savepoint of the
+# caller's open transaction, which the caller then commits.
+
+DEFAULT_BATCH_SIZE = 1000
+DEFER_INDEXES_AFTER = 10000
+INDEXED_TABLES = ('words', 'word_groups')
+FTS_INSERT_TRIGGER = 'words_fts_insert'
+
+def detect_format(path):
+  extension = os.path.splitext(path)[1].lower()
+  if extension in ('.ndjson', '.jsonl'):
+    return 'ndjson'
+  if extension == '.csv':
+    return 'csv'
+  return 'json'
+
+def iter_json_array(file, chunk_size=65536):
+  # Yield the elements of a top-level JSON array without loading the file
+  decoder = json.JSONDecoder()
+  buffer, position, eof, started = '', 0, False, False
+  while True:
+    # Skip whitespace and separators, reading more input when needed
+    while True:
+      while position < len(buffer) and buffer[position] in ' \t\r\n,':
+        position += 1
+      if position < len(buffer) or eof:
+        break
+      chunk = file.read(chunk_size)
+      if chunk:
+        buffer, position = buffer[position:] + chunk, 0
+      else:
+        eof = True
+    if position >= len(buffer):
+      if started:
+        raise ValueError('Unterminated JSON array')
+      return
+    if not started:
+      if buffer[position] != '[':
+        raise ValueError('Expected a JSON array of words')
+      started, position = True, position + 1
+      continue
+    if buffer[position] == ']':
+      return
+    try:
+      value, position = decoder.raw_decode(buffer, position)
+    except json.JSONDecodeError:
+      # Most likely the element continues in the next chunk
+      if eof:
+        raise
+      chunk = file.read(chunk_size)
+      if not chunk:
+        eof = True
+      buffer, position = buffer[position:] + chunk, 0
+      continue
+    yield value
+
+def iter_records(path, format=None):
+  format = format or detect_format(path)
+  with open(path, 'r', encoding='utf-8', newline='' if format == 'csv' else None) as file:
+    if format == 'ndjson':
+      for line in file:
+        if line.strip():
+          yield json.loads(line)
+    elif format == 'csv':
+      # Columns: kanji, romaji, english, parts (JSON, optional), groups ('|' separated, optional)
+      for row in csv.DictReader(file):
+        row['parts'] = json.loads(row['parts']) if row.get('parts') else []
+        row['groups'] = [name for name in (row.get('groups') or '').split('|') if name]
+        yield row
+    elif format == 'json':
+      yield from iter_json_array(file)
+    else:
+      raise ValueError(f'Unknown format: {format}')
+
+def defer_indexes(connection, tables=INDEXED_TABLES):
+  # Drop the explicit secondary indexes and return their DDL for restoring
+  rows = connection.execute(f'''
+    SELECT name, sql FROM sqlite_master
+    WHERE type = 'index' AND sql IS NOT NULL
+      AND tbl_name IN ({','.join('?' * len(tables))})
+  ''', tuple(tables)).fetchall()
+  for name, _ in rows:
+    connection.execute(f'DROP INDEX "{name}"')
+  return [sql for _, sql in rows]
+
+def restore_indexes(connection, statements):
+  # Recreate indexes dropped by defer_indexes. Indexes that are already back
+  # (a rollback restores them too) are left alone.
+  for sql in statements:
+    connection.execute(re.sub(r'^CREATE (UNIQUE )?INDEX ', r'CREATE \1INDEX IF NOT EXISTS ', sql))
+
+def defer_fts(connection):
+  # Drop the trigger that indexes new words for search one row at a time and
+  # return its DDL, or None when the database has no full-text index
+  row = connection.execute(
+    "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (FTS_INSERT_TRIGGER,)
+  ).fetchone()
+  if row is None:
+    return None
+  connection.execute(f'DROP TRIGGER "{FTS_INSERT_TRIGGER}"')
+  return row[0]
+
+class WordImporter:
+  def __init__(self, connection, group_names=(), batch_size=DEFAULT_BATCH_SIZE, defer=True,
+               defer_after=DEFER_INDEXES_AFTER):
+    self.connection = connection
+    self.batch_size = batch_size
+    self.defer = defer
+    self.defer_after = defer_after
+    self.group_names = list(group_names)
+    self.group_ids = {}
+    self.members = {}
+    self.numbered = False
+    self.known = {}
+    self.new_words = []
+    self.memberships = []
+    self.result = {'read': 0, 'inserted': 0, 'duplicates': 0, 'memberships': 0, 'seconds': 0.0}
+
+  def group_id(self, name):
+    if name not in self.group_ids:
+      row = self.connection.execute('SELECT id FROM groups WHERE name = ?', (name,)).fetchone()
+      if row:
+        group_id = row[0]
+      else:
+        group_id = self.connection.execute('INSERT INTO groups (name) VALUES (?)', (name,)).lastrowid
+      self.group_ids[name] = group_id
+      # Existing members, so re-imports do not duplicate memberships
+      self.members[group_id] = {
+        row[0] for row in self.connection.execute('SELECT word_id FROM word_groups WHERE group_id = ?', (group_id,))
+      }
+    return self.group_ids[name]
+
+  def attach(self, key, group_ids):
+    self.memberships.extend((key, group_id) for group_id in group_ids)
+
+  def add(self, record):
+    self.result['read'] += 1
+    try:
+      key = (record['kanji'], record['romaji'])
+      english = record['english']
+    except (KeyError, TypeError):
+      raise ValueError(f"Record {self.result['read']} needs kanji, romaji and english")
+    groups = record.get('groups') or []
+    if not isinstance(groups, list):
+      raise ValueError(f"Record {self.result['read']}: groups must be a list of group names")
+    group_ids = [self.group_id(name) for name in self.group_names + groups]
+    if key in self.known:
+      self.result['duplicates'] += 1
+    else:
+      self.known[key] = None  # id assigned once the batch is written
+      self.new_words.append((key[0], key[1], english, json.dumps(record.get('parts') or [])))
+    self.attach(key, group_ids)
+    if len(self.new_words) >= self.batch_size or len(self.memberships) >= self.batch_size * 4:
+      self.write_batch()
+
+  def write_batch(self):
+    if self.new_words:
+      last_id = self.connection.execute('SELECT COALESCE(MAX(id), 0) FROM words').fetchone()[0]
+      self.connection.executemany('INSERT INTO words (kanji, romaji, english, parts) VALUES (?, ?, ?, ?)', self.new_words)
+      # Map the new rows back to their ids with a rowid range scan
+      for word_id, kanji, romaji in self.connection.execute('SELECT id, kanji, romaji FROM words WHERE id > ?', (last_id,)):
+        self.known[(kanji, romaji)] = word_id
+      self.result['inserted'] += len(self.new_words)
+      self.new_words = []
+
+    # New members are numbered after the group's existing 1..n positions
+    # (migration 013), which the per-row trigger would look up one by one
+    rows = []
+    for key, group_id in self.memberships:
+      word_id = self.known[key]
+      if word_id not in self.members[group_id]:
+        self.members[group_id].add(word_id)
+        rows.append((word_id, group_id, len(self.members[group_id])))
+    if self.numbered:
+      self.connection.executemany('INSERT INTO word_groups (word_id, group_id, position) VALUES (?, ?, ?)', rows)
+    else:
+      self.connection.executemany('INSERT INTO word_groups (word_id, group_id) VALUES (?, ?)', [row[:2] for row in rows])
+    self.result['memberships'] += len(rows)
+    self.memberships = []
+
+  def run(self, records):
+    started = time.perf_counter()
+    connection = self.connection
+    outer = not connection.in_transaction
+    connection.execute('BEGIN IMMEDIATE' if outer else 'SAVEPOINT word_import')
+    try:
+      self.known = {(row[1], row[2]): row[0] for row in connection.execute('SELECT id, kanji, romaji FROM words')}
+      for name in self.group_names:
+        self.group_id(name)
+      first_id = connection.execute('SELECT COALESCE(MAX(id), 0) FROM words').fetchone()[0]
+      # The seed import runs before the migrations that add word_groups.position
+      self.numbered = any(row[1] == 'position' for row in connection.execute('PRAGMA table_info(word_groups)'))
+      fts_trigger = defer_fts(connection) if self.defer else None
+
+      deferred = []
+      try:
+        for record in records:
+          self.add(record)
+          if self.defer and not deferred and self.result['read'] >= self.defer_after:
+            deferred = defer_indexes(connection)
+        self.write_batch()
+      finally:
+        restore_indexes(connection, deferred)
+
+      if fts_trigger:
+        connection.execute('''
+          INSERT INTO words_fts (rowid, kanji, romaji, english)
+          SELECT id, kanji, romaji, english FROM words WHERE id > ?
+        ''', (first_id,))
+        connection.execute(fts_trigger)
+      # Refresh the counter cache once per touched group
+      connection.executemany('''
+        UPDATE groups SET words_count = (SELECT COUNT(*) FROM word_groups WHERE group_id = ?) WHERE id = ?
+      ''', [(group_id, group_id) for group_id in self.members])
+      if outer:
+        connection.commit()
+      else:
+        connection.execute('RELEASE word_import')
+    except Exception:
+      if outer:
+        connection.rollback()
+      else:
+        connection.execute('ROLLBACK TO word_import')
+        connection.execute('RELEASE word_import')
+      raise
+    self.result['seconds'] = time.perf_counter() - started
+    self.result['rows_per_sec'] = self.result['read'] / self.result['seconds'] if self.result['seconds'] else 0.0
+    self.result['group_ids'] = dict(self.group_ids)
+    return self.result
+
+def import_words(connection, path, group_names=(), format=None, batch_size=DEFAULT_BATCH_SIZE, defer=True,
+                 defer_after=DEFER_INDEXES_AFTER):
+  importer = WordImporter(connection, group_names, batch_size=batch_size, defer=defer, defer_after=defer_after)
+  return importer.run(iter_records(path, format))
@@ -0,0 +1,189 @@
+import json
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from lib.synthetic import zipf_weights
+
+# Mixed workload replayed against create_app() through the Flask test
+# client: dashboard loads, paginated listings, raw group fetches, due
+# queues and review posts, in proportion to their weights. The requests
+# are drawn up front from a seeded generator, so two runs against the same
+# database replay the same requests, and the latencies are reported per
+# route as percentiles that can be saved as a baseline and compared.
+
+# (weight, route, request factory). A factory takes the random generator
+# and the Targets and returns (method, url, json body).
+WORKLOAD = [
+  (8, 'GET /dashboard/stats', lambda rng, t: ('GET', '/dashboard/stats', None)),
+  (4, 'GET /dashboard/recent-session', lambda rng, t: ('GET', '/dashboard/recent-session', None)),
+  (2, 'GET /dashboard/heatmap', lambda rng, t: ('GET', '/dashboard/heatmap?days=365', None)),
+  (8, 'GET /words', lambda rng, t: ('GET', f'/words?page={t.page(rng, t.words, 50)}', None)),
+  (3, 'GET /words?sort_by=correct_count', lambda rng, t: (
+    'GET', f'/words?sort_by=correct_count&order=desc&page={t.page(rng, t.words, 50)}', None)),
+  (4, 'GET /groups', lambda rng, t: ('GET', f'/groups?page={t.page(rng, len(t.groups), 10)}', None)),
+  (6, 'GET /groups/<id>/words', lambda rng, t: (
+    'GET', '/groups/{0}/words?page={1}'.format(*t.group_page(rng, 10)), None)),
+  (2, 'GET /groups/<id>/study_sessions', lambda rng, t: ('GET', f'/groups/{t.group(rng)}/study_sessions', None)),
+  (5, 'GET /api/groups/<id>/words/raw', lambda rng, t: ('GET', f'/api/groups/{t.group(rng)}/words/raw', None)),
+  (4, 'GET /api/study-sessions', lambda rng, t: ('GET', f'/api/study-sessions?page={t.page(rng, t.sessions, 10)}', None)),
+  (3, 'GET /study_sessions/<id>/next', lambda rng, t: ('GET', f'/study_sessions/{t.session(rng)}/next?n=10', None)),
+  (8, 'POST /study_sessions/<id>/review', lambda rng, t: (
+    'POST', f'/study_sessions/{t.session(rng)}/review', {'word_id': t.word(rng), 'correct': rng.random() < 0.7})),
+  (2, 'POST /study_sessions/<id>/reviews', lambda rng, t: (
+    'POST', f'/study_sessions/{t.session(rng)}/reviews',
+    [{'word_id': t.word(rng), 'correct': rng.random() < 0.7} for _ in range(20)])),
+]
+
+# Regressions smaller than this many milliseconds are noise whatever the
+# relative change
+NOISE_FLOOR_MS = 0.5
+
+class Targets:
+  # What the requests point at: groups by size (larger groups are visited
+  # more often), the word id range and the sessions the reviews go to
+  def __init__(self, connection, sessions):
+    self.groups = [row[0] for row in connection.execute('''
+      SELECT id FROM groups WHERE words_count > 0 ORDER BY words_count DESC, id
+    ''')]
+    self.group_sizes = dict(connection.execute('SELECT id, words_count FROM groups'))
+    self.group_weights = zipf_weights(len(self.groups))
+    self.words = connection.execute('SELECT COUNT(*) FROM words').fetchone()[0]
+    self.word_ids = connection.execute('SELECT MIN(id), MAX(id) FROM words').fetchone()
+    self.sessions = connection.execute('SELECT COUNT(*) FROM study_sessions').fetchone()[0]
+    self.session_ids = sessions
+
+  def group(self, rng):
+    return rng.choices(self.groups, cum_weights=self.group_weights)[0]
+
+  def page(self, rng, rows, per_page):
+    # Mostly the first pages, sometimes deep ones
+    pages = max(1, -(-rows // per_page))
+    return min(pages, int(rng.paretovariate(1.2)))
+
+  def group_page(self, rng, per_page):
+    group_id = self.group(rng)
+    return group_id, self.page(rng, self.group_sizes[group_id], per_page)
+
+  def word(self, rng):
+    return rng.randint(*self.word_ids)
+
+  def session(self, rng):
+    return rng.choice(self.session_ids)
+
+def percentile(sorted_values, fraction):
+  # Nearest-rank percentile
+  if not sorted_values:
+    return None
+  rank = max(1, math.ceil(round(fraction * len(sorted_values), 9)))
+  return sorted_values[rank - 1]
+
+def plan(targets, requests, seed):
+  rng = random.Random(seed)
+  cumulative, total = [], 0
+  for weight, _, _ in WORKLOAD:
+    total += weight
+    cumulative.append(total)
+  planned = []
+  for _ in range(requests):
+    _, route, factory = rng.choices(WORKLOAD, cum_weights=cumulative)[0]
+    planned.append((route,) + factory(rng, targets))
+  return planned
+
+def run(app, requests=2000, threads=4, seed=1, review_sessions=8):
+  # Replay the workload and return the report: per route count, errors and
+  # p50/p95/p99/mean in milliseconds, plus the overall throughput
+  client = app.test_client()
+  connection = app.db.connect()
+  try:
+    activity_id = connection.execute('SELECT MIN(id) FROM study_activities').fetchone()[0]
+    group_ids = [row[0] for row in connection.execute('''
+      SELECT id FROM groups WHERE words_count > 0 ORDER BY words_count DESC, id LIMIT ?
+    ''', (review_sessions,))]
+  finally:
+    connection.close()
+  sessions = [
+    client.post('/study_sessions', json={'group_id': group_id, 'study_activity_id': activity_id}).get_json()['session_id']
+    for group_id in group_ids
+  ]
+  connection = app.db.connect()
+  try:
+    targets = Targets(connection, sessions)
+  finally:
+    connection.close()
+
+  planned = plan(targets, requests, seed)
+  timings = {}
+  errors = {}
+
+  def worker(share):
+    client = app.test_client()
+    results = []
+    for route, method, url, body in share:
+      started = time.perf_counter()
+      response = client.open(url, method=method, json=body)
+      response.get_data()
+      results.append((route, time.perf_counter() - started, response.status_code >= 400))
+    return results
+
+  started = time.perf_counter()
+  with ThreadPoolExecutor(max_workers=threads) as pool:
+    shares = [planned[index::threads] for index in range(threads)]
+    for results in pool.map(worker, shares):
+      for route, seconds, failed in results:
+        timings.setdefault(route, []).append(seconds * 1000)
+        errors[route] = errors.get(route, 0) + failed
+  elapsed = time.perf_counter() - started
+
+  routes = {}
+  for route, values in sorted(timings.items()):
+    values.sort()
+    routes[route] = {
+      'count': len(values),
+      'errors': errors[route],
+      'p50': round(percentile(values, 0.50), 3),
+      'p95': round(percentile(values, 0.95), 3),
+      'p99': round(percentile(values, 0.99), 3),
+      'mean': round(sum(values) / len(values), 3),
+    }
+  return {
+    'config': {'requests': requests, 'threads': threads, 'seed': seed},
+    'data': {'words': targets.words, 'groups': len(targets.groups), 'sessions': targets.sessions},
+    'requests_per_second': round(requests / elapsed, 1),
+    'routes': routes,
+  }
+
+def format_report(report):
+  lines = [f"{'route':<40} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"]
+  for route, row in report['routes'].items():
+    lines.append(f"{route:<40} {row['count']:>6} {row['errors']:>6} {row['p50']:>9.2f} {row['p95']:>9.2f} {row['p99']:>9.2f}")
+  lines.append(f"{report['requests_per_second']} requests/s over {report['config']['requests']} requests")
+  return '\n'.join(lines)
+
+def compare(baseline, report, tolerance=0.2):
+  # Percentile changes per route against a saved report. Returns
+  # (lines, regressions): a regression is slower by more than the
+  # tolerance and by more than NOISE_FLOOR_MS.
+  lines, regressions = [], []
+  for route in sorted(set(baseline['routes']) | set(report['routes'])):
+    old, new = baseline['routes'].get(route), report['routes'].get(route)
+    if old is None or new is None:
+      lines.append(f"{route:<40} {'only in baseline' if new is None else 'new route'}")
+      continue
+    for name in ('p50', 'p95', 'p99'):
+      change = (new[name] - old[name]) / old[name] if old[name] else 0.0
+      regressed = change > tolerance and new[name] - old[name] > NOISE_FLOOR_MS
+      lines.append(f"{route:<40} {name} {old[name]:>9.2f} -> {new[name]:>9.2f} ms {change:+7.0%}{'  REGRESSION' if regressed else ''}")
+      if regressed:
+        regressions.append((route, name, old[name], new[name]))
+  return lines, regressions
+
+def save(report, path):
+  with open(path, 'w', encoding='utf-8') as file:
+    json.dump(report, file, indent=2, sort_keys=True)
+    file.write('\n')
+
+def load(path):
+  with open(path, encoding='utf-8') as file:
+    return json.load(file)
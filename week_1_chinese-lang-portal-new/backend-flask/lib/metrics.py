@@ -0,0 +1,244 @@
+import bisect
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from lib.query_plans import explain
+
+# Per-request SQL accounting and route metrics. Connections opened by Db
+# hand out InstrumentedCursors, which time every statement together with
+# its fetches and count the rows it returned into the QueryStats of the
+# current request. At the end of the request the totals go into the
+# process-wide Metrics, rendered for Prometheus on GET /metrics, and the
+# statements slower than the threshold are logged with their query plan.
+
+slow_query_logger = logging.getLogger('portal.slow_queries')
+
+# Upper bounds of the route latency histogram, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Statements taking longer than this (execution and fetches) are logged
+DEFAULT_SLOW_QUERY_MS = 100
+
+# String and number literals, replaced by ? when normalizing a statement
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+def normalize(sql):
+  # One line with the literals replaced, so that statements group together
+  return ' '.join(LITERAL.sub('?', sql).split())
+
+def is_lock_error(error):
+  # busy_timeout waits for the lock inside SQLite; only the waits that run
+  # out surface here
+  message = str(error)
+  return 'locked' in message or 'busy' in message
+
+class QueryStats:
+  # The SQL work of one request
+  def __init__(self, slow_seconds):
+    self.slow_seconds = slow_seconds
+    self.queries = 0
+    self.seconds = 0.0
+    self.rows = 0
+    self.lock_timeouts = 0
+    self.slow = []
+    self._cursors = []
+
+  def finish(self):
+    # Close the books on statements whose cursors are still open
+    for cursor in self._cursors:
+      cursor.finish()
+    self._cursors = []
+
+  def server_timing(self):
+    return f'sql;dur={self.seconds * 1000:.2f};desc="{self.queries} queries, {self.rows} rows"'
+
+class InstrumentedCursor(sqlite3.Cursor):
+  def __init__(self, connection):
+    super().__init__(connection)
+    self.stats = connection.stats
+    # [sql, params, seconds] of the statement being read
+    self.statement = None
+    if self.stats is not None:
+      self.stats._cursors.append(self)
+
+  def finish(self):
+    statement, self.statement = self.statement, None
+    if statement is not None and statement[2] >= self.stats.slow_seconds:
+      self.stats.slow.append(statement)
+
+  def _run(self, method, sql, params, many=False):
+    stats = self.stats
+    if stats is None:
+      return method(sql, params)
+    self.finish()
+    started = time.perf_counter()
+    try:
+      return method(sql, params)
+    except sqlite3.OperationalError as e:
+      if is_lock_error(e):
+        stats.lock_timeouts += 1
+      raise
+    finally:
+      elapsed = time.perf_counter() - started
+      stats.queries += 1
+      stats.seconds += elapsed
+      # The parameters of executemany may be a generator; the plan of the
+      # statement is explained without them
+      self.statement = [sql, None if many else params, elapsed]
+
+  def _fetch(self, method, *args):
+    started = time.perf_counter()
+    try:
+      return method(*args)
+    finally:
+      if self.stats is not None:
+        elapsed = time.perf_counter() - started
+        self.stats.seconds += elapsed
+        if self.statement is not None:
+          self.statement[2] += elapsed
+
+  def execute(self, sql, parameters=()):
+    return self._run(super().execute, sql, parameters)
+
+  def executemany(self, sql, seq_of_parameters):
+    return self._run(super().executemany, sql, seq_of_parameters, many=True)
+
+  def fetchone(self):
+    row = self._fetch(super().fetchone)
+    if self.stats is not None:
+      if row is None:
+        self.finish()
+      else:
+        self.stats.rows += 1
+    return row
+
+  def fetchmany(self, size=None):
+    rows = self._fetch(super().fetchmany, self.arraysize if size is None else size)
+    if self.stats is not None:
+      self.stats.rows += len(rows)
+      if not rows:
+        self.finish()
+    return rows
+
+  def fetchall(self):
+    rows = self._fetch(super().fetchall)
+    if self.stats is not None:
+      self.stats.rows += len(rows)
+      self.finish()
+    return rows
+
+  def __next__(self):
+    if self.stats is None:
+      return super().__next__()
+    try:
+      row = self._fetch(super().__next__)
+    except StopIteration:
+      self.finish()
+      raise
+    self.stats.rows += 1
+    return row
+
+class InstrumentedConnection(sqlite3.Connection):
+  # The QueryStats of the request using the connection, set by Db.get()
+  stats = None
+
+  def cursor(self, factory=InstrumentedCursor):
+    return super().cursor(factory)
+
+  # Connection.execute() would create a plain cursor
+  def execute(self, sql, parameters=()):
+    return self.cursor().execute(sql, parameters)
+
+  def executemany(self, sql, seq_of_parameters):
+    return self.cursor().executemany(sql, seq_of_parameters)
+
+def label_string(labels):
+  escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+  return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+class Metrics:
+  # Process-wide request and SQL metrics. Every worker process keeps its
+  # own; Prometheus sums them over the scraped instances.
+  def __init__(self, slow_query_ms=DEFAULT_SLOW_QUERY_MS, buckets=LATENCY_BUCKETS):
+    self.slow_seconds = slow_query_ms / 1000
+    self.buckets = buckets
+    self._lock = threading.Lock()
+    self._requests = defaultdict(int)
+    # (route, method) -> per-bucket counts (the last one is +Inf), sum
+    self._latency = {}
+    # route -> [queries, seconds, rows, lock timeouts, slow queries]
+    self._sql = defaultdict(lambda: [0, 0.0, 0, 0, 0])
+
+  def record_request(self, route, method, status, seconds, stats):
+    with self._lock:
+      self._requests[(route, method, str(status))] += 1
+      latency = self._latency.setdefault((route, method), [[0] * (len(self.buckets) + 1), 0.0])
+      latency[0][bisect.bisect_left(self.buckets, seconds)] += 1
+      latency[1] += seconds
+      sql = self._sql[route]
+      sql[0] += stats.queries
+      sql[1] += stats.seconds
+      sql[2] += stats.rows
+      sql[3] += stats.lock_timeouts
+      sql[4] += len(stats.slow)
+
+  def log_slow_queries(self, connection, route, stats):
+    # Explain the slow statements on the connection that ran them
+    for sql, params, seconds in stats.slow:
+      if params is None:
+        params = (None,) * sql.count('?')
+      try:
+        plan = explain(connection, sql, params)
+      except sqlite3.Error as e:
+        plan = [f'EXPLAIN failed: {e}']
+      slow_query_logger.warning(json.dumps({
+        'route': route,
+        'ms': round(seconds * 1000, 2),
+        'sql': normalize(sql),
+        'plan': plan
+      }, ensure_ascii=False))
+
+  def render(self):
+    # Prometheus text exposition format, version 0.0.4
+    with self._lock:
+      requests = dict(self._requests)
+      latency = {key: (list(counts), total) for key, (counts, total) in self._latency.items()}
+      sql = {route: list(values) for route, values in self._sql.items()}
+
+    lines = [
+      '# HELP portal_requests_total Requests served, by route, method and status.',
+      '# TYPE portal_requests_total counter',
+    ]
+    for (route, method, status), count in sorted(requests.items()):
+      lines.append(f'portal_requests_total{label_string({"route": route, "method": method, "status": status})} {count}')
+
+    lines += [
+      '# HELP portal_request_duration_seconds Time to serve a request, by route and method.',
+      '# TYPE portal_request_duration_seconds histogram',
+    ]
+    for (route, method), (counts, total) in sorted(latency.items()):
+      cumulative = 0
+      for bound, count in zip(self.buckets + ('+Inf',), counts):
+        cumulative += count
+        labels = label_string({'route': route, 'method': method, 'le': bound})
+        lines.append(f'portal_request_duration_seconds_bucket{labels} {cumulative}')
+      labels = label_string({'route': route, 'method': method})
+      lines.append(f'portal_request_duration_seconds_sum{labels} {total}')
+      lines.append(f'portal_request_duration_seconds_count{labels} {cumulative}')
+
+    for index, (name, kind, description) in enumerate([
+      ('portal_sql_queries_total', 'counter', 'SQL statements executed, by route.'),
+      ('portal_sql_seconds_total', 'counter', 'Time spent executing SQL and fetching rows, by route.'),
+      ('portal_sql_rows_total', 'counter', 'Rows returned by SQL statements, by route.'),
+      ('portal_sqlite_lock_timeouts_total', 'counter', 'Statements that gave up waiting for an SQLite lock, by route.'),
+      ('portal_slow_queries_total', 'counter', 'Statements slower than the slow query threshold, by route.'),
+    ]):
+      lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+      for route, values in sorted(sql.items()):
+        lines.append(f'{name}{label_string({"route": route})} {values[index]}')
+    return '\n'.join(lines) + '\n'
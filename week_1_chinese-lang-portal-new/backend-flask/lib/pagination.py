@@ -0,0 +1,45 @@
+import base64
+import json
+
+# Keyset pagination helpers. A cursor is an opaque token holding the sort key
+# and id of the last row of the previous page, so the next page can start with
+# an index range scan instead of skipping OFFSET rows.
+
+def encode_cursor(sort_value, row_id):
+  payload = json.dumps([sort_value, row_id], separators=(',', ':'))
+  return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+  # An empty cursor asks for the first page
+  if not token:
+    return None
+  try:
+    padded = token + '=' * (-len(token) % 4)
+    sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+  except Exception:
+    raise ValueError('Invalid cursor')
+  if not isinstance(row_id, int) or isinstance(sort_value, (list, dict)):
+    raise ValueError('Invalid cursor')
+  return sort_value, row_id
+
+# WHERE fragment and params that start a page right after the cursor row. The
+# leading bound on the sort key alone lets SQLite seek expression indexes too,
+# which it does not do for the row value comparison
+def keyset_condition(sort_expr, id_expr, order, cursor):
+  if cursor is None:
+    return '1 = 1', ()
+  operator = '<' if order == 'desc' else '>'
+  sort_value, row_id = cursor
+  return f'{sort_expr} {operator}= ? AND ({sort_expr}, {id_expr}) {operator} (?, ?)', (sort_value, sort_value, row_id)
+
+# Pages are fetched with one look-ahead row; trim it and build the cursor for
+# the following page if it was there
+def next_cursor(rows, per_page, sort_key, id_key='id'):
+  if len(rows) <= per_page:
+    return rows, None
+  rows = rows[:per_page]
+  last = rows[-1]
+  return rows, encode_cursor(last[sort_key], last[id_key])
+
+def wants_total(args):
+  return args.get('include_total', 'false').lower() in ('1', 'true', 'yes')
@@ -0,0 +1,142 @@
+import re
+
+# Requests that exercise every SQL statement the portal routes issue. The
+# placeholders are filled in once a study session has been created.
+ROUTE_PROBES = [
+  ('POST', '/study_sessions', {'group_id': 1, 'study_activity_id': 1}),
+  ('POST', '/study_sessions/{session_id}/review', {'word_id': 1, 'correct': True}),
+  ('POST', '/study_sessions/{session_id}/review', {'word_id': 1, 'correct': False}),
+  ('POST', '/study_sessions/{session_id}/reviews', [{'word_id': 2, 'correct': True}, {'word_id': 3, 'correct': False}]),
+  ('GET', '/words', None),
+  ('GET', '/words?sort_by=romaji&order=desc&page=2', None),
+  ('GET', '/words?sort_by=correct_count&cursor=', None),
+  ('GET', '/words?sort_by=accuracy&order=desc&cursor=', None),
+  ('GET', '/words?sort_by=last_reviewed&page=2', None),
+  ('GET', '/words/1', None),
+  ('GET', '/words?ids=3,1,2', None),
+  ('POST', '/words/lookup', {'ids': [61, 1]}),
+  ('GET', '/words/1/distractors?k=4', None),
+  ('GET', '/words/search?q=tabe', None),
+  ('GET', '/words/search?q=eat&group_id=1', None),
+  ('GET', '/words/autocomplete?prefix=ta', None),
+  ('GET', '/groups', None),
+  ('GET', '/groups?sort_by=words_count&order=desc', None),
+  ('GET', '/groups/1', None),
+  ('GET', '/groups/1/words', None),
+  ('GET', '/groups/1/words?sort_by=english&cursor=', None),
+  ('GET', '/groups/1/words?sort_by=wrong_count&order=desc', None),
+  ('GET', '/api/groups/1/words/raw', None),
+  ('GET', '/groups/1/words/sample?n=5', None),
+  ('GET', '/groups/1/study_sessions', None),
+  ('GET', '/groups/1/study_sessions?sort_by=endTime', None),
+  ('GET', '/api/study-activities', None),
+  ('GET', '/api/study-activities/1', None),
+  ('GET', '/api/study-activities/1/sessions', None),
+  ('GET', '/api/study-activities/1/launch', None),
+  ('GET', '/api/study-sessions', None),
+  ('GET', '/api/study-sessions?cursor=', None),
+  ('GET', '/api/study-sessions/{session_id}', None),
+  ('GET', '/api/study-sessions/reset', None),
+  ('GET', '/study_sessions/{session_id}/next?n=5', None),
+  ('GET', '/study_sessions/{session_id}/words?limit=5', None),
+  ('POST', '/study_sessions', {'study_activity_id': 1, 'word_set': {'intersect': [{'group': 1}, {'state': 'wrong'}]}}),
+  ('GET', '/study_sessions/{session_id}/next?n=5', None),
+  ('GET', '/dashboard/recent-session', None),
+  ('GET', '/dashboard/stats', None),
+  ('GET', '/dashboard/heatmap?days=365', None),
+  # Full exports read whole tables by design; the incremental ones must not
+  ('GET', '/export/words.ndjson?since=2000-01-01', None),
+  ('GET', '/export/reviews.ndjson?since=2000-01-01', None),
+  ('GET', '/export/reviews.ndjson?after_id=1', None),
+]
+
+# Tables that only hold a handful of configuration rows (sqlite_sequence has
+# one per AUTOINCREMENT table); reading all of them is cheaper than any index
+SMALL_TABLES = {'study_activities', 'sqlite_sequence'}
+
+BARE_SCAN = re.compile(r'^SCAN (\w+)$')
+
+# `FROM words w`, `JOIN word_groups AS wg`: plans name aliased tables by
+# their alias only
+TABLE_ALIAS = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+NOT_ALIASES = {
+  'where', 'on', 'using', 'join', 'left', 'right', 'inner', 'outer', 'cross', 'natural', 'full',
+  'group', 'order', 'limit', 'union', 'except', 'intersect', 'window', 'having', 'indexed', 'not'
+}
+
+def explain(connection, sql, params=()):
+  rows = connection.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+  return [row[3] for row in rows]
+
+def table_aliases(sql):
+  # alias -> names of the tables it stands for somewhere in the statement
+  aliases = {}
+  for table, alias in TABLE_ALIAS.findall(sql):
+    if alias and alias.lower() not in NOT_ALIASES:
+      aliases.setdefault(alias, set()).add(table)
+  return aliases
+
+def plan_problems(plan, tables, sql=''):
+  problems = []
+  aliases = table_aliases(sql)
+  for detail in plan:
+    scan = BARE_SCAN.match(detail)
+    # Scans of CTEs and subqueries read rows that are already materialized
+    scanned = ({scan.group(1)} | aliases.get(scan.group(1), set())) & tables if scan else set()
+    if scanned - SMALL_TABLES:
+      problems.append(detail)
+    elif 'AUTOMATIC' in detail:
+      # SQLite had to build a throwaway index because a real one is missing
+      problems.append(detail)
+  return problems
+
+def capture_route_queries(app, probes=ROUTE_PROBES):
+  # Run the probes with a trace callback on every connection the app opens
+  # and return the distinct (route, SELECT statement) pairs, with the
+  # statement parameters inlined
+  statements = []
+  current = {'route': None}
+
+  def trace(sql):
+    normalized = ' '.join(sql.split())
+    entry = (current['route'], normalized)
+    if normalized.upper().startswith(('SELECT', 'WITH')) and entry not in statements:
+      statements.append(entry)
+
+  connect = app.db.connect
+  def traced_connect(*args, **kwargs):
+    connection = connect(*args, **kwargs)
+    connection.set_trace_callback(trace)
+    return connection
+  app.db.connect = traced_connect
+
+  try:
+    client = app.test_client()
+    session_id = None
+    for method, url, body in probes:
+      current['route'] = url.split('?')[0]
+      response = client.open(url.format(session_id=session_id), method=method, json=body)
+      # Streamed bodies only run their queries while being read
+      response.get_data()
+      if response.status_code >= 400:
+        raise RuntimeError(f'{method} {url} returned {response.status_code}')
+      if url == '/study_sessions':
+        session_id = response.get_json()['session_id']
+  finally:
+    del app.db.connect
+  return statements
+
+def check_query_plans(app):
+  # Returns (route, sql, offending plan lines) for every route query that
+  # falls back to a full table scan
+  failures = []
+  connection = app.db.connect()
+  try:
+    tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for route, sql in capture_route_queries(app):
+      problems = plan_problems(explain(connection, sql), tables, sql)
+      if problems:
+        failures.append((route, sql, problems))
+  finally:
+    connection.close()
+  return failures
@@ -0,0 +1,274 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+
+from lib import reviews
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between two flush attempts while the writes keep failing
+MAX_BACKOFF_SECONDS = 30.0
+
+class BufferFull(Exception):
+  pass
+
+class ReviewBuffer:
+  # Write-behind buffer for POST /study_sessions/<id>/review.
+  #
+  # Reviews are appended to a bounded in-process queue and to an append-only
+  # spill file, and the request is acknowledged right away. A flusher thread
+  # drains the queue every flush_interval_ms (or as soon as flush_items are
+  # waiting) and writes everything it drained in one transaction.
+  #
+  # On every flush the spill file is rotated into a numbered segment that
+  # holds exactly the drained reviews. The segment name is recorded in
+  # review_buffer_segments in the same transaction as the reviews, so after
+  # a crash start() can replay the segments that never made it and skip the
+  # ones that did.
+  #
+  # Segments that fail to write stay pending and are retried, with a
+  # growing delay, ahead of newer ones. Their reviews count against
+  # max_items, so a database that keeps failing turns into 503s rather than
+  # an unbounded backlog.
+
+  def __init__(self, db, spill_path, flush_interval_ms=200, flush_items=500,
+               max_items=10000, fsync=False, on_flush=None):
+    self.db = db
+    self.spill_path = spill_path
+    self.flush_interval = flush_interval_ms / 1000.0
+    self.flush_items = flush_items
+    self.max_items = max_items
+    self.fsync = fsync
+    self.on_flush = on_flush
+
+    self._queue = deque()
+    self._lock = threading.Lock()
+    # Held for a whole drain cycle: flush() is called by the flusher thread,
+    # by close() and by callers draining on demand, and they share one
+    # connection
+    self._flush_lock = threading.Lock()
+    self._wakeup = threading.Event()
+    self._stopping = False
+    self._thread = None
+    self._spill = None
+    self._segment_counter = 0
+    self._connection = None
+    # Segments that failed to flush and are retried on the next cycle
+    self._pending = []
+    self._pending_items = 0
+    # Failed flush cycles in a row, for the retry backoff
+    self._failures = 0
+    # Markers of segments whose files are gone; deleted with the next flush
+    self._stale_markers = []
+
+    self.stats = {
+      'submitted_total': 0,
+      'rejected_total': 0,
+      'flushed_total': 0,
+      'replayed_total': 0,
+      'flushes_total': 0,
+      'flush_errors_total': 0,
+      'flush_seconds_total': 0.0,
+      'last_flush_seconds': 0.0,
+      'max_flush_seconds': 0.0,
+    }
+
+  # -- lifecycle -----------------------------------------------------------
+
+  def start(self):
+    self.replay()
+    self._spill = open(self.spill_path, 'a', encoding='utf-8')
+    self._thread = threading.Thread(target=self._run, name='review-buffer-flusher', daemon=True)
+    self._thread.start()
+    return self
+
+  def close(self):
+    # Stop accepting reviews, drain whatever is queued and stop the thread
+    if self._thread is None:
+      return
+    with self._lock:
+      self._stopping = True
+    self._wakeup.set()
+    self._thread.join()
+    self._thread = None
+    self.flush()
+    if self._spill is not None:
+      self._spill.close()
+      self._spill = None
+      if os.path.exists(self.spill_path) and os.path.getsize(self.spill_path) == 0:
+        os.remove(self.spill_path)
+    if self._connection is not None:
+      self._connection.close()
+      self._connection = None
+
+  # -- producer side -------------------------------------------------------
+
+  def submit(self, session_id, word_id, correct, answered_at=None):
+    # The answer time is taken now, not when the flusher gets to it
+    if answered_at is None:
+      answered_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    item = (int(session_id), int(word_id), 1 if correct else 0, answered_at)
+    with self._lock:
+      if self._stopping or len(self._queue) + self._pending_items >= self.max_items:
+        self.stats['rejected_total'] += 1
+        raise BufferFull('Review buffer is full')
+      self._queue.append(item)
+      self._spill.write(json.dumps(item) + '\n')
+      self._spill.flush()
+      if self.fsync:
+        os.fsync(self._spill.fileno())
+      self.stats['submitted_total'] += 1
+      depth = len(self._queue)
+    if depth >= self.flush_items:
+      self._wakeup.set()
+
+  def depth(self):
+    return len(self._queue)
+
+  def metrics(self):
+    with self._lock:
+      return dict(self.stats, queue_depth=len(self._queue), pending_segments=len(self._pending),
+                  pending_reviews=self._pending_items)
+
+  # -- flusher side --------------------------------------------------------
+
+  def _run(self):
+    while True:
+      delay = self.flush_interval
+      if self._failures:
+        delay = max(delay, min(delay * 2 ** self._failures, MAX_BACKOFF_SECONDS))
+      self._wakeup.wait(delay)
+      self._wakeup.clear()
+      self.flush()
+      if self._stopping:
+        return
+
+  def _rotate(self):
+    # Swap the spill file for a fresh one and take the queued reviews that
+    # were written to it. Both happen under the lock, so the segment holds
+    # exactly the drained reviews.
+    with self._lock:
+      if not self._queue:
+        return None
+      self._segment_counter += 1
+      segment = f'{self.spill_path}.{time.time_ns()}-{self._segment_counter}.flushing'
+      self._spill.close()
+      os.replace(self.spill_path, segment)
+      self._spill = open(self.spill_path, 'a', encoding='utf-8')
+      items = list(self._queue)
+      self._queue.clear()
+    if self.fsync:
+      fd = os.open(segment, os.O_RDONLY)
+      os.fsync(fd)
+      os.close(fd)
+    return segment, items
+
+  def flush(self):
+    # One drain cycle; returns the number of reviews written
+    with self._flush_lock:
+      rotated = self._rotate()
+      if rotated:
+        with self._lock:
+          self._pending.append(rotated)
+          self._pending_items += len(rotated[1])
+      written = 0
+      while self._pending:
+        segment, items = self._pending[0]
+        started = time.perf_counter()
+        try:
+          self._write(segment, items)
+        except Exception:
+          self._failures += 1
+          with self._lock:
+            self.stats['flush_errors_total'] += 1
+          logger.exception('Review buffer flush failed (%d in a row); %d reviews wait for the next attempt',
+                           self._failures, self._pending_items)
+          break
+        elapsed = time.perf_counter() - started
+        self._failures = 0
+        written += len(items)
+        with self._lock:
+          self._pending.pop(0)
+          self._pending_items -= len(items)
+          self.stats['flushed_total'] += len(items)
+          self.stats['flushes_total'] += 1
+          self.stats['flush_seconds_total'] += elapsed
+          self.stats['last_flush_seconds'] = elapsed
+          self.stats['max_flush_seconds'] = max(self.stats['max_flush_seconds'], elapsed)
+      return written
+
+  def _get_connection(self):
+    if self._connection is None:
+      # Opened by start() on the caller's thread and used by the flusher
+      self._connection = self.db.connect(shared=True)
+      self._connection.execute('PRAGMA busy_timeout = 5000')
+    return self._connection
+
+  def _write(self, segment, items):
+    connection = self._get_connection()
+    name = os.path.basename(segment)
+    by_session = defaultdict(list)
+    for session_id, word_id, correct, answered_at in items:
+      by_session[session_id].append((word_id, correct, answered_at))
+    try:
+      cursor = connection.cursor()
+      for session_id, session_reviews in by_session.items():
+        reviews.record_reviews(cursor, session_id, session_reviews)
+      cursor.execute('INSERT INTO review_buffer_segments (name) VALUES (?)', (name,))
+      if self._stale_markers:
+        cursor.executemany('DELETE FROM review_buffer_segments WHERE name = ?',
+                           [(marker,) for marker in self._stale_markers])
+      connection.commit()
+    except Exception:
+      connection.rollback()
+      raise
+    self._stale_markers = [name]
+    os.remove(segment)
+    if self.on_flush:
+      self.on_flush(by_session)
+
+  # -- crash recovery ------------------------------------------------------
+
+  def replay(self):
+    # Write reviews left behind by a previous process: the active spill file
+    # and any rotated segment whose transaction never committed
+    with self._flush_lock:
+      return self._replay()
+
+  def _replay(self):
+    if os.path.exists(self.spill_path) and os.path.getsize(self.spill_path) > 0:
+      os.replace(self.spill_path, f'{self.spill_path}.{time.time_ns()}-0.flushing')
+
+    connection = self._get_connection()
+    committed = {row[0] for row in connection.execute('SELECT name FROM review_buffer_segments')}
+    segments = []
+    for segment in sorted(glob.glob(glob.escape(self.spill_path) + '.*.flushing')):
+      if os.path.basename(segment) in committed:
+        os.remove(segment)
+      else:
+        segments.append(segment)
+    # Every recorded marker now points at a file that no longer exists
+    self._stale_markers = list(committed)
+
+    replayed = 0
+    for segment in segments:
+      items = []
+      with open(segment, encoding='utf-8') as file:
+        for line in file:
+          try:
+            items.append(tuple(json.loads(line)))
+          except ValueError:
+            # A torn last line from a crash mid-append
+            continue
+      if items:
+        self._write(segment, items)
+        replayed += len(items)
+      else:
+        os.remove(segment)
+    self.stats['replayed_total'] += replayed
+    return replayed
@@ -0,0 +1,101 @@
+import json
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from lib import schedule, stats
+
+# Upper bound for one POST /study_sessions/<id>/reviews request
+MAX_BATCH_REVIEWS = 5000
+
+def parse_answered_at(value):
+  # Accept ISO 8601 timestamps and store them the way CURRENT_TIMESTAMP
+  # does (UTC, 'YYYY-MM-DD HH:MM:SS') so they sort with the other rows
+  if value is None:
+    return None
+  answered_at = datetime.fromisoformat(str(value))
+  if answered_at.tzinfo is not None:
+    answered_at = answered_at.astimezone(timezone.utc).replace(tzinfo=None)
+  return answered_at.strftime('%Y-%m-%d %H:%M:%S')
+
+def parse_correct(value):
+  # JSON booleans, or 0/1 from clients that send integers. Strings such as
+  # "false" are rejected rather than read as truthy.
+  if isinstance(value, bool):
+    return value
+  if isinstance(value, int) and value in (0, 1):
+    return bool(value)
+  raise ValueError(value)
+
+def record_reviews(cursor, session_id, reviews):
+  # Write a group of validated reviews for one study session: the raw
+  # attempts, the per-word aggregates (word_reviews and the counters on
+  # words), the review schedules, the session summary and the dashboard
+  # counters. The caller owns the transaction and commits once for the
+  # whole group.
+  # reviews is a list of (word_id, correct, answered_at) tuples, answered_at
+  # being a normalized timestamp or None for "now".
+  cursor.executemany('''
+    INSERT INTO word_review_items (word_id, study_session_id, correct, created_at)
+    VALUES (?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+  ''', [(word_id, session_id, 1 if correct else 0, answered_at) for word_id, correct, answered_at in reviews])
+
+  # Same UTC format as answered_at, so that MAX() compares like with like
+  now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+  totals = defaultdict(lambda: [0, 0, None])
+  for word_id, correct, answered_at in reviews:
+    total = totals[word_id]
+    total[0 if correct else 1] += 1
+    reviewed = answered_at or now
+    if total[2] is None or reviewed > total[2]:
+      total[2] = reviewed
+
+  cursor.executemany('''
+    INSERT INTO word_reviews (word_id, correct_count, wrong_count, last_reviewed)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(word_id) DO UPDATE SET
+      correct_count = correct_count + excluded.correct_count,
+      wrong_count = wrong_count + excluded.wrong_count,
+      last_reviewed = MAX(COALESCE(last_reviewed, ''), excluded.last_reviewed)
+  ''', [(word_id, correct, wrong, last) for word_id, (correct, wrong, last) in totals.items()])
+
+  # Same counters on the words rows, where the listings sort on them
+  cursor.executemany('''
+    UPDATE words SET
+      correct_count = correct_count + ?,
+      wrong_count = wrong_count + ?,
+      last_reviewed = MAX(COALESCE(last_reviewed, ''), ?)
+    WHERE id = ?
+  ''', [(correct, wrong, last, word_id) for word_id, (correct, wrong, last) in totals.items()])
+
+  schedule.record_reviews(cursor, reviews)
+
+  # Session summary read by the session listings
+  correct = sum(1 for _, is_correct, _ in reviews if is_correct)
+  answered = [answered_at for _, _, answered_at in reviews if answered_at]
+  cursor.execute('''
+    UPDATE study_sessions SET
+      review_items_count = review_items_count + ?,
+      correct_count = correct_count + ?,
+      wrong_count = wrong_count + ?,
+      last_activity_at = MAX(
+        COALESCE(last_activity_at, ''),
+        COALESCE(?, ''),
+        CASE WHEN ? THEN CURRENT_TIMESTAMP ELSE '' END
+      )
+    WHERE id = ?
+  ''', (len(reviews), correct, len(reviews) - correct, max(answered, default=None),
+        len(answered) < len(reviews), session_id))
+
+  stats.record_reviews(cursor, [(word_id, correct) for word_id, correct, _ in reviews])
+  stats.record_review_days(cursor, [(answered_at, correct) for _, correct, answered_at in reviews])
+
+def missing_word_ids(cursor, word_ids):
+  # Set-based existence check: one query for the whole batch. NOT EXISTS
+  # rather than an anti-join, which would materialize the words view of
+  # learner shards (lib/shards.py)
+  cursor.execute('''
+    SELECT DISTINCT j.value
+    FROM json_each(?) j
+    WHERE NOT EXISTS (SELECT 1 FROM words w WHERE w.id = j.value)
+  ''', (json.dumps(list(word_ids)),))
+  return [row[0] for row in cursor.fetchall()]
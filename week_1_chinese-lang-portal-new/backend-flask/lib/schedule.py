@@ -0,0 +1,117 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from lib.shards import sync_group_due
+
+# SM-2 spaced repetition with pass/fail answers. Each word carries an ease
+# factor, the current interval in days and the number of correct answers in
+# a row; a correct answer grows the interval (1 day, 6 days, then times the
+# ease), a wrong one starts the word over.
+
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+
+# SM-2 grades answers from 0 to 5; these are the grades given to a correct
+# and a wrong answer. 4 keeps the ease, 2 lowers it by 0.32.
+CORRECT_QUALITY = 4
+WRONG_QUALITY = 2
+
+# A missed word comes back within the same sitting
+RELEARN_DELAY = timedelta(minutes=10)
+
+# Upper bound for GET /study_sessions/<id>/next?n=
+MAX_DUE_WORDS = 100
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def now():
+  # Same format as CURRENT_TIMESTAMP and the normalized answered_at values
+  return datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+def next_schedule(ease, interval_days, repetitions, correct, answered_at):
+  # One SM-2 step. answered_at is a datetime; returns the new
+  # (ease, interval_days, repetitions, due_at)
+  quality = CORRECT_QUALITY if correct else WRONG_QUALITY
+  ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+  if not correct:
+    return ease, 0, 0, answered_at + RELEARN_DELAY
+
+  repetitions += 1
+  if repetitions == 1:
+    interval_days = 1
+  elif repetitions == 2:
+    interval_days = 6
+  else:
+    interval_days = round(interval_days * ease)
+  return ease, interval_days, repetitions, answered_at + timedelta(days=interval_days)
+
+def record_reviews(cursor, reviews):
+  # Advance the schedule of every reviewed word. reviews is a list of
+  # (word_id, correct, answered_at) tuples as taken by
+  # lib/reviews.record_reviews; a word answered several times is stepped
+  # once per answer, oldest first.
+  current = now()
+  cursor.execute('''
+    SELECT s.word_id, s.ease, s.interval_days, s.repetitions
+    FROM json_each(?) j
+    JOIN word_schedules s ON s.word_id = j.value
+  ''', (json.dumps(sorted({word_id for word_id, _, _ in reviews})),))
+  schedules = {row[0]: (row[1], row[2], row[3], None) for row in cursor.fetchall()}
+
+  for word_id, correct, answered_at in sorted(reviews, key=lambda review: review[2] or current):
+    ease, interval_days, repetitions, _ = schedules.get(word_id, (INITIAL_EASE, 0, 0, None))
+    answered = datetime.strptime(answered_at or current, TIMESTAMP_FORMAT)
+    schedules[word_id] = next_schedule(ease, interval_days, repetitions, correct, answered)
+
+  # Only the words of this group of reviews; the triggers of migration 012
+  # copy due_at onto their group memberships (on a shard, shards.sync_group_due)
+  reviewed = {word_id for word_id, _, _ in reviews}
+  cursor.executemany('''
+    INSERT INTO word_schedules (word_id, ease, interval_days, repetitions, due_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(word_id) DO UPDATE SET
+      ease = excluded.ease,
+      interval_days = excluded.interval_days,
+      repetitions = excluded.repetitions,
+      due_at = excluded.due_at
+  ''', [
+    (word_id, ease, interval_days, repetitions, due_at.strftime(TIMESTAMP_FORMAT))
+    for word_id, (ease, interval_days, repetitions, due_at) in schedules.items()
+    if word_id in reviewed
+  ])
+  if getattr(cursor.connection, 'shard', None) is not None:
+    sync_group_due(cursor, reviewed)
+
+def due_words(cursor, group_id, limit, at=None):
+  # The limit most-due words of a group: overdue words by due date, then
+  # words never reviewed, then the ones due next. Each tier is a bounded
+  # range of idx_word_groups_group_due, read through word_group_due for the
+  # scheduled words (migration 018) so that shards serve it from their own
+  # table.
+  at = at or now()
+  cursor.execute('''
+    SELECT w.id, w.kanji, w.romaji, w.english, w.parts, q.due_at
+    FROM (
+      SELECT * FROM (
+        SELECT word_id, due_at, 0 AS tier FROM word_group_due
+        WHERE group_id = ? AND due_at <= ?
+        ORDER BY due_at, word_id LIMIT ?
+      )
+      UNION ALL
+      SELECT * FROM (
+        SELECT word_id, due_at, 1 AS tier FROM word_groups
+        WHERE group_id = ? AND due_at IS NULL
+        ORDER BY word_id LIMIT ?
+      )
+      UNION ALL
+      SELECT * FROM (
+        SELECT word_id, due_at, 2 AS tier FROM word_group_due
+        WHERE group_id = ? AND due_at > ?
+        ORDER BY due_at, word_id LIMIT ?
+      )
+    ) q
+    JOIN words w ON w.id = q.word_id
+    ORDER BY q.tier, q.due_at, q.word_id
+    LIMIT ?
+  ''', (group_id, at, limit, group_id, limit, group_id, at, limit, limit))
+  return cursor.fetchall()
@@ -0,0 +1,56 @@
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+  import orjson
+except ImportError:  # optional: pip install orjson
+  orjson = None
+
+# JSON providers for app.json, and so for jsonify() and request.get_json().
+# With orjson installed the responses are encoded by orjson; without it
+# Flask's stdlib encoder is used. Both have fragment() for JSON the
+# database already holds (words.parts): orjson 3.9+ embeds it as is, the
+# others parse it so that it is encoded again.
+
+class JSONProvider(DefaultJSONProvider):
+  def fragment(self, text):
+    return json.loads(text)
+
+class OrjsonProvider(JSONProvider):
+  # Matches Flask's output apart from whitespace and ensure_ascii: keys are
+  # sorted and dates keep the HTTP date format of DefaultJSONProvider
+  def options(self, indent=False):
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_APPEND_NEWLINE
+    if self.sort_keys:
+      options |= orjson.OPT_SORT_KEYS
+    if indent:
+      options |= orjson.OPT_INDENT_2
+    return options
+
+  def dumps(self, obj, **kwargs):
+    if kwargs:
+      # Arguments only the stdlib encoder understands
+      return super().dumps(obj, **kwargs)
+    return orjson.dumps(obj, default=self.default, option=self.options() & ~orjson.OPT_APPEND_NEWLINE).decode()
+
+  def loads(self, s, **kwargs):
+    if kwargs:
+      return super().loads(s, **kwargs)
+    return orjson.loads(s)
+
+  def response(self, *args, **kwargs):
+    obj = self._prepare_response_obj(args, kwargs)
+    indent = (self.compact is None and self._app.debug) or self.compact is False
+    body = orjson.dumps(obj, default=self.default, option=self.options(indent))
+    return self._app.response_class(body, mimetype=self.mimetype)
+
+  def fragment(self, text):
+    if hasattr(orjson, 'Fragment'):
+      return orjson.Fragment(text)
+    return orjson.loads(text)
+
+def json_provider(app, use_orjson=True):
+  if use_orjson and orjson is not None:
+    return OrjsonProvider(app)
+  return JSONProvider(app)
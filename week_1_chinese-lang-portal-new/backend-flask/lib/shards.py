@@ -0,0 +1,257 @@
+import json
+import os
+import re
+import sqlite3
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+# Learner shards: the study history of every learner (or of every cohort of
+# learners) lives in a SQLite file of its own, so that learners do not
+# queue behind each other for a single write lock. The vocabulary, groups
+# and activities stay in the main database, which the shard connections
+# attach read-only as `shared`.
+#
+# Routes keep their SQL: unqualified names resolve to the TEMP schema
+# first, then to the shard (main), then to the shared file. TEMP views
+# named after the shared tables that carry per-learner columns put the
+# learner's own values on them:
+#
+# - words: the review counters come from the shard's word_reviews, and the
+#   writes of lib/reviews.py to them are dropped
+# - word_groups: due_at comes from the shard's word_schedules. The due
+#   queues read the shard's word_group_due table instead, which is ordered
+#   like idx_word_groups_group_due of the main database
+# - dashboard_stats: the shard's learner_dashboard_stats with the shared
+#   total_vocabulary
+#
+# Requests without a learner id keep using the learner tables of the main
+# database.
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), '..', 'sql', 'shard', 'schema.sql')
+
+# Stored in PRAGMA user_version once the schema file has been applied. The
+# file only creates what is missing, so bumping this upgrades older shards
+SCHEMA_VERSION = 3
+
+LEARNER_HEADER = 'X-Learner-Id'
+LEARNER_ID = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+# Shard connections every worker thread keeps open in pool mode
+MAX_CONNECTIONS = 32
+
+# Shards read at the same time by the cross-learner dashboard
+FANOUT_WORKERS = 8
+
+# Single-table views with the learner's columns as correlated subqueries:
+# SQLite flattens those into the queries using them (a view over a join
+# would be materialized whole as the right side of a LEFT JOIN)
+OVERLAYS = [
+  '''
+  CREATE TEMP VIEW words AS
+  SELECT w.id, w.kanji, w.romaji, w.english, w.parts,
+         COALESCE((SELECT r.correct_count FROM main.word_reviews r WHERE r.word_id = w.id), 0) AS correct_count,
+         COALESCE((SELECT r.wrong_count FROM main.word_reviews r WHERE r.word_id = w.id), 0) AS wrong_count,
+         (SELECT r.last_reviewed FROM main.word_reviews r WHERE r.word_id = w.id) AS last_reviewed,
+         (SELECT CAST(r.correct_count AS REAL) / (r.correct_count + r.wrong_count)
+          FROM main.word_reviews r
+          WHERE r.word_id = w.id AND r.correct_count + r.wrong_count > 0) AS accuracy
+  FROM shared.words w
+  ''',
+  # The counters are derived from word_reviews, written in the same
+  # transaction
+  'CREATE TEMP TRIGGER words_update INSTEAD OF UPDATE ON words BEGIN SELECT 1; END',
+  '''
+  CREATE TEMP VIEW word_groups AS
+  SELECT wg.word_id, wg.group_id,
+         (SELECT s.due_at FROM main.word_schedules s WHERE s.word_id = wg.word_id) AS due_at,
+         wg.position
+  FROM shared.word_groups wg
+  ''',
+  '''
+  CREATE TEMP VIEW dashboard_stats AS
+  SELECT d.id,
+         (SELECT total_vocabulary FROM shared.dashboard_stats WHERE id = 1) AS total_vocabulary,
+         d.total_sessions, d.total_reviews, d.correct_reviews,
+         d.words_studied, d.mastered_words, d.longest_streak
+  FROM main.learner_dashboard_stats d
+  ''',
+  '''
+  CREATE TEMP TRIGGER dashboard_stats_update INSTEAD OF UPDATE ON dashboard_stats
+  BEGIN
+    UPDATE learner_dashboard_stats SET
+      total_sessions = NEW.total_sessions,
+      total_reviews = NEW.total_reviews,
+      correct_reviews = NEW.correct_reviews,
+      words_studied = NEW.words_studied,
+      mastered_words = NEW.mastered_words,
+      longest_streak = NEW.longest_streak
+    WHERE id = OLD.id;
+  END
+  ''',
+  '''
+  CREATE TEMP TRIGGER dashboard_stats_insert INSTEAD OF INSERT ON dashboard_stats
+  BEGIN
+    INSERT OR REPLACE INTO learner_dashboard_stats (
+      id, total_sessions, total_reviews, correct_reviews, words_studied, mastered_words, longest_streak
+    ) VALUES (
+      NEW.id, NEW.total_sessions, NEW.total_reviews, NEW.correct_reviews,
+      NEW.words_studied, NEW.mastered_words, NEW.longest_streak
+    );
+  END
+  ''',
+]
+
+def uri(path, readonly=False):
+  return Path(path).resolve().as_uri() + ('?mode=ro' if readonly else '')
+
+class Shards:
+  def __init__(self, directory, cohorts=0):
+    # cohorts=0 gives every learner a shard; otherwise learners are spread
+    # over that many cohort shards by a stable hash of their id
+    self.directory = directory
+    self.cohorts = cohorts
+    os.makedirs(directory, exist_ok=True)
+    with open(SCHEMA_PATH) as file:
+      self.schema = file.read()
+
+  def route(self, learner_id):
+    # Shard name of a learner id, None without one. Raises ValueError for
+    # ids that cannot be part of a file name.
+    if learner_id is None or learner_id == '':
+      return None
+    if not LEARNER_ID.fullmatch(learner_id):
+      raise ValueError(f'{LEARNER_HEADER} must be 1 to 64 letters, digits, "-" or "_"')
+    if self.cohorts:
+      return f'cohort_{zlib.crc32(learner_id.encode()) % self.cohorts:04d}'
+    return f'learner_{learner_id}'
+
+  def path(self, shard):
+    return os.path.join(self.directory, shard + '.db')
+
+  def names(self):
+    return sorted(name[:-3] for name in os.listdir(self.directory)
+                  if name.endswith('.db') and name.startswith(('learner_', 'cohort_')))
+
+  def prepare(self, connection, shared, readonly=False):
+    # Create the shard tables on first use, attach the shared database and
+    # put the overlays in front of it
+    version = connection.execute('PRAGMA user_version').fetchone()[0]
+    upgrade = not readonly and version < SCHEMA_VERSION
+    if upgrade:
+      connection.executescript('BEGIN;\n' + self.schema + f'\nPRAGMA user_version = {SCHEMA_VERSION};\nCOMMIT;')
+    connection.execute('ATTACH DATABASE ? AS shared', (uri(shared, readonly=True),))
+    for sql in OVERLAYS:
+      connection.execute(sql)
+    if upgrade:
+      with connection:
+        if version == 0:
+          # No schedules yet, so no memberships to catch up on
+          connection.execute('''
+            UPDATE main.word_group_due_sync
+            SET membership_rowid = (SELECT COALESCE(MAX(rowid), 0) FROM shared.word_groups)
+          ''')
+        else:
+          sync_group_due(connection, backfill=True)
+
+def sync_group_due(cursor, word_ids=(), backfill=False):
+  # Add the missing word_group_due rows of a shard: those of the given
+  # (just scheduled) words, or of every schedule with backfill=True, and
+  # those of the memberships the shared word_groups gained since the last
+  # sync. Existing rows already follow word_schedules.
+  insert = '''
+    INSERT OR IGNORE INTO main.word_group_due (group_id, due_at, word_id)
+    SELECT wg.group_id, s.due_at, s.word_id
+    FROM main.word_schedules s
+    JOIN shared.word_groups wg ON wg.word_id = s.word_id
+  '''
+  if backfill:
+    cursor.execute(insert)
+  elif word_ids:
+    cursor.execute(insert + ' WHERE s.word_id IN (SELECT value FROM json_each(?))', (json.dumps(sorted(word_ids)),))
+
+  last = cursor.execute('SELECT membership_rowid FROM main.word_group_due_sync WHERE id = 1').fetchone()[0]
+  newest = cursor.execute('SELECT COALESCE(MAX(rowid), 0) FROM shared.word_groups').fetchone()[0]
+  if newest > last:
+    if not backfill:
+      cursor.execute('''
+        INSERT OR IGNORE INTO main.word_group_due (group_id, due_at, word_id)
+        SELECT wg.group_id, s.due_at, s.word_id
+        FROM shared.word_groups wg
+        JOIN main.word_schedules s ON s.word_id = wg.word_id
+        WHERE wg.rowid > ?
+      ''', (last,))
+    cursor.execute('UPDATE main.word_group_due_sync SET membership_rowid = ? WHERE id = 1', (newest,))
+
+# Counters of one learner, read from the shard tables themselves (or from
+# dashboard_stats in the main database)
+LEARNER_SUMMARY = '''
+  SELECT total_sessions, total_reviews, correct_reviews, words_studied, mastered_words, longest_streak,
+         (SELECT MAX(date) FROM daily_activity) AS last_active
+  FROM {table} WHERE id = 1
+'''
+
+def learner_summary(path, start, table='learner_dashboard_stats'):
+  # The summary and the daily activity since start of one database
+  connection = sqlite3.connect(uri(path, readonly=True), uri=True)
+  connection.row_factory = sqlite3.Row
+  try:
+    summary = connection.execute(LEARNER_SUMMARY.format(table=table)).fetchone()
+    days = connection.execute('''
+      SELECT date, sessions, reviews, correct, wrong FROM daily_activity WHERE date >= ?
+    ''', (start,)).fetchall()
+    return summary, days
+  finally:
+    connection.close()
+
+def aggregate(db, days=30, workers=FANOUT_WORKERS, today=None):
+  # Cross-learner dashboard: the summary tables of every shard, read in
+  # parallel, plus the learner tables of the main database. Shards that
+  # cannot be read are reported instead of failing the whole dashboard.
+  start = ((today or date.today()) - timedelta(days=days - 1)).isoformat()
+  sources = [(None, db.database, 'dashboard_stats')]
+  if db.shards is not None:
+    sources += [(name, db.shards.path(name), 'learner_dashboard_stats') for name in db.shards.names()]
+
+  def read(source):
+    shard, path, table = source
+    try:
+      return shard, learner_summary(path, start, table), None
+    except sqlite3.Error as e:
+      return shard, None, str(e)
+
+  with ThreadPoolExecutor(max_workers=max(1, min(workers, len(sources)))) as executor:
+    results = list(executor.map(read, sources))
+
+  totals = {'total_sessions': 0, 'total_reviews': 0, 'correct_reviews': 0}
+  daily = {}
+  learners = []
+  errors = []
+  for shard, result, error in results:
+    if error is not None:
+      errors.append({'shard': shard, 'error': error})
+      continue
+    summary, rows = result
+    for column in totals:
+      totals[column] += summary[column]
+    for row in rows:
+      entry = daily.setdefault(row['date'], {'date': row['date'], 'sessions': 0, 'reviews': 0, 'correct': 0, 'wrong': 0, 'learners': 0})
+      for column in ('sessions', 'reviews', 'correct', 'wrong'):
+        entry[column] += row[column]
+      entry['learners'] += 1
+    learner = dict(summary)
+    learner['shard'] = shard
+    learner['success_rate'] = summary['correct_reviews'] / summary['total_reviews'] if summary['total_reviews'] else 0
+    learners.append(learner)
+
+  return dict(
+    totals,
+    shards=len(sources),
+    active_shards=sum(1 for learner in learners if learner['last_active'] and learner['last_active'] >= start),
+    success_rate=totals['correct_reviews'] / totals['total_reviews'] if totals['total_reviews'] else 0,
+    start=start,
+    days=[daily[day] for day in sorted(daily)],
+    learners=learners,
+    errors=errors
+  )
@@ -0,0 +1,304 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+# Incrementally maintained dashboard statistics. The write routes call these
+# helpers with their own cursor before committing, so the summary tables
+# change in the same transaction as the rows they summarize.
+
+# A word counts as mastered with at least 5 attempts and >= 80% correct
+MASTERY_MIN_ATTEMPTS = 5
+
+def is_mastered(attempts, correct):
+  return attempts >= MASTERY_MIN_ATTEMPTS and correct * 5 >= attempts * 4
+
+def record_session(cursor, created_at):
+  # Sessions store local time, so their day is the date as stored
+  cursor.execute('UPDATE dashboard_stats SET total_sessions = total_sessions + 1 WHERE id = 1')
+  record_activity(cursor, str(created_at)[:10], sessions=1)
+
+def local_day(answered_at):
+  # Review timestamps are normalized UTC ('YYYY-MM-DD HH:MM:SS') or None
+  # for "now"; daily_activity is keyed on the local date
+  if answered_at is None:
+    return date.today().isoformat()
+  moment = datetime.strptime(answered_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+  return moment.astimezone().date().isoformat()
+
+def record_review_days(cursor, reviews):
+  # reviews is an iterable of (answered_at, correct) pairs
+  days = defaultdict(lambda: [0, 0])
+  for answered_at, correct in reviews:
+    days[local_day(answered_at)][0 if correct else 1] += 1
+  for day, (correct, wrong) in days.items():
+    record_activity(cursor, day, reviews=correct + wrong, correct=correct, wrong=wrong)
+
+def record_activity(cursor, day, sessions=0, reviews=0, correct=0, wrong=0):
+  cursor.execute('INSERT INTO daily_activity (date) VALUES (?) ON CONFLICT(date) DO NOTHING', (day,))
+  new_day = cursor.rowcount == 1
+  cursor.execute('''
+    UPDATE daily_activity
+    SET sessions = sessions + ?, reviews = reviews + ?, correct = correct + ?, wrong = wrong + ?
+    WHERE date = ?
+  ''', (sessions, reviews, correct, wrong, day))
+  # Runs only grow while the history is kept, so the longest one can only
+  # change when a day becomes active
+  if new_day:
+    cursor.execute(
+      'UPDATE dashboard_stats SET longest_streak = MAX(longest_streak, ?) WHERE id = 1',
+      (run_length(cursor, day),)
+    )
+
+# Walk daily_activity from a day to the first gap, one primary key lookup
+# per day, in either direction
+RUN_LENGTH = '''
+  WITH RECURSIVE
+    earlier(day) AS (
+      SELECT :day
+      UNION ALL
+      SELECT date(day, '-1 day') FROM earlier
+      WHERE EXISTS (SELECT 1 FROM daily_activity WHERE date = date(earlier.day, '-1 day'))
+    ),
+    later(day) AS (
+      SELECT :day
+      UNION ALL
+      SELECT date(day, '+1 day') FROM later
+      WHERE :both AND EXISTS (SELECT 1 FROM daily_activity WHERE date = date(later.day, '+1 day'))
+    )
+  SELECT (SELECT COUNT(*) FROM earlier) + (SELECT COUNT(*) FROM later) - 1
+'''
+
+def run_length(cursor, day, both_ways=True):
+  # Consecutive active days through `day` (ending at it with both_ways=False)
+  return cursor.execute(RUN_LENGTH, {'day': day, 'both': both_ways}).fetchone()[0]
+
+def current_streak(cursor, today=None):
+  # The run of active days ending today, or yesterday when there has been
+  # no activity yet today
+  today = today or date.today()
+  last = cursor.execute(
+    'SELECT MAX(date) FROM daily_activity WHERE date <= ?', (today.isoformat(),)
+  ).fetchone()[0]
+  if last is None or last < (today - timedelta(days=1)).isoformat():
+    return 0
+  return run_length(cursor, last, both_ways=False)
+
+def record_reviews(cursor, reviews):
+  # reviews is an iterable of (word_id, correct) pairs
+  deltas = defaultdict(lambda: [0, 0])
+  for word_id, correct in reviews:
+    deltas[word_id][0] += 1
+    deltas[word_id][1] += 1 if correct else 0
+  if not deltas:
+    return
+
+  previous = {}
+  word_ids = list(deltas)
+  for start in range(0, len(word_ids), 500):
+    chunk = word_ids[start:start + 500]
+    cursor.execute(f'''
+      SELECT word_id, attempts, correct FROM word_stats
+      WHERE word_id IN ({','.join('?' * len(chunk))})
+    ''', chunk)
+    for row in cursor.fetchall():
+      previous[row[0]] = (row[1], row[2])
+
+  studied = mastered = 0
+  for word_id, (attempts, correct) in deltas.items():
+    old_attempts, old_correct = previous.get(word_id, (0, 0))
+    if old_attempts == 0:
+      studied += 1
+    mastered += is_mastered(old_attempts + attempts, old_correct + correct) - is_mastered(old_attempts, old_correct)
+
+  cursor.executemany('''
+    INSERT INTO word_stats (word_id, attempts, correct) VALUES (?, ?, ?)
+    ON CONFLICT(word_id) DO UPDATE SET
+      attempts = attempts + excluded.attempts,
+      correct = correct + excluded.correct
+  ''', [(word_id, attempts, correct) for word_id, (attempts, correct) in deltas.items()])
+
+  cursor.execute('''
+    UPDATE dashboard_stats
+    SET total_reviews = total_reviews + ?,
+        correct_reviews = correct_reviews + ?,
+        words_studied = words_studied + ?,
+        mastered_words = mastered_words + ?
+    WHERE id = 1
+  ''', (
+    sum(attempts for attempts, _ in deltas.values()),
+    sum(correct for _, correct in deltas.values()),
+    studied,
+    mastered
+  ))
+
+def reset(cursor):
+  # Study history was wiped; only the vocabulary size survives
+  cursor.execute('DELETE FROM word_stats')
+  cursor.execute('DELETE FROM daily_activity')
+  cursor.execute('''
+    UPDATE dashboard_stats
+    SET total_sessions = 0, total_reviews = 0, correct_reviews = 0,
+        words_studied = 0, mastered_words = 0, longest_streak = 0
+    WHERE id = 1
+  ''')
+
+def read(cursor):
+  cursor.execute('SELECT * FROM dashboard_stats WHERE id = 1')
+  return cursor.fetchone()
+
+# Recomputation from the raw review history, used by `invoke rebuild-stats`
+# to repair the summary tables or to check that they have not drifted. The
+# reviews of archived sessions are counted from word_review_days, and rows
+# that a pending reset is deleting (lib/history.py) are left out.
+RESET_PENDING = 'EXISTS (SELECT 1 FROM history_resets WHERE started_at IS NOT NULL AND finished_at IS NULL)'
+
+EXPECTED_WORD_STATS = '''
+  SELECT word_id, SUM(attempts) as attempts, SUM(correct) as correct
+  FROM (
+    SELECT wri.word_id, COUNT(*) as attempts,
+           SUM(CASE WHEN wri.correct = 1 THEN 1 ELSE 0 END) as correct
+    FROM word_review_items wri
+    JOIN study_sessions ss ON wri.study_session_id = ss.id
+    WHERE wri.id > (SELECT review_id FROM history_resets)
+    GROUP BY wri.word_id
+    UNION ALL
+    SELECT word_id, SUM(correct + wrong), SUM(correct)
+    FROM word_review_days
+    WHERE NOT ''' + RESET_PENDING + '''
+    GROUP BY word_id
+  )
+  GROUP BY word_id
+'''
+
+EXPECTED_DAILY_ACTIVITY = '''
+  SELECT date, SUM(sessions) as sessions, SUM(reviews) as reviews,
+         SUM(correct) as correct, SUM(wrong) as wrong
+  FROM (
+    SELECT date(created_at) as date, COUNT(*) as sessions, 0 as reviews, 0 as correct, 0 as wrong
+    FROM study_sessions
+    WHERE id > (SELECT session_id FROM history_resets)
+    GROUP BY 1
+    UNION ALL
+    SELECT date(created_at, 'localtime'), 0, COUNT(*), SUM(correct = 1), SUM(correct = 0)
+    FROM word_review_items
+    WHERE id > (SELECT review_id FROM history_resets)
+    GROUP BY 1
+    UNION ALL
+    SELECT date, 0, SUM(correct + wrong), SUM(correct), SUM(wrong)
+    FROM word_review_days
+    WHERE NOT ''' + RESET_PENDING + '''
+    GROUP BY date
+  )
+  GROUP BY date
+'''
+
+EXPECTED_DASHBOARD_STATS = '''
+  WITH expected_word_stats AS (''' + EXPECTED_WORD_STATS + '''),
+  expected_daily_activity AS (''' + EXPECTED_DAILY_ACTIVITY + ''')
+  SELECT
+    (SELECT COUNT(*) FROM words) as total_vocabulary,
+    (SELECT COUNT(*) FROM study_sessions WHERE id > (SELECT session_id FROM history_resets)) as total_sessions,
+    (SELECT COALESCE(SUM(attempts), 0) FROM expected_word_stats) as total_reviews,
+    (SELECT COALESCE(SUM(correct), 0) FROM expected_word_stats) as correct_reviews,
+    (SELECT COUNT(*) FROM expected_word_stats) as words_studied,
+    (SELECT COUNT(*) FROM expected_word_stats WHERE attempts >= 5 AND correct * 5 >= attempts * 4) as mastered_words,
+    (
+      SELECT COALESCE(MAX(days), 0) FROM (
+        SELECT COUNT(*) as days
+        FROM (SELECT julianday(date) - ROW_NUMBER() OVER (ORDER BY date) as run FROM expected_daily_activity)
+        GROUP BY run
+      )
+    ) as longest_streak
+'''
+
+# Archived sessions keep the summaries they had when their reviews moved
+EXPECTED_SESSION_SUMMARIES = '''
+  SELECT ss.id,
+         COUNT(wri.id) as review_items_count,
+         COALESCE(SUM(wri.correct = 1), 0) as correct_count,
+         COALESCE(SUM(wri.correct = 0), 0) as wrong_count,
+         MAX(wri.created_at) as last_activity_at
+  FROM study_sessions ss
+  LEFT JOIN word_review_items wri ON wri.study_session_id = ss.id
+  WHERE ss.archived_at IS NULL
+  GROUP BY ss.id
+'''
+
+# The review counters kept on words mirror the word_reviews aggregates
+EXPECTED_WORD_COUNTERS = '''
+  SELECT w.id,
+         COALESCE(r.correct_count, 0) as correct_count,
+         COALESCE(r.wrong_count, 0) as wrong_count,
+         r.last_reviewed
+  FROM words w
+  LEFT JOIN word_reviews r ON r.word_id = w.id
+'''
+
+def drift(connection):
+  # Compare the maintained tables with a full recomputation. Returns a list
+  # of human readable differences; empty means the tables are in sync.
+  differences = []
+  expected = dict(connection.execute(EXPECTED_DASHBOARD_STATS).fetchone())
+  actual = connection.execute('SELECT * FROM dashboard_stats WHERE id = 1').fetchone()
+  for column, value in expected.items():
+    current = actual[column] if actual else None
+    if current != value:
+      differences.append(f'dashboard_stats.{column}: {current!r} != {value!r}')
+
+  expected_words = {row[0]: (row[1], row[2]) for row in connection.execute(EXPECTED_WORD_STATS)}
+  actual_words = {row[0]: (row[1], row[2]) for row in connection.execute('SELECT word_id, attempts, correct FROM word_stats')}
+  for word_id in sorted(set(expected_words) | set(actual_words)):
+    if expected_words.get(word_id, (0, 0)) != actual_words.get(word_id, (0, 0)):
+      differences.append(f'word_stats[{word_id}]: {actual_words.get(word_id)} != {expected_words.get(word_id)}')
+
+  expected_days = {row[0]: tuple(row[1:]) for row in connection.execute(EXPECTED_DAILY_ACTIVITY)}
+  actual_days = {row[0]: tuple(row[1:]) for row in connection.execute('SELECT * FROM daily_activity')}
+  for day in sorted(set(expected_days) | set(actual_days)):
+    if expected_days.get(day) != actual_days.get(day):
+      differences.append(f'daily_activity[{day}]: {actual_days.get(day)} != {expected_days.get(day)}')
+
+  expected_sessions = {row[0]: tuple(row[1:]) for row in connection.execute(EXPECTED_SESSION_SUMMARIES)}
+  for row in connection.execute('''
+    SELECT id, review_items_count, correct_count, wrong_count, last_activity_at FROM study_sessions
+    WHERE archived_at IS NULL
+  '''):
+    if expected_sessions[row[0]] != tuple(row[1:]):
+      differences.append(f'study_sessions[{row[0]}] summary: {tuple(row[1:])} != {expected_sessions[row[0]]}')
+
+  expected_counters = {row[0]: tuple(row[1:]) for row in connection.execute(EXPECTED_WORD_COUNTERS)}
+  for row in connection.execute('SELECT id, correct_count, wrong_count, last_reviewed FROM words'):
+    if expected_counters[row[0]] != tuple(row[1:]):
+      differences.append(f'words[{row[0]}] counters: {tuple(row[1:])} != {expected_counters[row[0]]}')
+  return differences
+
+def rebuild(connection):
+  with connection:
+    connection.execute('DELETE FROM word_stats')
+    connection.execute('INSERT INTO word_stats (word_id, attempts, correct) ' + EXPECTED_WORD_STATS)
+    connection.execute('DELETE FROM daily_activity')
+    connection.execute('INSERT INTO daily_activity (date, sessions, reviews, correct, wrong) ' + EXPECTED_DAILY_ACTIVITY)
+    connection.execute('''
+      INSERT OR REPLACE INTO dashboard_stats (
+        id, total_vocabulary, total_sessions, total_reviews, correct_reviews,
+        words_studied, mastered_words, longest_streak
+      )
+      SELECT 1, * FROM (''' + EXPECTED_DASHBOARD_STATS + ''')
+    ''')
+    connection.execute('''
+      WITH expected AS (''' + EXPECTED_SESSION_SUMMARIES + ''')
+      UPDATE study_sessions SET
+        review_items_count = expected.review_items_count,
+        correct_count = expected.correct_count,
+        wrong_count = expected.wrong_count,
+        last_activity_at = expected.last_activity_at
+      FROM expected
+      WHERE expected.id = study_sessions.id
+    ''')
+    connection.execute('''
+      WITH expected AS (''' + EXPECTED_WORD_COUNTERS + ''')
+      UPDATE words SET
+        correct_count = expected.correct_count,
+        wrong_count = expected.wrong_count,
+        last_reviewed = expected.last_reviewed
+      FROM expected
+      WHERE expected.id = words.id
+    ''')
@@ -0,0 +1,233 @@
+import random
+import time
+from datetime import datetime, timezone
+
+from lib import stats
+from lib.importer import DEFER_INDEXES_AFTER, WordImporter, defer_indexes, restore_indexes
+
+# Reproducible synthetic data for load testing. The same seed and end date
+# give the same database. Usage is skewed the way real usage is: group
+# sizes and the groups studied follow a Zipf distribution, activity grows
+# towards the end date, and sessions drill a small working set of their
+# group's words with per-word difficulty.
+#
+# Words go through the bulk importer. Sessions and reviews are inserted
+# with their indexes dropped (for loads of at least DEFER_INDEXES_AFTER
+# reviews), and the summary tables are rebuilt from the
+# raw history at the end (lib/stats.rebuild).
+
+SCALES = {
+  'tiny': {'words': 2000, 'groups': 20, 'sessions': 200, 'reviews': 10000},
+  'small': {'words': 20000, 'groups': 200, 'sessions': 2000, 'reviews': 200000},
+  'medium': {'words': 200000, 'groups': 2000, 'sessions': 20000, 'reviews': 5000000},
+  'large': {'words': 1000000, 'groups': 10000, 'sessions': 100000, 'reviews': 50000000},
+}
+
+# Exponent of the Zipf distributions: the k-th group weighs 1 / k^s
+ZIPF_EXPONENT = 1.1
+
+# Average number of groups a word belongs to
+MEMBERSHIPS_PER_WORD = 1.5
+
+# Days of history before the end date
+HISTORY_DAYS = 365
+
+REVIEW_BATCH_SIZE = 100000
+
+SYLLABLES = [consonant + vowel for consonant in ['', 'k', 's', 't', 'n', 'h', 'm', 'y', 'r', 'w', 'g', 'z', 'd', 'b', 'p']
+             for vowel in 'aiueo']
+KANJI = [chr(code) for code in range(0x4E00, 0x4E00 + 3000)]
+GLOSSES = '''
+  eat drink go come see look hear listen speak say read write buy sell pay give take make do
+  think know understand remember forget learn teach study work play rest sleep wake stand sit
+  walk run swim fly open close begin end wait meet call send carry wear wash cook cut use
+  big small long short high low new old good bad hot cold warm cool fast slow early late easy
+  difficult heavy light bright dark strong weak busy quiet happy sad young near far expensive
+  cheap red blue white black water rice tea book car house school station river mountain sea
+  sky rain snow wind tree flower dog cat bird fish friend teacher student family mother father
+'''.split()
+
+def zipf_weights(count, exponent=ZIPF_EXPONENT):
+  # Cumulative weights for random.choices
+  total, cumulative = 0.0, []
+  for rank in range(1, count + 1):
+    total += 1 / rank ** exponent
+    cumulative.append(total)
+  return cumulative
+
+def difficulty(word_id):
+  # Chance of a correct answer, fixed per word (0.5 to 0.95)
+  return 0.5 + 0.45 * ((word_id * 2654435761) % 1000) / 1000
+
+class Generator:
+  def __init__(self, connection, words, groups, sessions, reviews, seed=42, end=None, days=HISTORY_DAYS,
+               defer_after=DEFER_INDEXES_AFTER):
+    self.connection = connection
+    self.defer_after = defer_after
+    self.counts = {'words': words, 'groups': groups, 'sessions': sessions, 'reviews': reviews}
+    self.random = random.Random(seed)
+    end = end or datetime.now(timezone.utc).replace(tzinfo=None)
+    self.end = int(end.replace(hour=0, minute=0, second=0, microsecond=0).replace(tzinfo=timezone.utc).timestamp())
+    self.days = days
+    self.timings = {}
+
+  def word_records(self):
+    # Unique romaji: a random 0-2 syllable prefix and the index written in
+    # syllables (a vowel ends every syllable, so the spelling parses back
+    # into the same syllables)
+    rng = self.random
+    length = 2
+    while len(SYLLABLES) ** length < self.counts['words']:
+      length += 1
+    group_weights = zipf_weights(self.counts['groups'])
+    group_names = [f'Synthetic {index + 1:05d}' for index in range(self.counts['groups'])]
+    gloss_weights = zipf_weights(len(GLOSSES))
+
+    for index in range(self.counts['words']):
+      syllables = [rng.choice(SYLLABLES) for _ in range(rng.randint(0, 2))]
+      value = index
+      for _ in range(length):
+        value, digit = divmod(value, len(SYLLABLES))
+        syllables.append(SYLLABLES[digit])
+      parts = [{'kanji': rng.choice(KANJI), 'romaji': [syllable]} for syllable in syllables]
+      glosses = rng.choices(GLOSSES, cum_weights=gloss_weights, k=rng.randint(1, 2))
+      memberships = 1 + (rng.random() < MEMBERSHIPS_PER_WORD - 1)
+      yield {
+        'kanji': ''.join(part['kanji'] for part in parts),
+        'romaji': ''.join(syllables),
+        'english': ('to ' if rng.random() < 0.3 else '') + ' '.join(glosses),
+        'parts': parts,
+        'groups': sorted({group_names[i] for i in rng.choices(range(len(group_names)), cum_weights=group_weights, k=memberships)})
+      }
+
+  def sessions(self, group_members, activity_ids):
+    # (group_id, study_activity_id, created_at epoch) rows, weighted towards
+    # the larger groups and towards the end date
+    rng = self.random
+    group_ids = sorted(group_members, key=lambda group_id: -len(group_members[group_id]))
+    weights = zipf_weights(len(group_ids))
+    rows = []
+    for _ in range(self.counts['sessions']):
+      group_id = rng.choices(group_ids, cum_weights=weights)[0]
+      # Squaring bunches the sessions near the end date
+      age = (rng.random() ** 2) * self.days * 86400
+      rows.append((group_id, rng.choice(activity_ids), int(self.end - age)))
+    rows.sort(key=lambda row: row[2])
+    return rows
+
+  def review_counts(self, sessions):
+    # Split the reviews over the sessions, exponentially distributed
+    rng = self.random
+    weights = [rng.expovariate(1.0) for _ in range(sessions)]
+    total = sum(weights)
+    counts = [int(weight / total * self.counts['reviews']) for weight in weights]
+    for index in range(self.counts['reviews'] - sum(counts)):
+      counts[index % sessions] += 1
+    return counts
+
+  def reviews(self, session_rows, group_members):
+    # (word_id, session_id, correct, created_at epoch) rows. A session drills
+    # a working set of its group's words, several times each.
+    rng = self.random
+    for (session_id, group_id, created_at), count in zip(session_rows, self.review_counts(len(session_rows))):
+      members = group_members[group_id]
+      size = min(len(members), 10 + count // 3)
+      start = rng.randrange(len(members))
+      working = [members[(start + offset) % len(members)] for offset in range(size)]
+      answered = created_at
+      for _ in range(count):
+        word_id = rng.choice(working)
+        answered += rng.randint(3, 15)
+        yield (word_id, session_id, int(rng.random() < difficulty(word_id)), answered)
+
+  def timed(self, name, started):
+    self.timings[name] = round(time.perf_counter() - started, 2)
+
+  def run(self):
+    connection = self.connection
+    connection.execute('PRAGMA synchronous = OFF')
+    if connection.in_transaction:
+      connection.commit()
+
+    started = time.perf_counter()
+    WordImporter(connection).run(self.word_records())
+    self.timed('words', started)
+
+    started = time.perf_counter()
+    group_members = {}
+    for group_id, word_id in connection.execute('''
+      SELECT wg.group_id, wg.word_id FROM word_groups wg
+      JOIN groups g ON g.id = wg.group_id
+      WHERE g.name LIKE 'Synthetic %'
+      ORDER BY wg.group_id, wg.position
+    '''):
+      group_members.setdefault(group_id, []).append(word_id)
+    activity_ids = [row[0] for row in connection.execute('SELECT id FROM study_activities ORDER BY id')]
+
+    # Small loads keep the indexes: rebuilding them over the existing
+    # history would cost more than maintaining them
+    deferred = []
+    try:
+      with connection:
+        if self.counts['reviews'] >= self.defer_after:
+          deferred = defer_indexes(connection, ('study_sessions', 'word_review_items'))
+        first_session = connection.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'study_sessions'").fetchone()[0]
+        rows = self.sessions(group_members, activity_ids)
+        connection.executemany('''
+          INSERT INTO study_sessions (group_id, study_activity_id, created_at)
+          VALUES (?, ?, datetime(?, 'unixepoch'))
+        ''', rows)
+        session_rows = [(first_session + index + 1, group_id, created_at) for index, (group_id, _, created_at) in enumerate(rows)]
+      self.timed('sessions', started)
+
+      started = time.perf_counter()
+      batch = []
+      for review in self.reviews(session_rows, group_members):
+        batch.append(review)
+        if len(batch) >= REVIEW_BATCH_SIZE:
+          self.write_reviews(batch)
+          batch = []
+      self.write_reviews(batch)
+    finally:
+      # The reviews commit batch by batch, so the indexes come back even
+      # when the run stops half way
+      with connection:
+        restore_indexes(connection, deferred)
+    self.timed('reviews', started)
+
+    started = time.perf_counter()
+    self.summarize()
+    self.timed('summaries', started)
+    return self.timings
+
+  def write_reviews(self, batch):
+    with self.connection:
+      self.connection.executemany('''
+        INSERT INTO word_review_items (word_id, study_session_id, correct, created_at)
+        VALUES (?, ?, ?, datetime(?, 'unixepoch'))
+      ''', batch)
+
+  def summarize(self):
+    # Per-word aggregates and schedules from the raw history, as migration
+    # 012 does for existing reviews, then every summary table
+    connection = self.connection
+    with connection:
+      connection.execute('DELETE FROM word_reviews')
+      connection.execute('''
+        INSERT INTO word_reviews (word_id, correct_count, wrong_count, last_reviewed)
+        SELECT word_id, SUM(correct = 1), SUM(correct = 0), MAX(created_at)
+        FROM word_review_items
+        GROUP BY word_id
+      ''')
+      connection.execute('''
+        INSERT OR REPLACE INTO word_schedules (word_id, ease, interval_days, repetitions, due_at)
+        SELECT word_id, 2.5, 0, 0, datetime(last_reviewed)
+        FROM word_reviews
+      ''')
+    stats.rebuild(connection)
+
+def generate(connection, scale='small', seed=42, end=None, **counts):
+  # Fill a migrated database. counts override the sizes of the scale.
+  # Returns the seconds spent per phase.
+  sizes = dict(SCALES[scale], **{name: value for name, value in counts.items() if value is not None})
+  return Generator(connection, seed=seed, end=end, **sizes).run()
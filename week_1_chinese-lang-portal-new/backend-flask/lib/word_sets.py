@@ -0,0 +1,240 @@
+import json
+import threading
+import zlib
+
+from lib.cache import VersionedBodyCache
+from lib.schedule import now
+
+# Word sets for study sessions spanning several groups, written as a JSON
+# expression over groups and review states:
+#
+#   {"intersect": [{"group": 1}, {"state": "wrong"}]}
+#   {"union": [{"group": 1}, {"group": 2}]}
+#   {"difference": [{"group": 1}, {"state": "reviewed"}]}
+#
+# Sets are bitmaps of word ids held in Python ints, bit n standing for word
+# n, so union, intersection and difference are single C-level |, & and & ~
+# over machine words. Group bitmaps are cached per group_versions version
+# (migration 005) and rebuilt only after the group's memberships change.
+
+STATES = ('new', 'reviewed', 'wrong', 'due')
+
+# Upper bound for the number of groups and states in one expression
+MAX_EXPRESSION_TERMS = 32
+
+class InvalidExpression(ValueError):
+  pass
+
+def bitmap(ids):
+  # Set the bits in a byte buffer first: or-ing ids into an int one by one
+  # would copy the whole int every time
+  ids = list(ids)
+  if not ids:
+    return 0
+  buffer = bytearray((max(ids) >> 3) + 1)
+  for word_id in ids:
+    buffer[word_id >> 3] |= 1 << (word_id & 7)
+  return int.from_bytes(buffer, 'little')
+
+def members(bits, after=0, limit=None):
+  # Word ids of a bitmap in increasing order, starting after an id
+  data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+  ids = []
+  start = (after + 1) >> 3
+  for index in range(start, len(data)):
+    byte = data[index]
+    if not byte:
+      continue
+    for bit in range(8):
+      word_id = (index << 3) | bit
+      if byte >> bit & 1 and word_id > after:
+        ids.append(word_id)
+        if limit is not None and len(ids) >= limit:
+          return ids
+  return ids
+
+def contains(data, word_id):
+  # Membership test on the bytes of a bitmap, without shifting the int
+  index = word_id >> 3
+  return index < len(data) and bool(data[index] >> (word_id & 7) & 1)
+
+def to_bytes(bits):
+  return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+def compress(bits):
+  return zlib.compress(to_bytes(bits))
+
+def decompress(blob):
+  return int.from_bytes(zlib.decompress(blob), 'little')
+
+def parse(expression, terms=None):
+  # Validate an expression; returns the ids of the groups it names, in order
+  terms = [] if terms is None else terms
+  if not isinstance(expression, dict) or len(expression) != 1:
+    raise InvalidExpression('Each set term must be an object with one key')
+  (operator, operand), = expression.items()
+  if operator == 'group':
+    if isinstance(operand, bool) or not isinstance(operand, int):
+      raise InvalidExpression('group must be a group id')
+    terms.append(operand)
+  elif operator == 'state':
+    if operand not in STATES:
+      raise InvalidExpression(f"state must be one of {', '.join(STATES)}")
+    terms.append(None)
+  elif operator in ('union', 'intersect', 'difference'):
+    if not isinstance(operand, list) or not operand:
+      raise InvalidExpression(f'{operator} needs a non-empty list of sets')
+    for child in operand:
+      parse(child, terms)
+  else:
+    raise InvalidExpression(f'Unknown set operator: {operator}')
+  if len(terms) > MAX_EXPRESSION_TERMS:
+    raise InvalidExpression(f'At most {MAX_EXPRESSION_TERMS} groups and states per expression')
+  return [group_id for group_id in terms if group_id is not None]
+
+def shard(cursor):
+  # Review states and session sets are per learner shard (lib/shards.py)
+  return getattr(cursor.connection, 'shard', None)
+
+class WordSets:
+  # Per-process bitmap cache shared by the requests of an app
+  def __init__(self, max_groups=256):
+    self.groups = VersionedBodyCache(max_groups)
+    # The states of every learner shard, and the vocabulary
+    self.states = VersionedBodyCache(max(max_groups, len(STATES) + 1))
+    self.sessions = VersionedBodyCache(max_groups)
+    self._lock = threading.Lock()
+    self.builds = 0
+
+  def group(self, cursor, group_id, version):
+    bits = self.groups.get(group_id, version)
+    if bits is None:
+      cursor.execute('SELECT word_id FROM word_groups WHERE group_id = ?', (group_id,))
+      bits = bitmap(row[0] for row in cursor.fetchall())
+      self.groups.put(group_id, version, bits)
+      with self._lock:
+        self.builds += 1
+    return bits
+
+  def state(self, cursor, name):
+    if name == 'due':
+      # Moves with the clock, so never cached
+      cursor.execute('SELECT word_id FROM word_schedules WHERE due_at <= ?', (now(),))
+      return bitmap(row[0] for row in cursor.fetchall())
+
+    # Review states only change with reviews, and the AUTOINCREMENT
+    # sequence of word_review_items never goes back, even after a reset.
+    # The vocabulary bitmap behind 'new' changes with the words.
+    cursor.execute('''
+      SELECT
+        (SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'word_review_items'),
+        (SELECT COALESCE(MAX(id), 0) FROM words),
+        (SELECT total_vocabulary FROM dashboard_stats WHERE id = 1)
+    ''')
+    version = tuple(cursor.fetchone())
+    if name == 'new':
+      return self.vocabulary(cursor, version[1:]) & ~self.state(cursor, 'reviewed')
+
+    key = (shard(cursor), name)
+    bits = self.states.get(key, version)
+    if bits is None:
+      if name == 'reviewed':
+        cursor.execute('SELECT word_id FROM word_schedules')
+      else:
+        cursor.execute('SELECT id FROM words WHERE wrong_count > 0')
+      bits = bitmap(row[0] for row in cursor.fetchall())
+      self.states.put(key, version, bits)
+      with self._lock:
+        self.builds += 1
+    return bits
+
+  def vocabulary(self, cursor, version):
+    bits = self.states.get('*', version)
+    if bits is None:
+      cursor.execute('SELECT id FROM words')
+      bits = bitmap(row[0] for row in cursor.fetchall())
+      self.states.put('*', version, bits)
+    return bits
+
+  def resolve(self, cursor, expression):
+    # Evaluate a parsed expression. Unknown groups raise KeyError.
+    group_ids = sorted(set(parse(expression)))
+    versions = {}
+    if group_ids:
+      cursor.execute('''
+        SELECT g.id, COALESCE(v.version, 0)
+        FROM json_each(?) j
+        JOIN groups g ON g.id = j.value
+        LEFT JOIN group_versions v ON v.group_id = g.id
+      ''', (json.dumps(group_ids),))
+      versions = dict(cursor.fetchall())
+    missing = [group_id for group_id in group_ids if group_id not in versions]
+    if missing:
+      raise KeyError(missing)
+
+    def evaluate(node):
+      (operator, operand), = node.items()
+      if operator == 'group':
+        return self.group(cursor, operand, versions[operand])
+      if operator == 'state':
+        return self.state(cursor, operand)
+      bits = [evaluate(child) for child in operand]
+      result = bits[0]
+      for other in bits[1:]:
+        if operator == 'union':
+          result |= other
+        elif operator == 'intersect':
+          result &= other
+        else:
+          result &= ~other
+      return result
+
+    return evaluate(expression)
+
+  def due_words(self, cursor, bits, limit, at=None):
+    # schedule.due_words over a word set instead of a group: the schedules
+    # of the set's members are looked up by word id and sorted, so the cost
+    # follows the size of the set rather than of word_schedules, and the new
+    # words come straight from the bitmaps
+    at = at or now()
+    ids = json.dumps(members(bits))
+
+    def scan(condition, params, count):
+      # CROSS JOIN keeps the members on the outer side
+      return [tuple(row) for row in cursor.execute(f'''
+        SELECT s.word_id, s.due_at
+        FROM json_each(?) j
+        CROSS JOIN word_schedules s ON s.word_id = j.value
+        WHERE {condition}
+        ORDER BY s.due_at, s.word_id
+        LIMIT ?
+      ''', (ids, *params, count))]
+
+    picked = scan('s.due_at <= ?', (at,), limit)
+    if len(picked) < limit:
+      new = bits & ~self.state(cursor, 'reviewed')
+      picked += [(word_id, None) for word_id in members(new, limit=limit - len(picked))]
+    if len(picked) < limit:
+      picked += scan('s.due_at > ?', (at,), limit - len(picked))
+
+    cursor.execute('''
+      SELECT w.id, w.kanji, w.romaji, w.english, w.parts, j.value ->> 1 AS due_at
+      FROM json_each(?) j
+      JOIN words w ON w.id = j.value ->> 0
+      ORDER BY j.key
+    ''', (json.dumps(picked),))
+    return cursor.fetchall()
+
+  def session(self, cursor, session_id):
+    # The word set resolved when the session was created, or None for a
+    # single group session
+    key = (shard(cursor), session_id)
+    bits = self.sessions.get(key, 0)
+    if bits is None:
+      cursor.execute('SELECT bitmap FROM study_session_word_sets WHERE session_id = ?', (session_id,))
+      row = cursor.fetchone()
+      if row is None:
+        return None
+      bits = decompress(row[0])
+      self.sessions.put(key, 0, bits)
+    return bits
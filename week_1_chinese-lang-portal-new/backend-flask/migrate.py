@@ -1,31 +1,56 @@
 import sqlite3
 import os
 
-def run_migrations():
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'sql', 'migrations')
+
+def pending_migrations(conn):
+    # Migration files are named <version>_<description>.sql and run in version order
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+    applied = {row[0] for row in conn.execute('SELECT version FROM schema_migrations')}
+    migration_files = sorted([f for f in os.listdir(MIGRATIONS_DIR) if f.endswith('.sql')])
+    return [(f.split('_', 1)[0], f) for f in migration_files if f.split('_', 1)[0] not in applied]
+
+def run_migrations(db_path=None):
     # Connect to the database
-    db_path = os.path.join(os.path.dirname(__file__), 'word_bank.db')
+    if db_path is None:
+        db_path = os.path.join(os.path.dirname(__file__), 'words.db')
     conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
     
     try:
-        # Get list of migration files
-        migrations_dir = os.path.join(os.path.dirname(__file__), 'sql', 'migrations')
-        migration_files = sorted([f for f in os.listdir(migrations_dir) if f.endswith('.sql')])
-        
-        # Run each migration
-        for migration_file in migration_files:
+        # Run each migration that has not been recorded yet. The migration and
+        # its schema_migrations row commit together, so a failed migration is
+        # rolled back and retried on the next run.
+        applied = []
+        for version, migration_file in pending_migrations(conn):
             print(f"Running migration: {migration_file}")
-            with open(os.path.join(migrations_dir, migration_file)) as f:
+            with open(os.path.join(MIGRATIONS_DIR, migration_file)) as f:
                 migration_sql = f.read()
-                conn.executescript(migration_sql)
-                conn.commit()
+            conn.executescript(
+                'BEGIN;\n' + migration_sql + '\n;'
+                f"INSERT INTO schema_migrations (version, name) VALUES ('{version}', '{migration_file}');\n"
+                'COMMIT;'
+            )
+            applied.append(version)
         
-        print("Migrations completed successfully")
+        print("Migrations completed successfully" if applied else "Schema is up to date")
+        return applied
     except Exception as e:
         print(f"Error running migrations: {str(e)}")
         conn.rollback()
+        raise
     finally:
         conn.close()
 
 if __name__ == '__main__':
-    run_migrations()
+    try:
+        run_migrations()
+    except Exception:
+        raise SystemExit(1)
@@ -1,6 +1,11 @@
-from flask import jsonify
+from flask import jsonify, request
 from flask_cors import cross_origin
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+
+from lib import shards, stats
+
+# Ten years of calendar
+MAX_HEATMAP_DAYS = 3660
 
 def load(app):
     @app.route('/dashboard/recent-session', methods=['GET'])
@@ -16,12 +21,10 @@ def load(app):
                     ss.group_id,
                     sa.name as activity_name,
                     ss.created_at,
-                    COUNT(CASE WHEN wri.correct = 1 THEN 1 END) as correct_count,
-                    COUNT(CASE WHEN wri.correct = 0 THEN 1 END) as wrong_count
+                    ss.correct_count,
+                    ss.wrong_count
                 FROM study_sessions ss
                 JOIN study_activities sa ON ss.study_activity_id = sa.id
-                LEFT JOIN word_review_items wri ON ss.id = wri.study_session_id
-                GROUP BY ss.id
                 ORDER BY ss.created_at DESC
                 LIMIT 1
             ''')
@@ -49,50 +52,13 @@ def load(app):
         try:
             cursor = app.db.cursor()
             
-            # Get total vocabulary count
-            cursor.execute('SELECT COUNT(*) as total_vocabulary FROM words')
-            total_vocabulary = cursor.fetchone()["total_vocabulary"]
-
-            # Get total unique words studied
-            cursor.execute('''
-                SELECT COUNT(DISTINCT word_id) as total_words
-                FROM word_review_items wri
-                JOIN study_sessions ss ON wri.study_session_id = ss.id
-            ''')
-            total_words = cursor.fetchone()["total_words"]
+            # All counters are maintained on write (see lib/stats.py)
+            summary = stats.read(cursor)
+            total_reviews = summary["total_reviews"]
+            success_rate = summary["correct_reviews"] * 1.0 / total_reviews if total_reviews else 0
             
-            # Get mastered words (words with >80% success rate and at least 5 attempts)
-            cursor.execute('''
-                WITH word_stats AS (
-                    SELECT 
-                        word_id,
-                        COUNT(*) as total_attempts,
-                        SUM(CASE WHEN correct = 1 THEN 1 ELSE 0 END) * 1.0 / COUNT(*) as success_rate
-                    FROM word_review_items wri
-                    JOIN study_sessions ss ON wri.study_session_id = ss.id
-                    GROUP BY word_id
-                    HAVING total_attempts >= 5
-                )
-                SELECT COUNT(*) as mastered_words
-                FROM word_stats
-                WHERE success_rate >= 0.8
-            ''')
-            mastered_words = cursor.fetchone()["mastered_words"]
-            
-            # Get overall success rate
-            cursor.execute('''
-                SELECT 
-                    SUM(CASE WHEN correct = 1 THEN 1 ELSE 0 END) * 1.0 / COUNT(*) as success_rate
-                FROM word_review_items wri
-                JOIN study_sessions ss ON wri.study_session_id = ss.id
-            ''')
-            success_rate = cursor.fetchone()["success_rate"] or 0
-            
-            # Get total number of study sessions
-            cursor.execute('SELECT COUNT(*) as total_sessions FROM study_sessions')
-            total_sessions = cursor.fetchone()["total_sessions"]
-            
-            # Get number of groups with activity in the last 30 days
+            # Get number of groups with activity in the last 30 days; the
+            # created_at index limits this to the sessions of that window
             cursor.execute('''
                 SELECT COUNT(DISTINCT group_id) as active_groups
                 FROM study_sessions
@@ -100,40 +66,65 @@ def load(app):
             ''')
             active_groups = cursor.fetchone()["active_groups"]
             
-            # Calculate current streak (consecutive days with at least one study session)
-            cursor.execute('''
-                WITH daily_sessions AS (
-                    SELECT 
-                        date(created_at) as study_date,
-                        COUNT(*) as session_count
-                    FROM study_sessions
-                    GROUP BY date(created_at)
-                ),
-                streak_calc AS (
-                    SELECT 
-                        study_date,
-                        julianday(study_date) - julianday(lag(study_date, 1) over (order by study_date)) as days_diff
-                    FROM daily_sessions
-                )
-                SELECT COUNT(*) as streak
-                FROM (
-                    SELECT study_date
-                    FROM streak_calc
-                    WHERE days_diff = 1 OR days_diff IS NULL
-                    ORDER BY study_date DESC
-                )
-            ''')
-            current_streak = cursor.fetchone()["streak"]
-            
             return jsonify({
-                "total_vocabulary": total_vocabulary,
-                "total_words_studied": total_words,
-                "mastered_words": mastered_words,
+                "total_vocabulary": summary["total_vocabulary"],
+                "total_words_studied": summary["words_studied"],
+                "mastered_words": summary["mastered_words"],
                 "success_rate": success_rate,
-                "total_sessions": total_sessions,
+                "total_sessions": summary["total_sessions"],
                 "active_groups": active_groups,
-                "current_streak": current_streak
+                "current_streak": stats.current_streak(cursor),
+                "longest_streak": summary["longest_streak"]
             })
             
         except Exception as e:
             return jsonify({"error": str(e)}), 500
+
+    @app.route('/dashboard/heatmap', methods=['GET'])
+    @cross_origin()
+    def get_activity_heatmap():
+        try:
+            days = request.args.get('days', 365, type=int)
+            if days < 1 or days > MAX_HEATMAP_DAYS:
+                return jsonify({"error": f"days must be between 1 and {MAX_HEATMAP_DAYS}"}), 400
+
+            # One range scan over the daily rollup; days without activity
+            # are left out
+            end = date.today()
+            start = end - timedelta(days=days - 1)
+            cursor = app.db.cursor()
+            cursor.execute('''
+                SELECT date, sessions, reviews, correct, wrong
+                FROM daily_activity
+                WHERE date BETWEEN ? AND ?
+                ORDER BY date
+            ''', (start.isoformat(), end.isoformat()))
+
+            return jsonify({
+                "start": start.isoformat(),
+                "end": end.isoformat(),
+                "days": [dict(row) for row in cursor.fetchall()],
+                "current_streak": stats.current_streak(cursor, end),
+                "longest_streak": stats.read(cursor)["longest_streak"]
+            })
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @app.route('/dashboard/learners', methods=['GET'])
+    @cross_origin()
+    @app.response_cache.cached('sessions', 'reviews')
+    def get_learners_stats():
+        try:
+            days = request.args.get('days', 30, type=int)
+            if days < 1 or days > MAX_HEATMAP_DAYS:
+                return jsonify({"error": f"days must be between 1 and {MAX_HEATMAP_DAYS}"}), 400
+
+            # Summed over the main database and every learner shard, read in
+            # parallel from their summary tables
+            return jsonify(shards.aggregate(
+                app.db,
+                days=days,
+                workers=app.config.get('SHARD_FANOUT_WORKERS', shards.FANOUT_WORKERS)
+            ))
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
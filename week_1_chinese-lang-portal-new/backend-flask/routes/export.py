@@ -0,0 +1,135 @@
+from flask import request, jsonify, Response, g
+from flask_cors import cross_origin
+import zlib
+
+from lib.reviews import parse_answered_at
+
+# Rows fetched from the database per step; memory use stays flat however
+# large the export is
+EXPORT_BATCH_SIZE = 1000
+
+def load(app):
+  def stream(sql, params):
+    # Each export reads one snapshot through its own read-only connection,
+    # so it is not tied to the request connection closed at teardown. The
+    # query returns every line as a ready-made JSON object
+    compress = request.accept_encodings['gzip'] > 0
+    # The learner's shard, created on first use by the request connection
+    shard = g.get('shard')
+    if shard is not None:
+      app.db.get()
+
+    def generate():
+      connection = app.db.connect(readonly=True, shard=shard)
+      compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+      try:
+        connection.execute('BEGIN')
+        cursor = connection.execute(sql, params)
+        while True:
+          rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+          if not rows:
+            break
+          chunk = ''.join(row[0] + '\n' for row in rows).encode('utf-8')
+          if compressor:
+            chunk = compressor.compress(chunk)
+          if chunk:
+            yield chunk
+        if compressor:
+          yield compressor.flush()
+      finally:
+        connection.close()
+
+    response = Response(generate(), mimetype='application/x-ndjson')
+    response.vary.add('Accept-Encoding')
+    if compress:
+      response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+  def parse_since():
+    # Returns the normalized since= timestamp, or None when absent
+    since = request.args.get('since')
+    return parse_answered_at(since) if since else None
+
+  @app.route('/export/words.ndjson', methods=['GET'])
+  @cross_origin()
+  def export_words():
+    try:
+      since = parse_since()
+    except ValueError:
+      return jsonify({"error": "since must be an ISO 8601 timestamp"}), 400
+
+    # With since=, only the words reviewed from then on (with their current counts)
+    where = ''
+    params = ()
+    if since:
+      where = 'WHERE w.id IN (SELECT word_id FROM word_review_items WHERE created_at >= ?)'
+      params = (since,)
+
+    return stream(f'''
+      SELECT json_object(
+        'id', w.id,
+        'kanji', w.kanji,
+        'romaji', w.romaji,
+        'english', w.english,
+        'parts', json(w.parts),
+        'group_ids', (SELECT json_group_array(wg.group_id) FROM word_groups wg WHERE wg.word_id = w.id),
+        'correct_count', w.correct_count,
+        'wrong_count', w.wrong_count,
+        'last_reviewed', w.last_reviewed
+      )
+      FROM words w
+      {where}
+      ORDER BY w.id
+    ''', params)
+
+  @app.route('/export/reviews.ndjson', methods=['GET'])
+  @cross_origin()
+  def export_reviews():
+    try:
+      since = parse_since()
+    except ValueError:
+      return jsonify({"error": "since must be an ISO 8601 timestamp"}), 400
+    after_id = request.args.get('after_id')
+    if after_id is not None:
+      if since is not None:
+        return jsonify({"error": "after_id resumes a sync on its own; drop since"}), 400
+      if not after_id.isdigit():
+        return jsonify({"error": "after_id must be a review id"}), 400
+      after_id = int(after_id)
+      # Ids are never reused, so any id up to the last one handed out is a
+      # valid cursor, even once its review has been archived or reset
+      row = app.db.cursor().execute(
+        "SELECT seq FROM sqlite_sequence WHERE name = 'word_review_items'"
+      ).fetchone()
+      if after_id > (row[0] if row else 0):
+        return jsonify({"error": "after_id is not a known review id"}), 400
+
+    # since= filters on created_at, which is the answered_at time of batch
+    # reviews, so reviews posted later with an older answered_at fall behind
+    # it. after_id follows the insert order instead and misses nothing.
+    where = ''
+    order = 'wri.created_at, wri.id'
+    params = ()
+    if after_id is not None:
+      where = 'WHERE wri.id > ?'
+      order = 'wri.id'
+      params = (after_id,)
+    elif since:
+      where = 'WHERE wri.created_at >= ?'
+      params = (since,)
+
+    return stream(f'''
+      SELECT json_object(
+        'id', wri.id,
+        'word_id', wri.word_id,
+        'study_session_id', wri.study_session_id,
+        'group_id', ss.group_id,
+        'study_activity_id', ss.study_activity_id,
+        'correct', json(CASE WHEN wri.correct THEN 'true' ELSE 'false' END),
+        'created_at', wri.created_at
+      )
+      FROM word_review_items wri
+      LEFT JOIN study_sessions ss ON ss.id = wri.study_session_id
+      {where}
+      ORDER BY {order}
+    ''', params)
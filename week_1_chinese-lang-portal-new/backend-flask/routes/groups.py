@@ -1,10 +1,26 @@
-from flask import request, jsonify, g
+from flask import request, jsonify, g, Response
 from flask_cors import cross_origin
+from datetime import datetime, timezone
 import json
+import random
+
+from lib.cache import VersionedBodyCache
+from lib.compression import encoded
+
+from lib.pagination import decode_cursor, keyset_condition, next_cursor
+from routes.words import WORD_SORT_COLUMNS, format_word
+
+# Upper bound for GET /groups/<id>/words/sample?n=
+MAX_SAMPLE_WORDS = 100
+
+# End time shown for a session: its last review, or 30 minutes after the
+# start without any. Indexed as is by migration 016, for sort_by=endTime
+SESSION_END_TIME = "COALESCE(s.last_activity_at, datetime(s.created_at, '+30 minutes'))"
 
 def load(app):
   @app.route('/groups', methods=['GET'])
   @cross_origin()
+  @app.response_cache.cached('groups')
   def get_groups():
     try:
       cursor = app.db.cursor()
@@ -60,6 +76,7 @@ def load(app):
 
   @app.route('/groups/<int:id>', methods=['GET'])
   @cross_origin()
+  @app.response_cache.cached('groups')
   def get_group(id):
     try:
       cursor = app.db.cursor()
@@ -85,6 +102,7 @@ def load(app):
 
   @app.route('/groups/<int:id>/words', methods=['GET'])
   @cross_origin()
+  @app.response_cache.cached('groups', 'words', 'reviews')
   def get_group_words(id):
     try:
       cursor = app.db.cursor()
@@ -99,28 +117,53 @@ def load(app):
       order = request.args.get('order', 'asc')
 
       # Validate sort parameters
-      valid_columns = ['kanji', 'romaji', 'english', 'correct_count', 'wrong_count']
-      if sort_by not in valid_columns:
+      if sort_by not in WORD_SORT_COLUMNS:
         sort_by = 'kanji'
       if order not in ['asc', 'desc']:
         order = 'asc'
 
       # First, check if the group exists
-      cursor.execute('SELECT name FROM groups WHERE id = ?', (id,))
+      cursor.execute('SELECT name, words_count FROM groups WHERE id = ?', (id,))
       group = cursor.fetchone()
       if not group:
         return jsonify({"error": "Group not found"}), 404
 
-      # Query to fetch words with pagination and sorting
+      # Keyset pagination: continue after the (sort key, id) of the last row
+      if 'cursor' in request.args:
+        try:
+          after = decode_cursor(request.args.get('cursor'))
+        except ValueError as e:
+          return jsonify({"error": str(e)}), 400
+
+        sort_expr = WORD_SORT_COLUMNS[sort_by]
+        condition, params = keyset_condition(sort_expr, 'w.id', order, after)
+        cursor.execute(f'''
+          SELECT w.id, w.kanji, w.romaji, w.english,
+                 w.correct_count, w.wrong_count, w.accuracy, w.last_reviewed,
+                 {sort_expr} AS sort_key
+          FROM words w
+          JOIN word_groups wg ON w.id = wg.word_id
+          WHERE wg.group_id = ? AND {condition}
+          ORDER BY {sort_expr} {order}, w.id {order}
+          LIMIT ?
+        ''', (id,) + params + (words_per_page + 1,))
+        words, cursor_token = next_cursor(cursor.fetchall(), words_per_page, 'sort_key')
+
+        # The total comes from the groups.words_count counter cache
+        return jsonify({
+          'words': [format_word(word) for word in words],
+          'next_cursor': cursor_token,
+          'total_words': group["words_count"]
+        })
+
+      # Query to fetch words with pagination and sorting. Only the group's
+      # own rows are sorted, reading the counters kept on words
       cursor.execute(f'''
-        SELECT w.*, 
-               COALESCE(wr.correct_count, 0) as correct_count,
-               COALESCE(wr.wrong_count, 0) as wrong_count
+        SELECT w.*
         FROM words w
         JOIN word_groups wg ON w.id = wg.word_id
-        LEFT JOIN word_reviews wr ON w.id = wr.word_id
         WHERE wg.group_id = ?
-        ORDER BY {sort_by} {order}
+        ORDER BY {WORD_SORT_COLUMNS[sort_by]} {order}, w.id {order}
         LIMIT ? OFFSET ?
       ''', (id, words_per_page, offset))
       
@@ -136,16 +179,7 @@ def load(app):
       total_pages = (total_words + words_per_page - 1) // words_per_page
 
       # Format the response
-      words_data = []
-      for word in words:
-        words_data.append({
-          "id": word["id"],
-          "kanji": word["kanji"],
-          "romaji": word["romaji"],
-          "english": word["english"],
-          "correct_count": word["correct_count"],
-          "wrong_count": word["wrong_count"]
-        })
+      words_data = [format_word(word) for word in words]
 
       return jsonify({
         'words': words_data,
@@ -155,52 +189,122 @@ def load(app):
     except Exception as e:
       return jsonify({"error": str(e)}), 500
 
+  @app.route('/groups/<int:id>/words/sample', methods=['GET'])
+  @cross_origin()
+  def get_group_words_sample(id):
+    try:
+      n = min(max(request.args.get('n', 10, type=int), 1), MAX_SAMPLE_WORDS)
+
+      cursor = app.db.cursor()
+      cursor.execute('SELECT id FROM groups WHERE id = ?', (id,))
+      if not cursor.fetchone():
+        return jsonify({"error": "Group not found"}), 404
+
+      # Members are numbered 1..size without gaps (migration 013), so a
+      # sample is a set of random positions, each one index lookup
+      cursor.execute('SELECT COALESCE(MAX(position), 0) FROM word_groups WHERE group_id = ?', (id,))
+      size = cursor.fetchone()[0]
+      positions = random.sample(range(1, size + 1), min(n, size))
+      cursor.execute('''
+        SELECT w.id, w.kanji, w.romaji, w.english, w.parts
+        FROM json_each(?) j
+        JOIN word_groups wg ON wg.group_id = ? AND wg.position = j.value
+        JOIN words w ON w.id = wg.word_id
+        ORDER BY j.key
+      ''', (json.dumps(positions), id))
+
+      return jsonify({
+        'group_id': id,
+        'words': [{
+          "id": word["id"],
+          "kanji": word["kanji"],
+          "romaji": word["romaji"],
+          "english": word["english"],
+          "parts": app.json.fragment(word["parts"])
+        } for word in cursor.fetchall()]
+      })
+    except Exception as e:
+      return jsonify({"error": str(e)}), 500
+
+  # Serialized /words/raw bodies per group version
+  raw_words_cache = VersionedBodyCache(app.config.get('RAW_WORDS_CACHE_SIZE', 64))
+
   @app.route('/api/groups/<int:id>/words/raw', methods=['GET'])
   @cross_origin()
   def get_group_words_raw(id):
     try:
       cursor = app.db.cursor()
 
-      # First, check if the group exists
-      cursor.execute('SELECT name FROM groups WHERE id = ?', (id,))
+      # Read the group and its data version in the same snapshot as the words
+      cursor.execute('BEGIN')
+      cursor.execute('''
+        SELECT g.name, v.version, v.updated_at
+        FROM groups g
+        LEFT JOIN group_versions v ON v.group_id = g.id
+        WHERE g.id = ?
+      ''', (id,))
       group = cursor.fetchone()
       if not group:
         return jsonify({"error": "Group not found"}), 404
 
-      # SQL query to fetch words along with group information
-      cursor.execute('''
-        SELECT g.id as group_id, g.name as group_name, w.*
-        FROM groups g
-        JOIN word_groups wg ON g.id = wg.group_id
-        JOIN words w ON w.id = wg.word_id
-        WHERE g.id = ?;
-      ''', (id,))
-      
-      data = cursor.fetchall()
-      
-      # Format the response
-      result = {
-        "group_id": id,
-        "group_name": data[0]["group_name"] if data else group["name"],
-        "words": []
-      }
-      
-      for row in data:
-        word = {
-          "id": row["id"],
-          "kanji": row["kanji"],
-          "romaji": row["romaji"],
-          "english": row["english"],
-          "parts": json.loads(row["parts"])  # Deserialize 'parts' field
-        }
-        result["words"].append(word)
-      
-      return jsonify(result)
+      # The version is bumped on every change to the group's words, so it
+      # doubles as a strong validator
+      version = group["version"] or 0
+      etag = f'group-{id}-v{version}'
+      last_modified = None
+      if group["updated_at"]:
+        last_modified = datetime.strptime(group["updated_at"], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+      # Every encoding of the body gets its own tag; any of them validates
+      # the same version
+      encoding = app.compression.accepted()
+
+      def conditional(response, encoding):
+        response.set_etag(f'{etag}-{encoding}' if encoding else etag)
+        response.last_modified = last_modified
+        # Clients may keep the body but must revalidate before using it
+        response.cache_control.no_cache = True
+        return encoded(response, encoding)
+
+      if request.if_none_match:
+        tags = [etag] + [f'{etag}-{name}' for name in app.compression.encodings]
+        if any(request.if_none_match.contains(tag) for tag in tags):
+          return conditional(Response(status=304), encoding)
+      elif last_modified and request.if_modified_since and last_modified <= request.if_modified_since:
+        return conditional(Response(status=304), encoding)
+
+      def build():
+        # SQLite builds the words array itself, with the stored parts JSON
+        # embedded as is, so no Python object is made per word
+        cursor.execute('''
+          SELECT json_group_array(json_object(
+            'english', english, 'id', id, 'kanji', kanji, 'parts', json(parts), 'romaji', romaji
+          ))
+          FROM (
+            SELECT w.id, w.kanji, w.romaji, w.english, w.parts
+            FROM word_groups wg
+            JOIN words w ON w.id = wg.word_id
+            WHERE wg.group_id = ?
+            ORDER BY wg.word_id
+          )
+        ''', (id,))
+        words = cursor.fetchone()[0]
+        body = '{"group_id":%d,"group_name":%s,"words":%s}\n' % (id, json.dumps(group["name"]), words)
+        return body.encode('utf-8')
+
+      # Plain and compressed bodies are cached per group version
+      body, encoding = app.compression.versioned(raw_words_cache, id, version, build)
+      return conditional(Response(body, mimetype='application/json'), encoding)
     except Exception as e:
       return jsonify({"error": str(e)}), 500
+    finally:
+      # End the read snapshot
+      if app.db.get().in_transaction:
+        app.db.get().rollback()
 
   @app.route('/groups/<int:id>/study_sessions', methods=['GET'])
   @cross_origin()
+  @app.response_cache.cached('sessions', 'reviews', 'groups')
   def get_group_study_sessions(id):
     try:
       cursor = app.db.cursor()
@@ -216,15 +320,17 @@ def load(app):
 
       # Map frontend sort keys to database columns
       sort_mapping = {
-        'startTime': 'created_at',
-        'endTime': 'last_activity_time',
+        'startTime': 's.created_at',
+        'endTime': SESSION_END_TIME,
         'activityName': 'a.name',
         'groupName': 'g.name',
-        'reviewItemsCount': 'review_count'
+        'reviewItemsCount': 's.review_items_count'
       }
 
       # Use mapped sort column or default to created_at
-      sort_column = sort_mapping.get(sort_by, 'created_at')
+      sort_column = sort_mapping.get(sort_by, 's.created_at')
+      if order not in ['asc', 'desc']:
+        order = 'desc'
 
       # Get total count for pagination
       cursor.execute('''
@@ -235,30 +341,22 @@ def load(app):
       total_sessions = cursor.fetchone()[0]
       total_pages = (total_sessions + sessions_per_page - 1) // sessions_per_page
 
-      # Get study sessions for this group with dynamic calculations
+      # Get study sessions for this group from their maintained summaries
       cursor.execute(f'''
         SELECT 
           s.id,
           s.group_id,
           s.study_activity_id,
           s.created_at as start_time,
-          (
-            SELECT MAX(created_at)
-            FROM word_review_items
-            WHERE study_session_id = s.id
-          ) as last_activity_time,
+          {SESSION_END_TIME} as end_time,
           a.name as activity_name,
           g.name as group_name,
-          (
-            SELECT COUNT(*)
-            FROM word_review_items
-            WHERE study_session_id = s.id
-          ) as review_count
+          s.review_items_count
         FROM study_sessions s
         JOIN study_activities a ON s.study_activity_id = a.id
         JOIN groups g ON s.group_id = g.id
         WHERE s.group_id = ?
-        ORDER BY {sort_column} {order}
+        ORDER BY {sort_column} {order}, s.id {order}
         LIMIT ? OFFSET ?
       ''', (id, sessions_per_page, offset))
       
@@ -266,11 +364,6 @@ def load(app):
       sessions_data = []
       
       for session in sessions:
-        # If there's no last_activity_time, use start_time + 30 minutes
-        end_time = session["last_activity_time"]
-        if not end_time:
-            end_time = cursor.execute('SELECT datetime(?, "+30 minutes")', (session["start_time"],)).fetchone()[0]
-        
         sessions_data.append({
           "id": session["id"],
           "group_id": session["group_id"],
@@ -278,8 +371,8 @@ def load(app):
           "study_activity_id": session["study_activity_id"],
           "activity_name": session["activity_name"],
           "start_time": session["start_time"],
-          "end_time": end_time,
-          "review_items_count": session["review_count"]
+          "end_time": session["end_time"],
+          "review_items_count": session["review_items_count"]
         })
 
       return jsonify({
@@ -0,0 +1,11 @@
+from flask import Response, jsonify
+from flask_cors import cross_origin
+
+def load(app):
+  @app.route('/metrics', methods=['GET'])
+  @cross_origin()
+  def get_metrics():
+    # Prometheus scrape endpoint; counters are per worker process
+    if app.metrics is None:
+      return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(app.metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -1,7 +1,31 @@
 from flask import request, jsonify, g
 from flask_cors import cross_origin
 from datetime import datetime
+import json
 import math
+import time
+
+from lib import history, reviews, schedule, stats, word_sets
+from lib.pagination import decode_cursor, keyset_condition, next_cursor, wants_total
+from lib.review_buffer import BufferFull
+from routes.words import lookup_words
+
+# Upper bound for GET /study_sessions/<id>/words?limit=
+MAX_SET_WORDS = 500
+
+def format_session(session):
+  return {
+    'id': session['id'],
+    'group_id': session['group_id'],
+    'group_name': session['group_name'],
+    'activity_id': session['activity_id'],
+    'activity_name': session['activity_name'],
+    'start_time': session['created_at'],
+    'end_time': session['last_activity_at'] or session['created_at'],
+    'review_items_count': session['review_items_count'],
+    'correct_count': session['correct_count'],
+    'wrong_count': session['wrong_count']
+  }
 
 def load(app):
   @app.route('/study_sessions', methods=['POST'])
@@ -15,6 +39,16 @@ def load(app):
       group_id = data.get('group_id')
       study_activity_id = data.get('study_activity_id')
 
+      # A session can study a set expression over groups and review states
+      # instead of one group; it is filed under the first group it names
+      expression = data.get('word_set')
+      if expression is not None:
+        try:
+          group_ids = word_sets.parse(expression)
+        except word_sets.InvalidExpression as e:
+          return jsonify({"error": str(e)}), 400
+        group_id = group_id or (group_ids[0] if group_ids else None)
+
       # Validate that group_id is provided
       if not group_id:
         return jsonify({"error": "group_id is required"}), 400
@@ -36,23 +70,43 @@ def load(app):
       if not study_activity:
         return jsonify({"error": "Study activity not found"}), 404
 
+      # Resolve the word set once, from the cached bitmaps
+      if expression is not None:
+        try:
+          bits = app.word_sets.resolve(cursor, expression)
+        except KeyError:
+          return jsonify({"error": "Group not found"}), 404
+
       # Insert the study session
+      created_at = datetime.now()
       cursor.execute('''
         INSERT INTO study_sessions (group_id, study_activity_id, created_at)
         VALUES (?, ?, ?)
-      ''', (group_id, study_activity_id, datetime.now()))
-      
-      app.db.commit()
+      ''', (group_id, study_activity_id, created_at))
       
       # Get the id of the newly created session
       session_id = cursor.lastrowid
 
-      return jsonify({"session_id": session_id}), 201
+      # Keep the resolved word set with the session
+      result = {"session_id": session_id}
+      if expression is not None:
+        result['word_count'] = bits.bit_count()
+        cursor.execute('''
+          INSERT INTO study_session_word_sets (session_id, expression, word_count, bitmap)
+          VALUES (?, ?, ?, ?)
+        ''', (session_id, json.dumps(expression), result['word_count'], word_sets.compress(bits)))
+
+      stats.record_session(cursor, created_at)
+      app.db.commit()
+      app.response_cache.invalidate('sessions')
+
+      return jsonify(result), 201
     except Exception as e:
       return jsonify({"error": str(e)}), 500
 
   @app.route('/api/study-sessions', methods=['GET'])
   @cross_origin()
+  @app.response_cache.cached('sessions', 'reviews', 'groups')
   def get_study_sessions():
     try:
       cursor = app.db.cursor()
@@ -62,16 +116,51 @@ def load(app):
       per_page = request.args.get('per_page', 10, type=int)
       offset = (page - 1) * per_page
 
+      # Keyset pagination: newest first, continuing after (created_at, id)
+      if 'cursor' in request.args:
+        try:
+          after = decode_cursor(request.args.get('cursor'))
+        except ValueError as e:
+          return jsonify({"error": str(e)}), 400
+
+        condition, params = keyset_condition('ss.created_at', 'ss.id', 'desc', after)
+        cursor.execute(f'''
+          SELECT 
+            ss.id,
+            ss.group_id,
+            g.name as group_name,
+            sa.id as activity_id,
+            sa.name as activity_name,
+            ss.created_at,
+            ss.review_items_count,
+            ss.correct_count,
+            ss.wrong_count,
+            ss.last_activity_at
+          FROM study_sessions ss
+          JOIN groups g ON g.id = ss.group_id
+          JOIN study_activities sa ON sa.id = ss.study_activity_id
+          WHERE {condition}
+          ORDER BY ss.created_at DESC, ss.id DESC
+          LIMIT ?
+        ''', params + (per_page + 1,))
+        sessions, cursor_token = next_cursor(cursor.fetchall(), per_page, 'created_at')
+
+        result = {
+          'items': [format_session(session) for session in sessions],
+          'per_page': per_page,
+          'next_cursor': cursor_token
+        }
+        if wants_total(request.args):
+          cursor.execute('SELECT COUNT(*) FROM study_sessions')
+          result['total'] = cursor.fetchone()[0]
+        return jsonify(result)
+
       # Get total count
-      cursor.execute('''
-        SELECT COUNT(*) as count 
-        FROM study_sessions ss
-        JOIN groups g ON g.id = ss.group_id
-        JOIN study_activities sa ON sa.id = ss.study_activity_id
-      ''')
+      cursor.execute('SELECT COUNT(*) as count FROM study_sessions')
       total_count = cursor.fetchone()['count']
 
-      # Get paginated sessions
+      # Get paginated sessions with their maintained review summaries; the
+      # created_at index drives the page
       cursor.execute('''
         SELECT 
           ss.id,
@@ -80,28 +169,20 @@ def load(app):
           sa.id as activity_id,
           sa.name as activity_name,
           ss.created_at,
-          COUNT(wri.id) as review_items_count
+          ss.review_items_count,
+          ss.correct_count,
+          ss.wrong_count,
+          ss.last_activity_at
         FROM study_sessions ss
         JOIN groups g ON g.id = ss.group_id
         JOIN study_activities sa ON sa.id = ss.study_activity_id
-        LEFT JOIN word_review_items wri ON wri.study_session_id = ss.id
-        GROUP BY ss.id
         ORDER BY ss.created_at DESC
         LIMIT ? OFFSET ?
       ''', (per_page, offset))
       sessions = cursor.fetchall()
 
       return jsonify({
-        'items': [{
-          'id': session['id'],
-          'group_id': session['group_id'],
-          'group_name': session['group_name'],
-          'activity_id': session['activity_id'],
-          'activity_name': session['activity_name'],
-          'start_time': session['created_at'],
-          'end_time': session['created_at'],  # For now, just use the same time since we don't track end time
-          'review_items_count': session['review_items_count']
-        } for session in sessions],
+        'items': [format_session(session) for session in sessions],
         'total': total_count,
         'page': page,
         'per_page': per_page,
@@ -112,6 +193,7 @@ def load(app):
 
   @app.route('/api/study-sessions/<id>', methods=['GET'])
   @cross_origin()
+  @app.response_cache.cached('sessions', 'reviews', 'groups', 'words')
   def get_study_session(id):
     try:
       cursor = app.db.cursor()
@@ -125,19 +207,31 @@ def load(app):
           sa.id as activity_id,
           sa.name as activity_name,
           ss.created_at,
-          COUNT(wri.id) as review_items_count
+          ss.review_items_count,
+          ss.correct_count,
+          ss.wrong_count,
+          ss.last_activity_at,
+          ss.archived_at
         FROM study_sessions ss
         JOIN groups g ON g.id = ss.group_id
         JOIN study_activities sa ON sa.id = ss.study_activity_id
-        LEFT JOIN word_review_items wri ON wri.study_session_id = ss.id
         WHERE ss.id = ?
-        GROUP BY ss.id
       ''', (id,))
       
       session = cursor.fetchone()
       if not session:
         return jsonify({"error": "Study session not found"}), 404
 
+      # The review items of archived sessions are in the archive database
+      # (lib/history.py), when the app has it attached
+      review_items = 'word_review_items'
+      if session['archived_at'] and app.db.archive:
+        review_items = '''(
+          SELECT word_id, study_session_id, correct FROM main.word_review_items
+          UNION ALL
+          SELECT word_id, study_session_id, correct FROM archive.word_review_items
+        )'''
+
       # Get pagination parameters
       page = request.args.get('page', 1, type=int)
       per_page = request.args.get('per_page', 10, type=int)
@@ -150,12 +244,12 @@ def load(app):
           COALESCE(SUM(CASE WHEN wri.correct = 1 THEN 1 ELSE 0 END), 0) as session_correct_count,
           COALESCE(SUM(CASE WHEN wri.correct = 0 THEN 1 ELSE 0 END), 0) as session_wrong_count
         FROM words w
-        JOIN word_review_items wri ON wri.word_id = w.id
+        JOIN {review_items} wri ON wri.word_id = w.id
         WHERE wri.study_session_id = ?
         GROUP BY w.id
         ORDER BY w.kanji
         LIMIT ? OFFSET ?
-      ''', (id, per_page, offset))
+      '''.format(review_items=review_items), (id, per_page, offset))
       
       words = cursor.fetchall()
 
@@ -163,23 +257,14 @@ def load(app):
       cursor.execute('''
         SELECT COUNT(DISTINCT w.id) as count
         FROM words w
-        JOIN word_review_items wri ON wri.word_id = w.id
+        JOIN {review_items} wri ON wri.word_id = w.id
         WHERE wri.study_session_id = ?
-      ''', (id,))
+      '''.format(review_items=review_items), (id,))
       
       total_count = cursor.fetchone()['count']
 
       return jsonify({
-        'session': {
-          'id': session['id'],
-          'group_id': session['group_id'],
-          'group_name': session['group_name'],
-          'activity_id': session['activity_id'],
-          'activity_name': session['activity_name'],
-          'start_time': session['created_at'],
-          'end_time': session['created_at'],  # For now, just use the same time
-          'review_items_count': session['review_items_count']
-        },
+        'session': format_session(session),
         'words': [{
           'id': word['id'],
           'kanji': word['kanji'],
@@ -196,6 +281,80 @@ def load(app):
     except Exception as e:
       return jsonify({"error": str(e)}), 500
 
+  @app.route('/study_sessions/<id>/next', methods=['GET'])
+  @cross_origin()
+  def get_next_words(id):
+    try:
+      n = min(max(request.args.get('n', 10, type=int), 1), schedule.MAX_DUE_WORDS)
+
+      cursor = app.db.cursor()
+      cursor.execute('SELECT group_id FROM study_sessions WHERE id = ?', (id,))
+      session = cursor.fetchone()
+      if not session:
+        return jsonify({"error": "Study session not found"}), 404
+
+      # The most-due words of the session's group, read from the schedule
+      # index instead of the whole group, or of its word set
+      bits = app.word_sets.session(cursor, int(id))
+      if bits is None:
+        words = schedule.due_words(cursor, session['group_id'], n)
+      else:
+        words = app.word_sets.due_words(cursor, bits, n)
+      return jsonify({
+        'session_id': int(id),
+        'group_id': session['group_id'],
+        'words': [{
+          'id': word['id'],
+          'kanji': word['kanji'],
+          'romaji': word['romaji'],
+          'english': word['english'],
+          'parts': app.json.fragment(word['parts']),
+          'due_at': word['due_at']
+        } for word in words]
+      })
+    except Exception as e:
+      return jsonify({"error": str(e)}), 500
+
+  @app.route('/study_sessions/<int:id>/words', methods=['GET'])
+  @cross_origin()
+  def get_session_words(id):
+    try:
+      after_id = request.args.get('after_id', 0, type=int)
+      limit = min(max(request.args.get('limit', 100, type=int), 1), MAX_SET_WORDS)
+
+      cursor = app.db.cursor()
+      cursor.execute('SELECT group_id FROM study_sessions WHERE id = ?', (id,))
+      session = cursor.fetchone()
+      if not session:
+        return jsonify({"error": "Study session not found"}), 404
+
+      # The words of the session's set in id order, or of its group for a
+      # single group session
+      bits = app.word_sets.session(cursor, id)
+      if bits is None:
+        cursor.execute('''
+          SELECT word_id FROM word_groups
+          WHERE group_id = ? AND word_id > ?
+          ORDER BY word_id LIMIT ?
+        ''', (session['group_id'], after_id, limit + 1))
+        ids = [row[0] for row in cursor.fetchall()]
+        total = None
+      else:
+        ids = word_sets.members(bits, after=after_id, limit=limit + 1)
+        total = bits.bit_count()
+
+      has_more = len(ids) > limit
+      ids = ids[:limit]
+      return jsonify({
+        'session_id': id,
+        'group_id': session['group_id'],
+        'words': lookup_words(cursor, ids)['words'],
+        'word_count': total,
+        'next_after_id': ids[-1] if has_more else None
+      })
+    except Exception as e:
+      return jsonify({"error": str(e)}), 500
+
   @app.route('/study_sessions/<id>/review', methods=['POST'])
   @cross_origin()
   def log_review(id):
@@ -206,6 +365,10 @@ def load(app):
         
     if word_id is None or correct is None:
         return jsonify({"error": "word_id and correct fields are required"}), 400
+    try:
+        correct = reviews.parse_correct(correct)
+    except ValueError:
+        return jsonify({"error": "correct must be true, false, 0 or 1"}), 400
 
     # Check if word exists
     cursor.execute('SELECT id FROM words WHERE id = ?', (word_id,))
@@ -217,51 +380,107 @@ def load(app):
     if not cursor.fetchone():
         return jsonify({"error": "Study session not found"}), 404
 
-    # Insert the individual review attempt into word_review_items
-    cursor.execute('''
-        INSERT INTO word_review_items (word_id, correct, study_session_id) VALUES (?, ?, ?)
-    ''', (word_id, correct, id))
-    
-    # Update or insert aggregate review record in word_reviews
-    cursor.execute('''
-        SELECT * FROM word_reviews WHERE word_id = ?
-    ''', (word_id,))
-    review = cursor.fetchone()
-
-    if review:
-        # Update existing record
-        if correct:
-            cursor.execute('''
-           UPDATE word_reviews SET correct_count = correct_count + 1, last_reviewed = ? WHERE word_id = ?
-            ''', (datetime.now(), word_id))
-        else:
-            cursor.execute('''
-                UPDATE word_reviews SET wrong_count = wrong_count + 1, last_reviewed = ? WHERE word_id = ?
-            ''', (datetime.now(), word_id))
-    else:
-        # Insert new record
-        cursor.execute('''
-            INSERT INTO word_reviews (word_id, correct_count, wrong_count, last_reviewed)
-            VALUES (?, ?, ?, ?)
-        ''', (word_id, 1 if correct else 0, 0 if correct else 1, datetime.now()))
+    # In write-behind mode the review is queued and written by the flusher.
+    # The buffer writes to the main database, so learner shards skip it
+    if app.review_buffer is not None and g.get('shard') is None:
+        try:
+            app.review_buffer.submit(id, word_id, correct)
+        except BufferFull:
+            return jsonify({"error": "Too many reviews queued, retry shortly"}), 503
+        return jsonify({"message": "Review queued"}), 202
+
+    # Record the attempt and fold it into the per-word and dashboard counters
+    reviews.record_reviews(cursor, id, [(word_id, correct, None)])
 
     app.db.commit()
+    app.response_cache.invalidate('reviews', 'sessions')
     return jsonify({"message": "Review logged successfully"})
 
-  @app.route('/api/study-sessions/reset', methods=['POST'])
+  @app.route('/study_sessions/<id>/reviews', methods=['POST'])
   @cross_origin()
-  def reset_study_sessions():
+  def log_reviews(id):
     try:
+      items = request.get_json(silent=True)
+      if not isinstance(items, list) or not items:
+        return jsonify({"error": "A non-empty array of reviews is required"}), 400
+      if len(items) > reviews.MAX_BATCH_REVIEWS:
+        return jsonify({"error": f"At most {reviews.MAX_BATCH_REVIEWS} reviews per request"}), 400
+
+      # Validate the shape of every item before touching the database
+      batch = []
+      for index, item in enumerate(items):
+        if not isinstance(item, dict) or item.get('word_id') is None or item.get('correct') is None:
+          return jsonify({"error": f"Review {index}: word_id and correct fields are required"}), 400
+        if not isinstance(item['word_id'], int) or isinstance(item['word_id'], bool):
+          return jsonify({"error": f"Review {index}: word_id must be an integer"}), 400
+        try:
+          answered_at = reviews.parse_answered_at(item.get('answered_at'))
+        except ValueError:
+          return jsonify({"error": f"Review {index}: answered_at must be an ISO 8601 timestamp"}), 400
+        try:
+          correct = reviews.parse_correct(item['correct'])
+        except ValueError:
+          return jsonify({"error": f"Review {index}: correct must be true, false, 0 or 1"}), 400
+        batch.append((item['word_id'], correct, answered_at))
+
       cursor = app.db.cursor()
-      
-      # First delete all word review items since they have foreign key constraints
-      cursor.execute('DELETE FROM word_review_items')
-      
-      # Then delete all study sessions
-      cursor.execute('DELETE FROM study_sessions')
-      
+
+      # Check if study session exists
+      cursor.execute('SELECT id FROM study_sessions WHERE id = ?', (id,))
+      if not cursor.fetchone():
+        return jsonify({"error": "Study session not found"}), 404
+
+      # Check all words exist with a single query
+      missing = reviews.missing_word_ids(cursor, {word_id for word_id, _, _ in batch})
+      if missing:
+        return jsonify({"error": "Word not found", "word_ids": sorted(missing)}), 404
+
+      # Everything is written in one transaction
+      reviews.record_reviews(cursor, id, batch)
       app.db.commit()
-      
-      return jsonify({"message": "Study history cleared successfully"}), 200
+      app.response_cache.invalidate('reviews', 'sessions')
+
+      return jsonify({"message": "Reviews logged successfully", "count": len(batch)}), 201
     except Exception as e:
-      return jsonify({"error": str(e)}), 500
\ No newline at end of file
+      return jsonify({"error": str(e)}), 500
+
+  @app.route('/api/review-buffer', methods=['GET'])
+  @cross_origin()
+  def get_review_buffer_metrics():
+    if app.review_buffer is None:
+      return jsonify({"error": "Review buffer is disabled"}), 404
+    return jsonify(app.review_buffer.metrics())
+
+  @app.route('/api/study-sessions/reset', methods=['POST'])
+  @cross_origin()
+  def reset_study_sessions():
+    try:
+      connection = app.db.get()
+
+      # The summary tables are cleared in one transaction; the history is
+      # deleted in short chunked transactions, here while the budget lasts
+      # and then in the background
+      history.start_reset(connection)
+      app.response_cache.invalidate('reviews', 'sessions')
+      deadline = time.monotonic() + app.config.get('RESET_BUDGET_MS', 500) / 1000
+      if history.run_reset(connection, deadline=deadline):
+        app.response_cache.invalidate('reviews', 'sessions')
+        return jsonify({"message": "Study history cleared successfully"}), 200
+
+      app.history_reset.start(g.get('shard'))
+      return jsonify({
+        "message": "Study history is being cleared",
+        "reset": history.reset_status(connection)
+      }), 202
+    except Exception as e:
+      return jsonify({"error": str(e)}), 500
+
+  @app.route('/api/study-sessions/reset', methods=['GET'])
+  @cross_origin()
+  def get_reset_status():
+    try:
+      status = history.reset_status(app.db.get())
+      status['running'] = app.history_reset.running()
+      return jsonify(status)
+    except Exception as e:
+      return jsonify({"error": str(e)}), 500
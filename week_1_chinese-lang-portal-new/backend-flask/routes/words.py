@@ -2,14 +2,103 @@ from flask import request, jsonify, g
 from flask_cors import cross_origin
 import json
 
+from lib import distractors
+from lib.autocomplete import MAX_SUGGESTIONS, AutocompleteIndex, normalize
+from lib.pagination import decode_cursor, keyset_condition, next_cursor, wants_total
+from lib.search import MAX_RANKED_MATCHES, MAX_SEARCH_RESULTS, match_query
+
+# Upper bound for one batch lookup (GET /words?ids= or POST /words/lookup)
+MAX_LOOKUP_IDS = 5000
+
+# Sort keys accepted by the word listings, mapped to the SQL they order by
+WORD_SORT_COLUMNS = {
+  'kanji': 'w.kanji',
+  'romaji': 'w.romaji',
+  'english': 'w.english',
+  'correct_count': 'w.correct_count',
+  'wrong_count': 'w.wrong_count',
+  # NULL until the first review; coalesced so that keyset cursors never
+  # compare against NULL. Unreviewed words sort first
+  'accuracy': 'COALESCE(w.accuracy, -1)',
+  'last_reviewed': "COALESCE(w.last_reviewed, '')"
+}
+
+def format_word(word):
+  return {
+    "id": word["id"],
+    "kanji": word["kanji"],
+    "romaji": word["romaji"],
+    "english": word["english"],
+    "correct_count": word["correct_count"],
+    "wrong_count": word["wrong_count"],
+    "accuracy": word["accuracy"],
+    "last_reviewed": word["last_reviewed"]
+  }
+
+def parse_word_ids(values):
+  # Validate a batch of word ids, keeping the first occurrence of each
+  if not values:
+    raise ValueError('ids is required')
+  ids = []
+  for value in values:
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+      raise ValueError('ids must be integers')
+    try:
+      ids.append(int(value))
+    except ValueError:
+      raise ValueError('ids must be integers')
+  ids = list(dict.fromkeys(ids))
+  if len(ids) > MAX_LOOKUP_IDS:
+    raise ValueError(f'At most {MAX_LOOKUP_IDS} ids per request')
+  return ids
+
+def lookup_words(cursor, ids):
+  # Resolve a list of word ids with one query for the words and one for
+  # their groups, in the order of the ids. Unknown ids are reported back.
+  id_list = json.dumps(ids)
+  cursor.execute('''
+    SELECT w.id, w.kanji, w.romaji, w.english,
+           w.correct_count, w.wrong_count, w.accuracy, w.last_reviewed
+    FROM json_each(?) j
+    JOIN words w ON w.id = j.value
+    ORDER BY j.key
+  ''', (id_list,))
+  words = {}
+  for word in cursor.fetchall():
+    words[word["id"]] = dict(format_word(word), groups=[])
+
+  cursor.execute('''
+    SELECT wg.word_id, g.id, g.name
+    FROM json_each(?) j
+    JOIN word_groups wg ON wg.word_id = j.value
+    JOIN groups g ON g.id = wg.group_id
+    ORDER BY j.key, g.id
+  ''', (id_list,))
+  for word_id, group_id, group_name in cursor.fetchall():
+    words[word_id]["groups"].append({"id": group_id, "name": group_name})
+
+  return {
+    "words": list(words.values()),
+    "missing": [word_id for word_id in ids if word_id not in words]
+  }
+
 def load(app):
   # Endpoint: GET /words with pagination (50 words per page)
   @app.route('/words', methods=['GET'])
   @cross_origin()
+  @app.response_cache.cached('words', 'groups', 'reviews')
   def get_words():
     try:
       cursor = app.db.cursor()
 
+      # Batch lookup of known ids: GET /words?ids=1,2,3
+      if 'ids' in request.args:
+        try:
+          ids = parse_word_ids([value for value in request.args.get('ids').split(',') if value])
+        except ValueError as e:
+          return jsonify({"error": str(e)}), 400
+        return jsonify(lookup_words(cursor, ids))
+
       # Get the current page number from query parameters (default is 1)
       page = int(request.args.get('page', 1))
       # Ensure page number is positive
@@ -22,20 +111,47 @@ def load(app):
       order = request.args.get('order', 'asc')  # Default to ascending order
 
       # Validate sort_by and order
-      valid_columns = ['kanji', 'romaji', 'english', 'correct_count', 'wrong_count']
-      if sort_by not in valid_columns:
+      if sort_by not in WORD_SORT_COLUMNS:
         sort_by = 'kanji'
       if order not in ['asc', 'desc']:
         order = 'asc'
 
-      # Query to fetch words with sorting
+      # Keyset pagination: continue after the (sort key, id) of the last row
+      if 'cursor' in request.args:
+        try:
+          after = decode_cursor(request.args.get('cursor'))
+        except ValueError as e:
+          return jsonify({"error": str(e)}), 400
+
+        sort_expr = WORD_SORT_COLUMNS[sort_by]
+        condition, params = keyset_condition(sort_expr, 'w.id', order, after)
+        cursor.execute(f'''
+          SELECT w.id, w.kanji, w.romaji, w.english,
+              w.correct_count, w.wrong_count, w.accuracy, w.last_reviewed,
+              {sort_expr} AS sort_key
+          FROM words w
+          WHERE {condition}
+          ORDER BY {sort_expr} {order}, w.id {order}
+          LIMIT ?
+        ''', params + (words_per_page + 1,))
+        words, cursor_token = next_cursor(cursor.fetchall(), words_per_page, 'sort_key')
+
+        result = {
+          "words": [format_word(word) for word in words],
+          "next_cursor": cursor_token
+        }
+        # Counting every word is the expensive part of a page, so it is opt-in
+        if wants_total(request.args):
+          cursor.execute('SELECT COUNT(*) FROM words')
+          result["total_words"] = cursor.fetchone()[0]
+        return jsonify(result)
+
+      # Query to fetch words with sorting; every sort key has an index
       cursor.execute(f'''
-        SELECT w.id, w.kanji, w.romaji, w.english, 
-            COALESCE(r.correct_count, 0) AS correct_count,
-            COALESCE(r.wrong_count, 0) AS wrong_count
+        SELECT w.id, w.kanji, w.romaji, w.english,
+            w.correct_count, w.wrong_count, w.accuracy, w.last_reviewed
         FROM words w
-        LEFT JOIN word_reviews r ON w.id = r.word_id
-        ORDER BY {sort_by} {order}
+        ORDER BY {WORD_SORT_COLUMNS[sort_by]} {order}, w.id {order}
         LIMIT ? OFFSET ?
       ''', (words_per_page, offset))
 
@@ -47,16 +163,7 @@ def load(app):
       total_pages = (total_words + words_per_page - 1) // words_per_page
 
       # Format the response
-      words_data = []
-      for word in words:
-        words_data.append({
-          "id": word["id"],
-          "kanji": word["kanji"],
-          "romaji": word["romaji"],
-          "english": word["english"],
-          "correct_count": word["correct_count"],
-          "wrong_count": word["wrong_count"]
-        })
+      words_data = [format_word(word) for word in words]
 
       return jsonify({
         "words": words_data,
@@ -70,53 +177,165 @@ def load(app):
     finally:
       app.db.close()
 
+  # Endpoint: GET /words/search?q= to find words by kanji, romaji or English
+  @app.route('/words/search', methods=['GET'])
+  @cross_origin()
+  @app.response_cache.cached('words', 'groups', 'reviews')
+  def search_words():
+    try:
+      text = request.args.get('q')
+      query = match_query(text)
+      if query is None:
+        return jsonify({"error": "q is required"}), 400
+      exact_query = match_query(text, prefix=False)
+      group_id = request.args.get('group_id', type=int)
+      limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_SEARCH_RESULTS)
+
+      # Optionally restrict the matches to one group
+      group_filter = ''
+      group_params = []
+      if group_id is not None:
+        group_filter = 'AND EXISTS (SELECT 1 FROM word_groups wg WHERE wg.word_id = words_fts.rowid AND wg.group_id = ?)'
+        group_params = [group_id]
+
+      # Whole-term matches rank above prefix matches, each tier by bm25.
+      # The exact tier keeps its MAX_RANKED_MATCHES best matches (rank is
+      # bm25). The prefix tier keeps the first ones in rowid order instead,
+      # as sorting every word under a one-letter prefix would cost a full
+      # scan; its ranking is only exact below the cap.
+      cursor = app.db.cursor()
+      cursor.execute(f'''
+        WITH exact AS (
+          SELECT rowid AS id, rank AS score FROM words_fts
+          WHERE words_fts MATCH ? {group_filter}
+          ORDER BY rank
+          LIMIT ?
+        ), prefixed AS (
+          SELECT rowid AS id, bm25(words_fts) AS score FROM words_fts
+          WHERE words_fts MATCH ? {group_filter}
+          LIMIT ?
+        ), matches AS (
+          SELECT id, MIN(tier) AS tier, MIN(score) AS score FROM (
+            SELECT id, 0 AS tier, score FROM exact
+            UNION ALL
+            SELECT id, 1 AS tier, score FROM prefixed
+          )
+          GROUP BY id
+        )
+        SELECT w.id, w.kanji, w.romaji, w.english,
+               w.correct_count, w.wrong_count, w.accuracy, w.last_reviewed
+        FROM matches m
+        JOIN words w ON w.id = m.id
+        ORDER BY m.tier, m.score, w.id
+        LIMIT ?
+      ''', [exact_query, *group_params, MAX_RANKED_MATCHES, query, *group_params, MAX_RANKED_MATCHES, limit])
+
+      words = [format_word(word) for word in cursor.fetchall()]
+      return jsonify({
+        'words': words,
+        'count': len(words)
+      })
+    except Exception as e:
+      return jsonify({"error": str(e)}), 500
+
+  # Prefix index over the normalized romaji, loaded on first use
+  autocomplete_index = AutocompleteIndex()
+
+  # Endpoint: GET /words/autocomplete?prefix= for search-as-you-type
+  @app.route('/words/autocomplete', methods=['GET'])
+  @cross_origin()
+  def autocomplete_words():
+    try:
+      prefix = normalize(request.args.get('prefix'))
+      if not prefix:
+        return jsonify({"error": "prefix is required"}), 400
+      limit = min(max(request.args.get('limit', 10, type=int), 1), MAX_SUGGESTIONS)
+
+      cursor = app.db.cursor()
+      word_ids = autocomplete_index.suggest(cursor, prefix, limit)
+
+      # Fetch the suggestions by primary key, keeping the index order
+      cursor.execute('''
+        SELECT w.id, w.kanji, w.romaji, w.english
+        FROM json_each(?) j
+        JOIN words w ON w.id = j.value
+        ORDER BY j.key
+      ''', (json.dumps(word_ids),))
+      suggestions = [{
+        "id": word["id"],
+        "kanji": word["kanji"],
+        "romaji": word["romaji"],
+        "english": word["english"]
+      } for word in cursor.fetchall()]
+
+      return jsonify({
+        'prefix': prefix,
+        'suggestions': suggestions
+      })
+    except Exception as e:
+      return jsonify({"error": str(e)}), 500
+
+  @app.route('/api/autocomplete/stats', methods=['GET'])
+  @cross_origin()
+  def get_autocomplete_stats():
+    # Size and lookup latency of this worker's index
+    return jsonify(autocomplete_index.stats())
+
+  # Endpoint: POST /words/lookup with {"ids": [...]} for id lists too long
+  # for a query string
+  @app.route('/words/lookup', methods=['POST'])
+  @cross_origin()
+  def lookup_words_batch():
+    try:
+      data = request.get_json(silent=True)
+      if not isinstance(data, dict) or not isinstance(data.get('ids'), list):
+        return jsonify({"error": "A JSON object with an ids array is required"}), 400
+      try:
+        ids = parse_word_ids(data['ids'])
+      except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+      return jsonify(lookup_words(app.db.cursor(), ids))
+    except Exception as e:
+      return jsonify({"error": str(e)}), 500
+
+  # Endpoint: GET /words/:id/distractors?k= for wrong multiple-choice options
+  @app.route('/words/<int:word_id>/distractors', methods=['GET'])
+  @cross_origin()
+  def get_word_distractors(word_id):
+    try:
+      k = min(max(request.args.get('k', 3, type=int), 1), distractors.DISTRACTOR_COUNT)
+
+      # Read from the precomputed word_distractors table
+      rows = distractors.distractors_for(app.db.get(), word_id, k)
+      if rows is None:
+        return jsonify({"error": "Word not found"}), 404
+
+      return jsonify({
+        'word_id': word_id,
+        'distractors': [{
+          "id": row[0],
+          "kanji": row[1],
+          "romaji": row[2],
+          "english": row[3]
+        } for row in rows]
+      })
+    except Exception as e:
+      return jsonify({"error": str(e)}), 500
+
   # Endpoint: GET /words/:id to get a single word with its details
   @app.route('/words/<int:word_id>', methods=['GET'])
   @cross_origin()
+  @app.response_cache.cached('words', 'groups', 'reviews')
   def get_word(word_id):
     try:
       cursor = app.db.cursor()
       
-      # Query to fetch the word and its details
-      cursor.execute('''
-        SELECT w.id, w.kanji, w.romaji, w.english,
-               COALESCE(r.correct_count, 0) AS correct_count,
-               COALESCE(r.wrong_count, 0) AS wrong_count,
-               GROUP_CONCAT(DISTINCT g.id || '::' || g.name) as groups
-        FROM words w
-        LEFT JOIN word_reviews r ON w.id = r.word_id
-        LEFT JOIN word_groups wg ON w.id = wg.word_id
-        LEFT JOIN groups g ON wg.group_id = g.id
-        WHERE w.id = ?
-        GROUP BY w.id
-      ''', (word_id,))
-      
-      word = cursor.fetchone()
-      
-      if not word:
+      # Same queries as the batch lookup, for a single id
+      result = lookup_words(cursor, [word_id])
+      if not result["words"]:
         return jsonify({"error": "Word not found"}), 404
-      
-      # Parse the groups string into a list of group objects
-      groups = []
-      if word["groups"]:
-        for group_str in word["groups"].split(','):
-          group_id, group_name = group_str.split('::')
-          groups.append({
-            "id": int(group_id),
-            "name": group_name
-          })
-      
-      return jsonify({
-        "word": {
-          "id": word["id"],
-          "kanji": word["kanji"],
-          "romaji": word["romaji"],
-          "english": word["english"],
-          "correct_count": word["correct_count"],
-          "wrong_count": word["wrong_count"],
-          "groups": groups
-        }
-      })
+
+      return jsonify({"word": result["words"][0]})
       
     except Exception as e:
       return jsonify({"error": str(e)}), 500
\ No newline at end of file
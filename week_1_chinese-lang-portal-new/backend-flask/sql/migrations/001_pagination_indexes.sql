@@ -0,0 +1,11 @@
+-- Indexes backing keyset (cursor=) pagination. SQLite appends the rowid to
+-- every index, so each of these is effectively (sort_key, id) and a page is a
+-- range scan starting right after the last seen (sort_key, id) pair.
+CREATE INDEX IF NOT EXISTS idx_words_kanji ON words(kanji);
+CREATE INDEX IF NOT EXISTS idx_words_romaji ON words(romaji);
+CREATE INDEX IF NOT EXISTS idx_words_english ON words(english);
+
+-- Lets a sorted walk over words probe group membership directly
+CREATE UNIQUE INDEX IF NOT EXISTS idx_word_groups_word_group ON word_groups(word_id, group_id);
+
+CREATE INDEX IF NOT EXISTS idx_study_sessions_created_at ON study_sessions(created_at);
@@ -0,0 +1,25 @@
+-- Join keys used by the dashboard, session and group routes
+CREATE INDEX IF NOT EXISTS idx_word_review_items_study_session_id ON word_review_items(study_session_id);
+CREATE INDEX IF NOT EXISTS idx_word_review_items_word_id ON word_review_items(word_id);
+CREATE INDEX IF NOT EXISTS idx_word_groups_group_word ON word_groups(group_id, word_id);
+
+-- Session listings filter by group or activity and sort newest first
+CREATE INDEX IF NOT EXISTS idx_study_sessions_group_created_at ON study_sessions(group_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_study_sessions_activity_created_at ON study_sessions(study_activity_id, created_at);
+
+CREATE INDEX IF NOT EXISTS idx_groups_name ON groups(name);
+CREATE INDEX IF NOT EXISTS idx_groups_words_count ON groups(words_count);
+
+-- word_reviews holds one aggregate row per word. log_review could race and
+-- insert a second row, so fold any duplicates into the oldest row before
+-- making word_id unique.
+UPDATE word_reviews
+SET correct_count = (SELECT SUM(d.correct_count) FROM word_reviews d WHERE d.word_id = word_reviews.word_id),
+    wrong_count = (SELECT SUM(d.wrong_count) FROM word_reviews d WHERE d.word_id = word_reviews.word_id),
+    last_reviewed = (SELECT MAX(d.last_reviewed) FROM word_reviews d WHERE d.word_id = word_reviews.word_id)
+WHERE id IN (SELECT MIN(id) FROM word_reviews GROUP BY word_id HAVING COUNT(*) > 1);
+
+DELETE FROM word_reviews
+WHERE id NOT IN (SELECT MIN(id) FROM word_reviews GROUP BY word_id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_word_reviews_word_id ON word_reviews(word_id);
@@ -0,0 +1,61 @@
+-- Summary counters behind /dashboard/stats, kept up to date by lib/stats.py
+-- in the same transaction as the session and review writes. Single row.
+CREATE TABLE IF NOT EXISTS dashboard_stats (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  total_vocabulary INTEGER NOT NULL DEFAULT 0,
+  total_sessions INTEGER NOT NULL DEFAULT 0,
+  total_reviews INTEGER NOT NULL DEFAULT 0,
+  correct_reviews INTEGER NOT NULL DEFAULT 0,
+  words_studied INTEGER NOT NULL DEFAULT 0,  -- Words with at least one review
+  mastered_words INTEGER NOT NULL DEFAULT 0,  -- Words with >= 5 attempts and >= 80% correct
+  streak_days INTEGER NOT NULL DEFAULT 0,
+  last_study_date DATE  -- Day of the most recent study session
+);
+
+-- Per-word attempt counts used to track mastery transitions
+CREATE TABLE IF NOT EXISTS word_stats (
+  word_id INTEGER PRIMARY KEY,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  correct INTEGER NOT NULL DEFAULT 0,
+  FOREIGN KEY (word_id) REFERENCES words(id)
+);
+
+-- Vocabulary size is maintained by triggers so that bulk imports keep it in sync
+CREATE TRIGGER IF NOT EXISTS words_count_vocabulary_insert AFTER INSERT ON words
+BEGIN
+  UPDATE dashboard_stats SET total_vocabulary = total_vocabulary + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS words_count_vocabulary_delete AFTER DELETE ON words
+BEGIN
+  UPDATE dashboard_stats SET total_vocabulary = total_vocabulary - 1 WHERE id = 1;
+END;
+
+-- Backfill from the existing review history (same queries as `invoke rebuild-stats`)
+INSERT OR REPLACE INTO word_stats (word_id, attempts, correct)
+SELECT wri.word_id, COUNT(*), SUM(CASE WHEN wri.correct = 1 THEN 1 ELSE 0 END)
+FROM word_review_items wri
+JOIN study_sessions ss ON wri.study_session_id = ss.id
+GROUP BY wri.word_id;
+
+INSERT OR REPLACE INTO dashboard_stats (
+  id, total_vocabulary, total_sessions, total_reviews, correct_reviews,
+  words_studied, mastered_words, streak_days, last_study_date
+)
+SELECT
+  1,
+  (SELECT COUNT(*) FROM words),
+  (SELECT COUNT(*) FROM study_sessions),
+  (SELECT COALESCE(SUM(attempts), 0) FROM word_stats),
+  (SELECT COALESCE(SUM(correct), 0) FROM word_stats),
+  (SELECT COUNT(*) FROM word_stats),
+  (SELECT COUNT(*) FROM word_stats WHERE attempts >= 5 AND correct * 5 >= attempts * 4),
+  (
+    SELECT COUNT(*)
+    FROM (
+      SELECT julianday(study_date) - julianday(lag(study_date, 1) over (order by study_date)) as days_diff
+      FROM (SELECT DISTINCT date(created_at) as study_date FROM study_sessions)
+    )
+    WHERE days_diff = 1 OR days_diff IS NULL
+  ),
+  (SELECT MAX(date(created_at)) FROM study_sessions);
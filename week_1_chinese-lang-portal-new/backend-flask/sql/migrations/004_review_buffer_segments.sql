@@ -0,0 +1,7 @@
+-- Spill file segments of the write-behind review buffer whose reviews have
+-- been committed. Written in the same transaction as the reviews, so a
+-- segment left on disk after a crash is replayed exactly once.
+CREATE TABLE IF NOT EXISTS review_buffer_segments (
+  name TEXT PRIMARY KEY,
+  flushed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
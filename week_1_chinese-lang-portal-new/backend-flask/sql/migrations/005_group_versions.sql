@@ -0,0 +1,54 @@
+-- Data version per group, bumped by triggers whenever the group's words or
+-- memberships change. Drives the ETag / Last-Modified headers and the
+-- response cache of /api/groups/<id>/words/raw.
+CREATE TABLE IF NOT EXISTS group_versions (
+  group_id INTEGER PRIMARY KEY,
+  version INTEGER NOT NULL DEFAULT 1,
+  updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  FOREIGN KEY (group_id) REFERENCES groups(id)
+);
+
+INSERT OR IGNORE INTO group_versions (group_id) SELECT id FROM groups;
+
+CREATE TRIGGER IF NOT EXISTS group_versions_group_insert AFTER INSERT ON groups
+BEGIN
+  INSERT OR IGNORE INTO group_versions (group_id) VALUES (NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS group_versions_group_rename AFTER UPDATE OF name ON groups
+BEGIN
+  UPDATE group_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE group_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS group_versions_group_delete AFTER DELETE ON groups
+BEGIN
+  DELETE FROM group_versions WHERE group_id = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS group_versions_membership_insert AFTER INSERT ON word_groups
+BEGIN
+  UPDATE group_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE group_id = NEW.group_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS group_versions_membership_delete AFTER DELETE ON word_groups
+BEGIN
+  UPDATE group_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE group_id = OLD.group_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS group_versions_membership_update AFTER UPDATE OF word_id, group_id ON word_groups
+BEGIN
+  UPDATE group_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+  WHERE group_id IN (OLD.group_id, NEW.group_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS group_versions_word_update AFTER UPDATE OF kanji, romaji, english, parts ON words
+BEGIN
+  UPDATE group_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+  WHERE group_id IN (SELECT group_id FROM word_groups WHERE word_id = NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS group_versions_word_delete AFTER DELETE ON words
+BEGIN
+  UPDATE group_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+  WHERE group_id IN (SELECT group_id FROM word_groups WHERE word_id = OLD.id);
+END;
@@ -0,0 +1,3 @@
+-- Incremental exports read the review history in (created_at, id) order
+-- starting from the last row a consumer has already synced
+CREATE INDEX IF NOT EXISTS idx_word_review_items_created_at ON word_review_items(created_at);
@@ -0,0 +1,29 @@
+-- Full-text index over the searchable word columns for GET /words/search.
+-- External content table: the text lives in words only, and the triggers
+-- below keep the index in step with every insert, update and delete.
+-- Prefix indexes make the search-as-you-type prefix queries cheap.
+CREATE VIRTUAL TABLE IF NOT EXISTS words_fts USING fts5(
+  kanji, romaji, english,
+  content='words', content_rowid='id',
+  tokenize='unicode61 remove_diacritics 2',
+  prefix='1 2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS words_fts_insert AFTER INSERT ON words
+BEGIN
+  INSERT INTO words_fts (rowid, kanji, romaji, english) VALUES (NEW.id, NEW.kanji, NEW.romaji, NEW.english);
+END;
+
+CREATE TRIGGER IF NOT EXISTS words_fts_delete AFTER DELETE ON words
+BEGIN
+  INSERT INTO words_fts (words_fts, rowid, kanji, romaji, english) VALUES ('delete', OLD.id, OLD.kanji, OLD.romaji, OLD.english);
+END;
+
+CREATE TRIGGER IF NOT EXISTS words_fts_update AFTER UPDATE OF kanji, romaji, english ON words
+BEGIN
+  INSERT INTO words_fts (words_fts, rowid, kanji, romaji, english) VALUES ('delete', OLD.id, OLD.kanji, OLD.romaji, OLD.english);
+  INSERT INTO words_fts (rowid, kanji, romaji, english) VALUES (NEW.id, NEW.kanji, NEW.romaji, NEW.english);
+END;
+
+-- Index the words that already exist
+INSERT INTO words_fts (words_fts) VALUES ('rebuild');
@@ -0,0 +1,25 @@
+-- Log of edits and deletions of words.romaji, read by the in-memory
+-- autocomplete index to refresh incrementally (new words are found by id).
+-- Only the most recent entries are kept; an index that falls further behind
+-- rebuilds itself.
+CREATE TABLE IF NOT EXISTS word_changes (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  word_id INTEGER NOT NULL,
+  old_romaji TEXT
+);
+
+CREATE TRIGGER IF NOT EXISTS word_changes_update AFTER UPDATE OF romaji ON words
+WHEN OLD.romaji IS NOT NEW.romaji
+BEGIN
+  INSERT INTO word_changes (word_id, old_romaji) VALUES (OLD.id, OLD.romaji);
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_changes_delete AFTER DELETE ON words
+BEGIN
+  INSERT INTO word_changes (word_id, old_romaji) VALUES (OLD.id, OLD.romaji);
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_changes_prune AFTER INSERT ON word_changes
+BEGIN
+  DELETE FROM word_changes WHERE seq <= NEW.seq - 10000;
+END;
@@ -0,0 +1,17 @@
+-- Per-session review summaries, maintained by lib/reviews.record_reviews
+-- in the same transaction as the review items, so the session listings no
+-- longer count word_review_items for every row they return
+ALTER TABLE study_sessions ADD COLUMN review_items_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE study_sessions ADD COLUMN correct_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE study_sessions ADD COLUMN wrong_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE study_sessions ADD COLUMN last_activity_at DATETIME;
+
+UPDATE study_sessions SET
+  review_items_count = (SELECT COUNT(*) FROM word_review_items WHERE study_session_id = study_sessions.id),
+  correct_count = (SELECT COUNT(*) FROM word_review_items WHERE study_session_id = study_sessions.id AND correct = 1),
+  wrong_count = (SELECT COUNT(*) FROM word_review_items WHERE study_session_id = study_sessions.id AND correct = 0),
+  last_activity_at = (SELECT MAX(created_at) FROM word_review_items WHERE study_session_id = study_sessions.id);
+
+-- Sort orders offered by GET /groups/<id>/study_sessions
+CREATE INDEX IF NOT EXISTS idx_study_sessions_group_last_activity ON study_sessions(group_id, last_activity_at);
+CREATE INDEX IF NOT EXISTS idx_study_sessions_group_review_items ON study_sessions(group_id, review_items_count);
@@ -0,0 +1,39 @@
+-- Per-day activity rollup behind the streaks and GET /dashboard/heatmap,
+-- updated by lib/stats.py with every session and review. Days are local
+-- dates: sessions store local time, review timestamps are UTC.
+CREATE TABLE IF NOT EXISTS daily_activity (
+  date DATE PRIMARY KEY,
+  sessions INTEGER NOT NULL DEFAULT 0,
+  reviews INTEGER NOT NULL DEFAULT 0,
+  correct INTEGER NOT NULL DEFAULT 0,
+  wrong INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+INSERT OR REPLACE INTO daily_activity (date, sessions, reviews, correct, wrong)
+SELECT date, SUM(sessions), SUM(reviews), SUM(correct), SUM(wrong)
+FROM (
+  SELECT date(created_at) as date, COUNT(*) as sessions, 0 as reviews, 0 as correct, 0 as wrong
+  FROM study_sessions
+  GROUP BY 1
+  UNION ALL
+  SELECT date(created_at, 'localtime'), 0, COUNT(*), SUM(correct = 1), SUM(correct = 0)
+  FROM word_review_items
+  GROUP BY 1
+)
+GROUP BY date;
+
+-- The current streak is read from the tail of daily_activity; only the
+-- longest one is kept. It replaces the old streak counter, which counted
+-- every study day that followed another one rather than a single run.
+ALTER TABLE dashboard_stats ADD COLUMN longest_streak INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE dashboard_stats DROP COLUMN streak_days;
+ALTER TABLE dashboard_stats DROP COLUMN last_study_date;
+
+UPDATE dashboard_stats SET longest_streak = (
+  SELECT COALESCE(MAX(days), 0) FROM (
+    SELECT COUNT(*) as days
+    FROM (SELECT julianday(date) - ROW_NUMBER() OVER (ORDER BY date) as run FROM daily_activity)
+    GROUP BY run
+  )
+)
+WHERE id = 1;
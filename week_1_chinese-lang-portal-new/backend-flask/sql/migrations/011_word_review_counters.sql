@@ -0,0 +1,27 @@
+-- Review counters on words itself, maintained by lib/reviews.record_reviews
+-- next to word_reviews, so the word listings sort on an index instead of
+-- joining word_reviews and sorting every row. accuracy is derived and
+-- stays NULL, like last_reviewed, until the first review.
+ALTER TABLE words ADD COLUMN correct_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE words ADD COLUMN wrong_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE words ADD COLUMN last_reviewed DATETIME;
+ALTER TABLE words ADD COLUMN accuracy REAL GENERATED ALWAYS AS (
+  CASE WHEN correct_count + wrong_count > 0
+    THEN CAST(correct_count AS REAL) / (correct_count + wrong_count)
+  END
+) VIRTUAL;
+
+UPDATE words SET
+  correct_count = r.correct_count,
+  wrong_count = r.wrong_count,
+  last_reviewed = r.last_reviewed
+FROM word_reviews r
+WHERE r.word_id = words.id;
+
+-- One index per sort key; the rowid in every index entry breaks ties. The
+-- nullable keys are indexed on the same COALESCE expressions the listings
+-- sort on (routes/words.py WORD_SORT_COLUMNS)
+CREATE INDEX IF NOT EXISTS idx_words_correct_count ON words(correct_count);
+CREATE INDEX IF NOT EXISTS idx_words_wrong_count ON words(wrong_count);
+CREATE INDEX IF NOT EXISTS idx_words_accuracy ON words(COALESCE(accuracy, -1));
+CREATE INDEX IF NOT EXISTS idx_words_last_reviewed ON words(COALESCE(last_reviewed, ''));
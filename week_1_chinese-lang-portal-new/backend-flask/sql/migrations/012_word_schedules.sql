@@ -0,0 +1,51 @@
+-- Spaced repetition schedule per word (SM-2, see lib/schedule.py), written
+-- by lib/reviews.record_reviews. Words without a row have never been
+-- reviewed.
+CREATE TABLE IF NOT EXISTS word_schedules (
+  word_id INTEGER PRIMARY KEY,
+  ease REAL NOT NULL,
+  interval_days INTEGER NOT NULL,
+  repetitions INTEGER NOT NULL,
+  due_at DATETIME NOT NULL,
+  FOREIGN KEY (word_id) REFERENCES words(id)
+);
+
+-- Words reviewed before the scheduler existed start over, due from their
+-- last review on, so the oldest come up first
+INSERT OR IGNORE INTO word_schedules (word_id, ease, interval_days, repetitions, due_at)
+SELECT word_id, 2.5, 0, 0, datetime(last_reviewed)
+FROM word_reviews
+WHERE last_reviewed IS NOT NULL;
+
+-- due_at is copied onto every membership, so a group's due queue is one
+-- range of this index. NULL (never reviewed) sorts before any date.
+ALTER TABLE word_groups ADD COLUMN due_at DATETIME;
+
+UPDATE word_groups SET due_at = s.due_at
+FROM word_schedules s
+WHERE s.word_id = word_groups.word_id;
+
+CREATE INDEX IF NOT EXISTS idx_word_groups_group_due ON word_groups(group_id, due_at, word_id);
+
+CREATE TRIGGER IF NOT EXISTS word_schedules_insert AFTER INSERT ON word_schedules
+BEGIN
+  UPDATE word_groups SET due_at = NEW.due_at WHERE word_id = NEW.word_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_schedules_update AFTER UPDATE OF due_at ON word_schedules
+BEGIN
+  UPDATE word_groups SET due_at = NEW.due_at WHERE word_id = NEW.word_id;
+END;
+
+-- A reviewed word added to another group brings its schedule along
+CREATE TRIGGER IF NOT EXISTS word_schedules_membership_insert AFTER INSERT ON word_groups
+WHEN EXISTS (SELECT 1 FROM word_schedules WHERE word_id = NEW.word_id)
+BEGIN
+  UPDATE word_groups SET due_at = (SELECT due_at FROM word_schedules WHERE word_id = NEW.word_id)
+  WHERE rowid = NEW.rowid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_schedules_word_delete AFTER DELETE ON words
+BEGIN
+  DELETE FROM word_schedules WHERE word_id = OLD.id;
+END;
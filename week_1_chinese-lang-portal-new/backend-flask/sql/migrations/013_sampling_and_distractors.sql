@@ -0,0 +1,49 @@
+-- Dense 1..n position of every word within its group, so that a random
+-- sample is n random positions looked up in idx_word_groups_group_position.
+-- The importer numbers the memberships it adds itself; the triggers below
+-- cover every other insert and close the gap a delete leaves by moving the
+-- group's last member into it.
+ALTER TABLE word_groups ADD COLUMN position INTEGER;
+
+WITH numbered AS (
+  SELECT rowid AS membership, ROW_NUMBER() OVER (PARTITION BY group_id ORDER BY word_id) AS position
+  FROM word_groups
+)
+UPDATE word_groups SET position = numbered.position
+FROM numbered
+WHERE numbered.membership = word_groups.rowid;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_word_groups_group_position ON word_groups(group_id, position);
+
+CREATE TRIGGER IF NOT EXISTS word_groups_position_insert AFTER INSERT ON word_groups
+WHEN NEW.position IS NULL
+BEGIN
+  UPDATE word_groups
+  SET position = (SELECT COALESCE(MAX(position), 0) + 1 FROM word_groups WHERE group_id = NEW.group_id)
+  WHERE rowid = NEW.rowid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS word_groups_position_delete AFTER DELETE ON word_groups
+BEGIN
+  UPDATE word_groups SET position = OLD.position
+  WHERE group_id = OLD.group_id
+    AND position > OLD.position
+    AND position = (SELECT MAX(position) FROM word_groups WHERE group_id = OLD.group_id);
+END;
+
+-- Precomputed multiple-choice distractors, the DISTRACTOR_COUNT most
+-- similar other words per word (see lib/distractors.py)
+CREATE TABLE IF NOT EXISTS word_distractors (
+  word_id INTEGER NOT NULL,
+  distractor_id INTEGER NOT NULL,
+  score REAL NOT NULL,
+  PRIMARY KEY (word_id, distractor_id),
+  FOREIGN KEY (word_id) REFERENCES words(id),
+  FOREIGN KEY (distractor_id) REFERENCES words(id)
+) WITHOUT ROWID;
+
+-- Lists pointing at a deleted word drop it when read (it no longer joins)
+CREATE TRIGGER IF NOT EXISTS word_distractors_word_delete AFTER DELETE ON words
+BEGIN
+  DELETE FROM word_distractors WHERE word_id = OLD.id;
+END;
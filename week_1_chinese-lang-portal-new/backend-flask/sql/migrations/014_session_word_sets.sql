@@ -0,0 +1,20 @@
+-- Word sets of study sessions created from a set expression over groups and
+-- review states (see lib/word_sets.py). The set is resolved once, when the
+-- session starts, and kept as a zlib-compressed bitmap of word ids; the
+-- session's group_id is the first group the expression names.
+CREATE TABLE IF NOT EXISTS study_session_word_sets (
+  session_id INTEGER PRIMARY KEY,
+  expression TEXT NOT NULL,
+  word_count INTEGER NOT NULL,
+  bitmap BLOB NOT NULL,
+  FOREIGN KEY (session_id) REFERENCES study_sessions(id)
+);
+
+CREATE TRIGGER IF NOT EXISTS study_session_word_sets_session_delete AFTER DELETE ON study_sessions
+BEGIN
+  DELETE FROM study_session_word_sets WHERE session_id = OLD.id;
+END;
+
+-- The 'due' state and the due queue of a word set session read the
+-- schedule in due order
+CREATE INDEX IF NOT EXISTS idx_word_schedules_due ON word_schedules(due_at, word_id);
@@ -0,0 +1,30 @@
+-- Review history archival (lib/history.py). Sessions whose last activity is
+-- older than the retention period are summarized into per-word, per-day
+-- counts and their raw review items move to an attached archive database.
+-- Their own summary columns are kept as they are.
+ALTER TABLE study_sessions ADD COLUMN archived_at DATETIME;
+
+-- Sessions left to archive, oldest first, without reading the archived ones
+CREATE INDEX IF NOT EXISTS idx_study_sessions_unarchived ON study_sessions(id) WHERE archived_at IS NULL;
+
+-- Counts of the archived reviews. Days are local dates, as in daily_activity.
+CREATE TABLE IF NOT EXISTS word_review_days (
+  word_id INTEGER NOT NULL,
+  date DATE NOT NULL,
+  correct INTEGER NOT NULL DEFAULT 0,
+  wrong INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (word_id, date)
+) WITHOUT ROWID;
+
+-- State of the last history reset. Sessions and review items up to these
+-- ids are deleted in chunks after the summary tables have been cleared;
+-- finished_at stays NULL until the last chunk is gone. Single row.
+CREATE TABLE IF NOT EXISTS history_resets (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  session_id INTEGER NOT NULL DEFAULT 0,
+  review_id INTEGER NOT NULL DEFAULT 0,
+  started_at DATETIME,
+  finished_at DATETIME
+);
+
+INSERT OR IGNORE INTO history_resets (id) VALUES (1);
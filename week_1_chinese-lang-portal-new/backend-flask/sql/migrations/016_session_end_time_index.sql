@@ -0,0 +1,6 @@
+-- Group session listings sort endTime on the end time they display, which
+-- falls back to 30 minutes after the start for sessions without reviews.
+-- The expression must match the ORDER BY of routes/groups.py exactly.
+DROP INDEX IF EXISTS idx_study_sessions_group_last_activity;
+CREATE INDEX IF NOT EXISTS idx_study_sessions_group_end_time
+  ON study_sessions(group_id, COALESCE(last_activity_at, datetime(created_at, '+30 minutes')));
@@ -0,0 +1,12 @@
+-- Progress of the last full distractor rebuild (lib/distractors.py). Lists
+-- are recomputed in word id order and committed in chunks; last_word_id is
+-- the last word done and finished_at stays NULL until the last chunk, so an
+-- interrupted rebuild resumes where it stopped. Single row.
+CREATE TABLE IF NOT EXISTS distractor_rebuilds (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  last_word_id INTEGER NOT NULL DEFAULT 0,
+  started_at DATETIME,
+  finished_at DATETIME
+);
+
+INSERT OR IGNORE INTO distractor_rebuilds (id) VALUES (1);
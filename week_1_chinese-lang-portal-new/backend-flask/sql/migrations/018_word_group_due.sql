@@ -0,0 +1,6 @@
+-- Due queues (lib/schedule.due_words) read the scheduled memberships of a
+-- group through this name. Here it is a view over word_groups.due_at and
+-- idx_word_groups_group_due; learner shards keep a table of the same name
+-- and shape (sql/shard/schema.sql).
+CREATE VIEW IF NOT EXISTS word_group_due AS
+SELECT group_id, due_at, word_id FROM word_groups WHERE due_at IS NOT NULL;
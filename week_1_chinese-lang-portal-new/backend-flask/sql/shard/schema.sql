@@ -0,0 +1,135 @@
+-- Learner shard (lib/shards.py): the tables of one learner's (or one
+-- cohort's) study history, as they stand after the migrations. The shared
+-- vocabulary, groups and activities stay in the main database, attached to
+-- every shard connection as `shared`; ids in here refer to its rows. There
+-- are no foreign keys across the two files: the due dates and review
+-- counters on the shared rows are read through the TEMP views that
+-- lib/shards.py creates on each connection, and through word_group_due.
+CREATE TABLE IF NOT EXISTS study_sessions (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  group_id INTEGER NOT NULL,
+  study_activity_id INTEGER NOT NULL,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  review_items_count INTEGER NOT NULL DEFAULT 0,
+  correct_count INTEGER NOT NULL DEFAULT 0,
+  wrong_count INTEGER NOT NULL DEFAULT 0,
+  last_activity_at DATETIME,
+  archived_at DATETIME
+);
+CREATE INDEX IF NOT EXISTS idx_study_sessions_created_at ON study_sessions(created_at);
+CREATE INDEX IF NOT EXISTS idx_study_sessions_group_created_at ON study_sessions(group_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_study_sessions_activity_created_at ON study_sessions(study_activity_id, created_at);
+DROP INDEX IF EXISTS idx_study_sessions_group_last_activity;
+CREATE INDEX IF NOT EXISTS idx_study_sessions_group_end_time
+  ON study_sessions(group_id, COALESCE(last_activity_at, datetime(created_at, '+30 minutes')));
+CREATE INDEX IF NOT EXISTS idx_study_sessions_group_review_items ON study_sessions(group_id, review_items_count);
+CREATE INDEX IF NOT EXISTS idx_study_sessions_unarchived ON study_sessions(id) WHERE archived_at IS NULL;
+
+CREATE TABLE IF NOT EXISTS word_review_items (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  word_id INTEGER NOT NULL,
+  study_session_id INTEGER NOT NULL,
+  correct BOOLEAN NOT NULL,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_word_review_items_study_session_id ON word_review_items(study_session_id);
+CREATE INDEX IF NOT EXISTS idx_word_review_items_word_id ON word_review_items(word_id);
+CREATE INDEX IF NOT EXISTS idx_word_review_items_created_at ON word_review_items(created_at);
+
+CREATE TABLE IF NOT EXISTS word_reviews (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  word_id INTEGER NOT NULL,
+  correct_count INTEGER DEFAULT 0,
+  wrong_count INTEGER DEFAULT 0,
+  last_reviewed TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_word_reviews_word_id ON word_reviews(word_id);
+
+CREATE TABLE IF NOT EXISTS word_schedules (
+  word_id INTEGER PRIMARY KEY,
+  ease REAL NOT NULL,
+  interval_days INTEGER NOT NULL,
+  repetitions INTEGER NOT NULL,
+  due_at DATETIME NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_word_schedules_due ON word_schedules(due_at, word_id);
+
+-- Due date of every shared group membership of the scheduled words, in the
+-- order of the due queues. It stands in for word_groups.due_at and
+-- idx_word_groups_group_due of the main database, where word_group_due is
+-- a view (migration 018). due_at follows word_schedules through the
+-- trigger; the rows of newly scheduled words and of memberships added to
+-- the shared word_groups since membership_rowid are written by
+-- lib/shards.sync_group_due, which sees both files.
+CREATE TABLE IF NOT EXISTS word_group_due (
+  group_id INTEGER NOT NULL,
+  due_at DATETIME NOT NULL,
+  word_id INTEGER NOT NULL,
+  PRIMARY KEY (group_id, due_at, word_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_word_group_due_word ON word_group_due(word_id);
+CREATE TRIGGER IF NOT EXISTS word_group_due_update AFTER UPDATE OF due_at ON word_schedules
+BEGIN
+  UPDATE word_group_due SET due_at = NEW.due_at WHERE word_id = NEW.word_id;
+END;
+
+CREATE TABLE IF NOT EXISTS word_group_due_sync (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  membership_rowid INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO word_group_due_sync (id) VALUES (1);
+
+CREATE TABLE IF NOT EXISTS word_stats (
+  word_id INTEGER PRIMARY KEY,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  correct INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS daily_activity (
+  date DATE PRIMARY KEY,
+  sessions INTEGER NOT NULL DEFAULT 0,
+  reviews INTEGER NOT NULL DEFAULT 0,
+  correct INTEGER NOT NULL DEFAULT 0,
+  wrong INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+-- The learner's dashboard_stats row, read and written through the TEMP
+-- view of that name, which adds the shared total_vocabulary
+CREATE TABLE IF NOT EXISTS learner_dashboard_stats (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  total_sessions INTEGER NOT NULL DEFAULT 0,
+  total_reviews INTEGER NOT NULL DEFAULT 0,
+  correct_reviews INTEGER NOT NULL DEFAULT 0,
+  words_studied INTEGER NOT NULL DEFAULT 0,
+  mastered_words INTEGER NOT NULL DEFAULT 0,
+  longest_streak INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO learner_dashboard_stats (id) VALUES (1);
+
+CREATE TABLE IF NOT EXISTS study_session_word_sets (
+  session_id INTEGER PRIMARY KEY,
+  expression TEXT NOT NULL,
+  word_count INTEGER NOT NULL,
+  bitmap BLOB NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS study_session_word_sets_session_delete AFTER DELETE ON study_sessions
+BEGIN
+  DELETE FROM study_session_word_sets WHERE session_id = OLD.id;
+END;
+
+CREATE TABLE IF NOT EXISTS word_review_days (
+  word_id INTEGER NOT NULL,
+  date DATE NOT NULL,
+  correct INTEGER NOT NULL DEFAULT 0,
+  wrong INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (word_id, date)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS history_resets (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  session_id INTEGER NOT NULL DEFAULT 0,
+  review_id INTEGER NOT NULL DEFAULT 0,
+  started_at DATETIME,
+  finished_at DATETIME
+);
+INSERT OR IGNORE INTO history_resets (id) VALUES (1);
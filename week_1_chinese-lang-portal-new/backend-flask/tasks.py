@@ -1,9 +1,363 @@
 from invoke import task
 from lib.db import db
+from migrate import run_migrations
+
+CACHE_AUTHKEY = b'lang-portal'
+
+def copy_database(source, path):
+  # Copy a database the tasks must not modify. The online backup API copies
+  # a consistent snapshot, including pages still in the -wal file that a
+  # plain file copy would miss.
+  import sqlite3
+  source, target = sqlite3.connect(source), sqlite3.connect(path)
+  try:
+    source.backup(target)
+  finally:
+    source.close()
+    target.close()
 
 @task
 def init_db(c):
   from flask import Flask
   app = Flask(__name__)
   db.init(app)
-  print("Database initialized successfully.")
\ No newline at end of file
+  run_migrations(db.database)
+  build_distractors(c)
+  print("Database initialized successfully.")
+
+@task
+def migrate(c):
+  run_migrations(db.database)
+
+@task(iterable=['group'], help={
+  'path': 'Word list to import: .json (array), .ndjson/.jsonl or .csv',
+  'group': 'Group to attach every word to; repeat for several groups',
+  'format': 'Override the format detected from the file extension',
+  'batch_size': 'Rows per executemany batch',
+  'cache_address': 'host:port of a shared response cache to invalidate afterwards',
+  'distractors': 'Compute the distractors of the new words afterwards (about 1ms per word)',
+})
+def import_words(c, path, group=None, format=None, batch_size=1000, cache_address=None, distractors=True):
+  """Stream a large word list into the database in a single transaction."""
+  from lib import distractors as word_distractors
+  from lib.importer import import_words as run_import
+
+  connection = db.connect()
+  try:
+    result = run_import(connection, path, group_names=group or [], format=format, batch_size=batch_size)
+    # Distractors for the new words; older words pick up better ones
+    if distractors:
+      word_distractors.refresh(connection)
+  finally:
+    connection.close()
+  if cache_address:
+    from lib.cache import connect_cache_backend
+    connect_cache_backend(cache_address, CACHE_AUTHKEY).invalidate(('words', 'groups'))
+  print(f"Read {result['read']} records in {result['seconds']:.2f}s ({result['rows_per_sec']:.0f} rows/sec): "
+        f"{result['inserted']} new words, {result['duplicates']} duplicates, "
+        f"{result['memberships']} group memberships added.")
+
+@task(help={
+  'database': 'SQLite file to benchmark against (copied first, never modified)',
+  'requests': 'Requests per route and mode',
+  'threads': 'Concurrent client threads',
+})
+def bench(c, database='words.db', requests=2000, threads=8):
+  """Compare route throughput with and without the DB_POOL connection mode."""
+  import os
+  import tempfile
+  import time
+  from concurrent.futures import ThreadPoolExecutor
+  from app import create_app
+
+  def run(client_factory, method, url, body=None):
+    def worker(count):
+      client = client_factory()
+      for _ in range(count):
+        client.open(url, method=method, json=body)
+    per_thread = [requests // threads] * threads
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+      list(pool.map(worker, per_thread))
+    return sum(per_thread) / (time.perf_counter() - started)
+
+  for pool_mode in (False, True):
+    with tempfile.TemporaryDirectory() as tmp:
+      path = os.path.join(tmp, 'bench.db')
+      copy_database(database, path)
+      app = create_app({'DATABASE': path, 'DB_POOL': pool_mode})
+      client = app.test_client()
+      session_id = client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1}).get_json()['session_id']
+      review = {'word_id': 1, 'correct': True}
+      words_rps = run(app.test_client, 'GET', '/words')
+      review_rps = run(app.test_client, 'POST', f'/study_sessions/{session_id}/review', review)
+      print(f"DB_POOL={pool_mode!s:<5}  /words: {words_rps:8.1f} req/s   "
+            f"/study_sessions/<id>/review: {review_rps:8.1f} req/s")
+      app.db.close_pool()
+
+@task(help={
+  'database': 'SQLite file to benchmark against (copied first, never modified)',
+  'reviews': 'Number of reviews to log per mode',
+  'batch': 'Reviews per POST /study_sessions/<id>/reviews request',
+})
+def bench_reviews(c, database='words.db', reviews=5000, batch=100):
+  """Compare reviews/sec of the single-review route against the batch route."""
+  import os
+  import random
+  import tempfile
+  import time
+  from app import create_app
+
+  with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, 'bench.db')
+    copy_database(database, path)
+    app = create_app({'DATABASE': path})
+    client = app.test_client()
+    session_id = client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1}).get_json()['session_id']
+    word_ids = [row[0] for row in app.db.connect().execute('SELECT id FROM words')]
+    items = [{'word_id': random.choice(word_ids), 'correct': random.random() < 0.7} for _ in range(reviews)]
+
+    started = time.perf_counter()
+    for item in items:
+      client.post(f'/study_sessions/{session_id}/review', json=item)
+    single = reviews / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for start in range(0, reviews, batch):
+      client.post(f'/study_sessions/{session_id}/reviews', json=items[start:start + batch])
+    batched = reviews / (time.perf_counter() - started)
+
+  print(f"/study_sessions/<id>/review   {single:10.1f} reviews/s")
+  print(f"/study_sessions/<id>/reviews  {batched:10.1f} reviews/s  (batches of {batch}, {batched / single:.1f}x)")
+
+@task(help={'database': 'SQLite file to check (copied first, never modified)'})
+def check_query_plans(c, database='words.db'):
+  """Fail if any portal route query falls back to a full table scan."""
+  import os
+  import tempfile
+  from app import create_app
+  from lib.query_plans import check_query_plans as check
+
+  with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, 'plans.db')
+    copy_database(database, path)
+    failures = check(create_app({'DATABASE': path}))
+
+  for route, sql, problems in failures:
+    print(f"{route}: {', '.join(problems)}\n    {sql}")
+  if failures:
+    raise SystemExit(f"{len(failures)} route queries fall back to table scans")
+  print("All route queries use indexes.")
+
+@task(help={'full': 'Recompute the distractors of every word, not only of the words without any'})
+def build_distractors(c, full=False):
+  """Precompute the multiple-choice distractors of GET /words/<id>/distractors."""
+  import time
+  from lib import distractors
+
+  connection = db.connect()
+  try:
+    started = time.perf_counter()
+    count = distractors.refresh(connection, full=full)
+  finally:
+    connection.close()
+  print(f"Distractors computed for {count} words in {time.perf_counter() - started:.2f}s.")
+
+@task(help={'check': 'Only report drift between the summary tables and the raw history'})
+def rebuild_stats(c, check=False):
+  """Recompute dashboard_stats and word_stats from the raw review history."""
+  from lib import stats
+
+  connection = db.connect()
+  try:
+    differences = stats.drift(connection)
+    for difference in differences:
+      print(difference)
+    if check:
+      if differences:
+        raise SystemExit(f"{len(differences)} differences between the summary tables and the review history")
+      print("Dashboard statistics are in sync.")
+      return
+    stats.rebuild(connection)
+    print(f"Dashboard statistics rebuilt ({len(differences)} differences fixed).")
+  finally:
+    connection.close()
+
+@task(help={
+  'archive': 'Archive database file for the raw review items (created if missing)',
+  'days': 'Archive the sessions without activity for more than this many days',
+  'chunk': 'Review items moved per transaction',
+  'max_seconds': 'Stop after this long; the next run continues where this one stopped',
+})
+def archive_reviews(c, archive='reviews_archive.db', days=90, chunk=2000, max_seconds=None):
+  """Move the review items of idle sessions to the archive, keeping per-day counts."""
+  import time
+  from lib import history
+  from lib.db import Db
+
+  source = Db(database=db.database, archive=archive)
+  connection = source.connect()
+  try:
+    started = time.monotonic()
+    deadline = started + float(max_seconds) if max_seconds else None
+    result = history.archive(connection, days=days, chunk_rows=chunk, deadline=deadline)
+  except ValueError as e:
+    raise SystemExit(str(e))
+  finally:
+    connection.close()
+  print(f"Archived {result['sessions']} sessions and {result['reviews']} review items "
+        f"in {time.monotonic() - started:.2f}s" + ("" if result['finished'] else "; more remain"))
+
+@task(help={
+  'archive': 'Archive database to clear as well, as configured in ARCHIVE_DATABASE',
+  'chunk': 'Rows deleted per transaction',
+  'start': 'Start a new reset; without it only a pending reset is resumed',
+})
+def reset_history(c, archive=None, chunk=2000, start=False):
+  """Delete the study history in chunked transactions, or resume a pending reset."""
+  import time
+  from lib import history
+  from lib.db import Db
+
+  connection = Db(database=db.database, archive=archive).connect()
+  try:
+    if start:
+      history.start_reset(connection)
+    elif not history.reset_status(connection)['pending']:
+      print("No reset pending.")
+      return
+    started = time.monotonic()
+    history.run_reset(connection, chunk_rows=chunk)
+  finally:
+    connection.close()
+  print(f"Study history cleared in {time.monotonic() - started:.2f}s.")
+
+@task(help={
+  'address': 'host:port to listen on',
+  'max_entries': 'Cached responses kept before evicting the least recently used',
+  'max_mb': 'Total size of the cached bodies in megabytes',
+})
+def cache_server(c, address='127.0.0.1:50007', max_entries=4096, max_mb=64):
+  """Serve a response cache shared by every app worker (RESPONSE_CACHE_ADDRESS)."""
+  from lib.cache import cache_server as make_server
+  server = make_server(address, CACHE_AUTHKEY, max_entries=max_entries, max_bytes=max_mb * 1024 * 1024)
+  print(f"Response cache listening on {address}")
+  server.serve_forever()
+
+@task(help={
+  'entries': 'Synthetic words in the index',
+  'lookups': 'Random prefix lookups to time',
+})
+def bench_autocomplete(c, entries=1000000, lookups=20000):
+  """Report lookup latency and memory of the autocomplete index at scale."""
+  import random
+  import sqlite3
+  import time
+  from lib.autocomplete import AutocompleteIndex
+
+  syllables = [consonant + vowel for consonant in ['', 'k', 's', 't', 'n', 'h', 'm', 'y', 'r', 'w', 'g', 'z', 'd', 'b', 'p']
+               for vowel in 'aiueo']
+  def word():
+    return ' '.join(random.choice(syllables) for _ in range(random.randint(2, 5)))
+
+  connection = sqlite3.connect(':memory:')
+  connection.execute('CREATE TABLE words (id INTEGER PRIMARY KEY, romaji TEXT)')
+  connection.execute('CREATE TABLE word_changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, word_id INTEGER, old_romaji TEXT)')
+  connection.executemany('INSERT INTO words (romaji) VALUES (?)', ((word(),) for _ in range(entries)))
+  cursor = connection.cursor()
+
+  index = AutocompleteIndex()
+  started = time.perf_counter()
+  index.suggest(cursor, 'a')
+  print(f"Loaded {entries} entries in {time.perf_counter() - started:.2f}s")
+
+  prefixes = [word().replace(' ', '')[:random.randint(1, 6)] for _ in range(lookups)]
+  timings = []
+  for prefix in prefixes:
+    started = time.perf_counter()
+    index.suggest(cursor, prefix, 10)
+    timings.append(time.perf_counter() - started)
+  timings.sort()
+  stats = index.stats()
+  print(f"suggest() incl. refresh check: p50 {timings[len(timings) // 2] * 1e6:.1f}us  "
+        f"p99 {timings[int(len(timings) * 0.99)] * 1e6:.1f}us")
+  print(f"index lookup only:             p50 {stats['lookup_us_p50']}us  p99 {stats['lookup_us_p99']}us")
+  print(f"Memory: {stats['memory_bytes'] / 1024 / 1024:.1f} MiB "
+        f"(keys {stats['key_bytes'] / 1024 / 1024:.1f} MiB, ids {stats['id_bytes'] / 1024 / 1024:.1f} MiB)")
+
+@task(help={
+  'database': 'SQLite file to create',
+  'scale': 'tiny, small, medium or large (1M words, 10k groups, 100k sessions, 50M reviews)',
+  'seed': 'Random seed; the same seed and end date give the same data',
+  'end': 'Last day of the generated history (YYYY-MM-DD, default today)',
+  'words': 'Override the number of words of the scale',
+  'groups': 'Override the number of groups',
+  'sessions': 'Override the number of study sessions',
+  'reviews': 'Override the number of review items',
+  'force': 'Replace the database if it exists',
+})
+def generate_data(c, database='synthetic.db', scale='small', seed=42, end=None,
+                  words=None, groups=None, sessions=None, reviews=None, force=False):
+  """Create a database filled with skewed synthetic words, sessions and reviews."""
+  import os
+  from datetime import datetime
+  from flask import Flask
+  from lib import synthetic
+  from lib.db import Db
+
+  if os.path.exists(database):
+    if not force:
+      raise SystemExit(f"{database} exists; pass --force to replace it")
+    os.remove(database)
+  target = Db(database=database)
+  target.init(Flask(__name__))
+  run_migrations(database)
+
+  connection = target.connect()
+  try:
+    timings = synthetic.generate(
+      connection, scale=scale, seed=seed,
+      end=datetime.strptime(end, '%Y-%m-%d') if end else None,
+      words=words, groups=groups, sessions=sessions, reviews=reviews
+    )
+    counts = {table: connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+              for table in ('words', 'groups', 'word_groups', 'study_sessions', 'word_review_items')}
+  finally:
+    connection.close()
+  print(', '.join(f'{table}: {count}' for table, count in counts.items()))
+  print(', '.join(f'{phase} {seconds}s' for phase, seconds in timings.items()))
+
+@task(help={
+  'database': 'SQLite file to run against (copied first, never modified)',
+  'requests': 'Requests to replay',
+  'threads': 'Concurrent client threads',
+  'seed': 'Seed of the request mix',
+  'pool': 'Run with DB_POOL',
+  'save': 'Write the report to this JSON file as a baseline',
+  'compare': 'Baseline JSON file to diff the report against; exits non-zero on regressions',
+  'tolerance': 'Relative slowdown of a percentile that counts as a regression',
+})
+def load_test(c, database='synthetic.db', requests=2000, threads=4, seed=1, pool=False,
+              save=None, compare=None, tolerance=0.2):
+  """Replay a mixed portal workload and report p50/p95/p99 per route."""
+  import os
+  import tempfile
+  from app import create_app
+  from lib import loadtest
+
+  with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, 'load.db')
+    copy_database(database, path)
+    app = create_app({'DATABASE': path, 'DB_POOL': pool})
+    report = loadtest.run(app, requests=requests, threads=threads, seed=seed)
+    app.db.close_pool()
+
+  print(loadtest.format_report(report))
+  if save:
+    loadtest.save(report, save)
+    print(f"Baseline written to {save}")
+  if compare:
+    lines, regressions = loadtest.compare(loadtest.load(compare), report, tolerance=tolerance)
+    print('\n'.join(lines))
+    if regressions:
+      raise SystemExit(f"{len(regressions)} percentiles regressed by more than {tolerance:.0%}")
@@ -0,0 +1,44 @@
+"""Configuration file for pytest."""
+import os
+import shutil
+import tempfile
+import pytest
+from flask import Flask
+
+# Importing app builds the module-level app on FLASK_DATABASE; keep that
+# file out of the source tree
+os.environ.setdefault('FLASK_DATABASE', os.path.join(tempfile.mkdtemp(), 'words.db'))
+
+from app import create_app
+from lib.db import Db
+from migrate import run_migrations
+
+@pytest.fixture(scope='session')
+def seeded_db(tmp_path_factory):
+  """Build the seeded database once; each test gets its own copy."""
+  path = str(tmp_path_factory.mktemp('seed') / 'words.db')
+  Db(database=path).init(Flask(__name__))
+  run_migrations(path)
+  return path
+
+@pytest.fixture
+def db_path(seeded_db, tmp_path):
+  path = str(tmp_path / 'words.db')
+  shutil.copyfile(seeded_db, path)
+  return path
+
+@pytest.fixture
+def app(db_path):
+  app = create_app({'DATABASE': db_path, 'TESTING': True})
+  yield app
+  app.db.close_pool()
+
+@pytest.fixture
+def client(app):
+  return app.test_client()
+
+@pytest.fixture
+def session_id(client):
+  """Create a study session in the first group with the first activity."""
+  response = client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1})
+  return response.get_json()['session_id']
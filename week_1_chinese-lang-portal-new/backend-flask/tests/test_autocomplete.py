@@ -0,0 +1,49 @@
+"""Tests for the romaji/pinyin autocomplete index."""
+from lib.autocomplete import normalize
+from lib.importer import import_words
+
+def suggest(client, prefix, **args):
+  response = client.get('/words/autocomplete', query_string={'prefix': prefix, **args})
+  assert response.status_code == 200
+  return [word['romaji'] for word in response.get_json()['suggestions']]
+
+def test_normalize():
+  assert normalize('Nǚ hái') == 'nvhai'
+  assert normalize('nu:3 hai2') == 'nvhai'
+  assert normalize('nv3hai2') == 'nvhai'
+  assert normalize("Xī'ān") == 'xian'
+  assert normalize('  ta  beru ') == 'taberu'
+
+def test_prefix_suggestions(client):
+  assert 'taberu' in suggest(client, 'tabe')
+  assert suggest(client, 'TA BE') == suggest(client, 'tabe')
+  words = suggest(client, 'a', limit=5)
+  assert len(words) == 5 and all(normalize(word).startswith('a') for word in words)
+  assert words == sorted(words, key=normalize)
+
+def test_requires_a_prefix(client):
+  assert client.get('/words/autocomplete?prefix=%20').status_code == 400
+
+def test_refreshes_incrementally(app, client, tmp_path):
+  assert suggest(client, 'nvha') == []
+  stats = client.get('/api/autocomplete/stats').get_json()
+  assert stats['loaded'] and stats['entries'] == 123 and stats['memory_bytes'] > 0
+
+  path = tmp_path / 'new.ndjson'
+  path.write_text('{"kanji": "女孩", "romaji": "nǚ hái", "english": "girl"}\n', encoding='utf-8')
+  connection = app.db.connect()
+  import_words(connection, str(path))
+  assert suggest(client, 'nvha') == ['nǚ hái']
+
+  connection.execute("UPDATE words SET romaji = 'tabemasu' WHERE romaji = 'taberu'")
+  connection.commit()
+  assert 'taberu' not in suggest(client, 'tabe') and 'tabemasu' in suggest(client, 'tabe')
+
+  connection.execute("DELETE FROM word_groups WHERE word_id IN (SELECT id FROM words WHERE romaji = 'tabemasu')")
+  connection.execute("DELETE FROM words WHERE romaji = 'tabemasu'")
+  connection.commit()
+  connection.close()
+  assert 'tabemasu' not in suggest(client, 'tabe')
+
+  stats = client.get('/api/autocomplete/stats').get_json()
+  assert stats['entries'] == 123 and stats['loaded_at'] and stats['refreshes'] == 3
@@ -0,0 +1,63 @@
+"""Tests for POST /study_sessions/<id>/reviews."""
+from datetime import datetime, timedelta, timezone
+
+from lib import stats
+
+def test_batch_is_written_with_aggregates(app, client, session_id):
+  response = client.post(f'/study_sessions/{session_id}/reviews', json=[
+    {'word_id': 1, 'correct': True, 'answered_at': '2025-03-01T10:00:00Z'},
+    {'word_id': 1, 'correct': False, 'answered_at': '2025-03-01T10:00:05Z'},
+    {'word_id': 2, 'correct': True},
+  ])
+  assert response.status_code == 201 and response.get_json()['count'] == 3
+
+  word = client.get('/words/1').get_json()['word']
+  assert (word['correct_count'], word['wrong_count']) == (1, 1)
+  session = client.get(f'/api/study-sessions/{session_id}').get_json()['session']
+  assert session['review_items_count'] == 3
+
+  connection = app.db.connect()
+  times = [row[0] for row in connection.execute('SELECT created_at FROM word_review_items WHERE word_id = 1 ORDER BY id')]
+  assert times == ['2025-03-01 10:00:00', '2025-03-01 10:00:05']
+  assert stats.drift(connection) == []
+  connection.close()
+
+def test_batch_accumulates_onto_single_reviews(client, session_id):
+  client.post(f'/study_sessions/{session_id}/review', json={'word_id': 3, 'correct': True})
+  client.post(f'/study_sessions/{session_id}/reviews', json=[{'word_id': 3, 'correct': True}])
+  assert client.get('/words/3').get_json()['word']['correct_count'] == 2
+
+def test_unknown_words_reject_the_whole_batch(client, session_id):
+  response = client.post(f'/study_sessions/{session_id}/reviews', json=[
+    {'word_id': 1, 'correct': True},
+    {'word_id': 9999, 'correct': True},
+  ])
+  assert response.status_code == 404
+  assert response.get_json()['word_ids'] == [9999]
+  assert client.get('/words/1').get_json()['word']['correct_count'] == 0
+
+def test_invalid_batches(client, session_id):
+  url = f'/study_sessions/{session_id}/reviews'
+  assert client.post(url, json=[]).status_code == 400
+  assert client.post(url, json=[{'word_id': 1}]).status_code == 400
+  assert client.post(url, json=[{'word_id': '1', 'correct': True}]).status_code == 400
+  assert client.post(url, json=[{'word_id': 1, 'correct': True, 'answered_at': 'yesterday'}]).status_code == 400
+  assert client.post(url, json=[{'word_id': 1, 'correct': 'false'}]).status_code == 400
+  assert client.post(url, json=[{'word_id': 1, 'correct': 2}]).status_code == 400
+  assert client.post('/study_sessions/999/reviews', json=[{'word_id': 1, 'correct': True}]).status_code == 404
+
+def test_integer_flags_and_utc_last_reviewed(app, client, session_id):
+  response = client.post(f'/study_sessions/{session_id}/reviews', json=[
+    {'word_id': 4, 'correct': 1},
+    {'word_id': 4, 'correct': 0},
+  ])
+  assert response.status_code == 201
+  word = client.get('/words/4').get_json()['word']
+  assert (word['correct_count'], word['wrong_count']) == (1, 1)
+
+  # Reviews without answered_at are stamped in UTC, like the imported ones
+  connection = app.db.connect()
+  last_reviewed = connection.execute('SELECT last_reviewed FROM word_reviews WHERE word_id = 4').fetchone()[0]
+  connection.close()
+  now = datetime.now(timezone.utc).replace(tzinfo=None)
+  assert abs(datetime.fromisoformat(last_reviewed) - now) < timedelta(minutes=1)
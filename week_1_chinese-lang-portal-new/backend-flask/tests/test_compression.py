@@ -0,0 +1,93 @@
+"""Tests for Accept-Encoding negotiation and the cached compressed bodies."""
+import gzip
+
+import pytest
+
+from app import create_app
+from lib.cache import VersionedBodyCache
+
+GZIP = {'Accept-Encoding': 'gzip, deflate'}
+
+@pytest.fixture
+def compressions(app, monkeypatch):
+  # Bodies compressed during the test
+  made = []
+  compress = app.compression.compress
+  def counted(body, encoding):
+    made.append(encoding)
+    return compress(body, encoding)
+  monkeypatch.setattr(app.compression, 'compress', counted)
+  return made
+
+def test_large_json_is_gzipped(client):
+  plain = client.get('/words?page=1')
+  response = client.get('/words?page=1', headers=GZIP)
+  assert response.headers['Content-Encoding'] == 'gzip'
+  assert 'Accept-Encoding' in response.headers['Vary'] and 'Accept-Encoding' in plain.headers['Vary']
+  assert 'Content-Encoding' not in plain.headers
+  assert gzip.decompress(response.data) == plain.data
+  assert int(response.headers['Content-Length']) == len(response.data) < len(plain.data)
+
+def test_small_bodies_and_refused_encodings_stay_plain(client):
+  response = client.get('/words/1', headers=GZIP)
+  assert len(response.data) < 1024 and 'Content-Encoding' not in response.headers
+  response = client.get('/words?page=1', headers={'Accept-Encoding': 'gzip;q=0'})
+  assert 'Content-Encoding' not in response.headers
+  response = client.get('/words?page=1', headers={'Accept-Encoding': 'compress'})
+  assert 'Content-Encoding' not in response.headers
+
+def test_compression_can_be_disabled(db_path):
+  app = create_app({'DATABASE': db_path, 'TESTING': True, 'COMPRESSION': False})
+  response = app.test_client().get('/api/groups/1/words/raw', headers=GZIP)
+  assert 'Content-Encoding' not in response.headers
+  app.db.close_pool()
+
+def test_raw_words_are_compressed_once_per_version(client, compressions):
+  plain = client.get('/api/groups/1/words/raw')
+  first = client.get('/api/groups/1/words/raw', headers=GZIP)
+  second = client.get('/api/groups/1/words/raw', headers=GZIP)
+  assert compressions == ['gzip']
+  assert first.data == second.data and gzip.decompress(first.data) == plain.data
+
+  # The encoded representation has its own tag; either tag validates
+  assert first.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+  for etag in (plain.headers['ETag'], first.headers['ETag']):
+    response = client.get('/api/groups/1/words/raw', headers=dict(GZIP, **{'If-None-Match': etag}))
+    assert response.status_code == 304 and response.headers['ETag'] == first.headers['ETag']
+
+def test_cached_routes_store_the_compressed_body(db_path):
+  app = create_app({'DATABASE': db_path, 'TESTING': True, 'RESPONSE_CACHE': True})
+  client = app.test_client()
+  url = '/words?sort_by=correct_count&order=desc'
+  plain = client.get(url).data
+  for _ in range(3):
+    response = client.get(url, headers=GZIP)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == plain
+  stats = client.get('/api/cache/stats').get_json()
+  assert stats['routes']['/words'] == {'hits': 3, 'misses': 1, 'stores': 1}
+  assert stats['backend']['entries'] == 2
+
+  # A write invalidates the compressed copy along with the plain body
+  session_id = client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1}).get_json()['session_id']
+  client.post(f'/study_sessions/{session_id}/review', json={'word_id': 1, 'correct': True})
+  updated = gzip.decompress(client.get(url, headers=GZIP).data)
+  assert updated != plain and updated == client.get(url).data
+  app.db.close_pool()
+
+def test_versioned_cache_keeps_encodings_per_version():
+  cache = VersionedBodyCache(4)
+  cache.put('g', 1, b'plain')
+  cache.put('g', 1, b'zipped', 'gzip')
+  assert (cache.get('g', 1), cache.get('g', 1, 'gzip'), cache.get('g', 1, 'br')) == (b'plain', b'zipped', None)
+  cache.put('g', 2, b'newer')
+  assert cache.get('g', 2, 'gzip') is None and cache.get('g', 1) is None
+  cache.put('g', 1, b'older', 'gzip')
+  assert cache.get('g', 2) == b'newer' and cache.get('g', 2, 'gzip') is None
+
+def test_brotli_is_preferred_when_installed(client):
+  brotli = pytest.importorskip('brotli')
+  plain = client.get('/api/groups/1/words/raw').data
+  response = client.get('/api/groups/1/words/raw', headers={'Accept-Encoding': 'gzip, deflate, br'})
+  assert response.headers['Content-Encoding'] == 'br'
+  assert brotli.decompress(response.data) == plain
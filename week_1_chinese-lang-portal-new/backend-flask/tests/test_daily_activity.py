@@ -0,0 +1,62 @@
+"""Tests for the daily activity rollup, streaks and the heatmap."""
+from datetime import date, timedelta
+from lib import stats
+
+def days_ago(n):
+  return (date.today() - timedelta(days=n)).isoformat()
+
+def review_on(client, session_id, *days):
+  client.post(f'/study_sessions/{session_id}/reviews', json=[
+    {'word_id': 1, 'correct': n % 2 == 0, 'answered_at': f'{days_ago(day)}T12:00:00'} for n, day in enumerate(days)
+  ])
+
+def streaks(client):
+  data = client.get('/dashboard/stats').get_json()
+  return data['current_streak'], data['longest_streak']
+
+def test_streaks_count_only_consecutive_days(app, client, session_id):
+  # Active today (the session), two days before it, and after a gap
+  review_on(client, session_id, 1, 2, 5)
+  assert streaks(client) == (3, 3)
+
+  # Filling the gap joins both runs
+  review_on(client, session_id, 3, 4)
+  assert streaks(client) == (6, 6)
+
+  # A longer run in the past only raises the longest streak
+  review_on(client, session_id, *range(20, 30))
+  assert streaks(client) == (6, 10)
+
+  connection = app.db.connect()
+  assert stats.drift(connection) == []
+  connection.close()
+
+def test_current_streak_allows_for_today_without_activity(app, client, session_id):
+  connection = app.db.connect()
+  connection.execute('DELETE FROM daily_activity WHERE date = ?', (days_ago(0),))
+  connection.commit()
+  review_on(client, session_id, 1, 2)
+  assert streaks(client)[0] == 2
+  connection.execute('DELETE FROM daily_activity WHERE date = ?', (days_ago(1),))
+  connection.commit()
+  connection.close()
+  assert streaks(client)[0] == 0
+
+def test_heatmap(client, session_id):
+  review_on(client, session_id, 0, 0, 3, 400)
+  data = client.get('/dashboard/heatmap?days=30').get_json()
+  assert data['start'] == days_ago(29) and data['end'] == days_ago(0)
+  assert data['days'] == [
+    {'date': days_ago(3), 'sessions': 0, 'reviews': 1, 'correct': 1, 'wrong': 0},
+    {'date': days_ago(0), 'sessions': 1, 'reviews': 2, 'correct': 1, 'wrong': 1},
+  ]
+  assert len(client.get('/dashboard/heatmap?days=365').get_json()['days']) == 2
+  assert len(client.get('/dashboard/heatmap').get_json()['days']) == 2
+  assert len(client.get('/dashboard/heatmap?days=500').get_json()['days']) == 3
+  assert client.get('/dashboard/heatmap?days=0').status_code == 400
+
+def test_reset_clears_activity(client, session_id):
+  review_on(client, session_id, 1)
+  client.post('/api/study-sessions/reset')
+  assert streaks(client) == (0, 0)
+  assert client.get('/dashboard/heatmap').get_json()['days'] == []
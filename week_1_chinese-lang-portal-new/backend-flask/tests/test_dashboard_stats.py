@@ -0,0 +1,46 @@
+"""Tests for the incrementally maintained dashboard statistics."""
+from lib import stats
+
+def post_reviews(client, session_id, reviews):
+  for word_id, correct in reviews:
+    client.post(f'/study_sessions/{session_id}/review', json={'word_id': word_id, 'correct': correct})
+
+def test_stats_follow_sessions_and_reviews(client, session_id):
+  post_reviews(client, session_id, [(1, True)] * 4 + [(1, False), (2, False)])
+  data = client.get('/dashboard/stats').get_json()
+  assert data['total_vocabulary'] == 123
+  assert data['total_words_studied'] == 2
+  assert data['mastered_words'] == 1
+  assert data['success_rate'] == 4 / 6
+  assert data['total_sessions'] == 1
+  assert data['active_groups'] == 1
+  assert data['current_streak'] == 1
+
+  # A sixth attempt drops word 1 below 80%
+  post_reviews(client, session_id, [(1, False)])
+  assert client.get('/dashboard/stats').get_json()['mastered_words'] == 0
+
+def test_maintained_tables_match_a_rebuild(app, client, session_id):
+  post_reviews(client, session_id, [(n % 7 + 1, n % 5 != 0) for n in range(60)])
+  second = client.post('/study_sessions', json={'group_id': 2, 'study_activity_id': 1}).get_json()['session_id']
+  post_reviews(client, second, [(70, True), (71, False)])
+
+  connection = app.db.connect()
+  assert stats.drift(connection) == []
+  mastered = client.get('/dashboard/stats').get_json()['mastered_words']
+  connection.execute('UPDATE dashboard_stats SET mastered_words = 99')
+  connection.commit()
+  assert stats.drift(connection) == [f'dashboard_stats.mastered_words: 99 != {mastered}']
+  stats.rebuild(connection)
+  assert stats.drift(connection) == []
+  connection.close()
+
+def test_reset_clears_stats(app, client, session_id):
+  post_reviews(client, session_id, [(1, True)])
+  client.post('/api/study-sessions/reset')
+  data = client.get('/dashboard/stats').get_json()
+  assert data['total_sessions'] == 0 and data['total_words_studied'] == 0
+  assert data['total_vocabulary'] == 123
+  connection = app.db.connect()
+  assert stats.drift(connection) == []
+  connection.close()
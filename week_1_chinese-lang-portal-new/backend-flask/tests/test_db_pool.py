@@ -0,0 +1,38 @@
+"""Tests for the pooled WAL connection mode of Db."""
+import sqlite3
+import pytest
+from app import create_app
+
+@pytest.fixture
+def pooled_app(db_path):
+  app = create_app({'DATABASE': db_path, 'TESTING': True, 'DB_POOL': True})
+  yield app
+  app.db.close_pool()
+
+def test_pool_mode_enables_wal(pooled_app, db_path):
+  pooled_app.test_client().get('/words')
+  connection = sqlite3.connect(db_path)
+  assert connection.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+  connection.close()
+
+def test_get_requests_use_read_only_handle(pooled_app):
+  with pooled_app.test_request_context('/words', method='GET'):
+    with pytest.raises(sqlite3.OperationalError):
+      pooled_app.db.cursor().execute("INSERT INTO groups (name) VALUES ('x')")
+    pooled_app.db.close()
+
+def test_connections_are_reused_between_requests(pooled_app):
+  with pooled_app.test_request_context('/words', method='GET'):
+    first = pooled_app.db.get()
+    pooled_app.db.close()
+  with pooled_app.test_request_context('/words', method='GET'):
+    assert pooled_app.db.get() is first
+    pooled_app.db.close()
+
+def test_reviews_are_written_in_pool_mode(pooled_app):
+  client = pooled_app.test_client()
+  session_id = client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1}).get_json()['session_id']
+  response = client.post(f'/study_sessions/{session_id}/review', json={'word_id': 1, 'correct': True})
+  assert response.status_code == 200
+  words = client.get('/words?sort_by=correct_count&order=desc').get_json()['words']
+  assert words[0]['id'] == 1 and words[0]['correct_count'] == 1
@@ -0,0 +1,78 @@
+"""Tests for the precomputed multiple-choice distractors."""
+import random
+
+import pytest
+
+from lib import distractors
+
+def edit_distance(a, b):
+  previous = list(range(len(b) + 1))
+  for i, char_a in enumerate(a, 1):
+    current = [i]
+    for j, char_b in enumerate(b, 1):
+      current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+    previous = current
+  return previous[-1]
+
+def test_bit_parallel_edit_distance():
+  assert distractors.edit_distance('taberu', 'nomeru') == 3
+  assert distractors.edit_distance('', 'abc') == 3
+  rng = random.Random(7)
+  for _ in range(500):
+    a = ''.join(rng.choices('aknu', k=rng.randint(0, 12)))
+    b = ''.join(rng.choices('aknu', k=rng.randint(0, 12)))
+    assert distractors.edit_distance(a, b) == edit_distance(a, b)
+
+def test_refresh_builds_every_list(app, client):
+  connection = app.db.connect()
+  assert distractors.refresh(connection) == 123
+  counts = connection.execute('SELECT COUNT(DISTINCT word_id), MAX(n) FROM (SELECT word_id, COUNT(*) AS n FROM word_distractors GROUP BY word_id)').fetchone()
+  assert tuple(counts) == (123, distractors.DISTRACTOR_COUNT)
+  assert distractors.refresh(connection) == 0
+  connection.close()
+
+  options = client.get('/words/1/distractors?k=4').get_json()['distractors']
+  assert len(options) == 4 and 1 not in [option['id'] for option in options]
+
+def test_new_words_join_older_lists(app, client):
+  connection = app.db.connect()
+  distractors.refresh(connection)
+  taberu = connection.execute("SELECT id, kanji, romaji, english FROM words WHERE romaji = 'taberu'").fetchone()
+  connection.execute("INSERT INTO words (kanji, romaji, english, parts) VALUES ('食べ', 'tabero', 'to eat up', '[]')")
+  new_id = connection.execute('SELECT MAX(id) FROM words').fetchone()[0]
+  connection.commit()
+  assert distractors.refresh(connection) == 1
+  connection.close()
+
+  options = client.get(f'/words/{taberu[0]}/distractors?k=1').get_json()['distractors']
+  assert options[0]['id'] == new_id
+
+def test_interrupted_full_rebuild_resumes(app, monkeypatch):
+  connection = app.db.connect()
+  distractors.refresh(connection)
+  nearest = distractors.nearest
+  calls = []
+  def failing(connection, word):
+    calls.append(word[0])
+    if len(calls) == 60:
+      raise RuntimeError('interrupted')
+    return nearest(connection, word)
+  monkeypatch.setattr(distractors, 'nearest', failing)
+  with pytest.raises(RuntimeError):
+    distractors.refresh(connection, full=True, chunk_size=50)
+  monkeypatch.setattr(distractors, 'nearest', nearest)
+
+  # The first chunk committed; the second rolled back and kept its old lists
+  last_word_id, finished_at = connection.execute('SELECT last_word_id, finished_at FROM distractor_rebuilds').fetchone()
+  assert (last_word_id, finished_at) == (calls[49], None)
+  assert connection.execute('SELECT COUNT(DISTINCT word_id) FROM word_distractors').fetchone()[0] == 123
+
+  assert distractors.refresh(connection, full=True, chunk_size=50) == 73
+  assert connection.execute('SELECT finished_at FROM distractor_rebuilds').fetchone()[0] is not None
+  assert distractors.refresh(connection, full=True) == 123
+  connection.close()
+
+def test_unbuilt_lists_are_computed_on_request(client):
+  options = client.get('/words/1/distractors?k=3').get_json()['distractors']
+  assert len(options) == 3
+  assert client.get('/words/999999/distractors').status_code == 404
@@ -0,0 +1,57 @@
+"""Tests for the NDJSON export endpoints."""
+import gzip
+import json
+
+def read_lines(response):
+  return [json.loads(line) for line in response.get_data().decode('utf-8').splitlines()]
+
+def test_words_export_streams_every_word(client):
+  response = client.get('/export/words.ndjson')
+  assert response.status_code == 200 and response.is_streamed
+  assert response.mimetype == 'application/x-ndjson'
+  words = read_lines(response)
+  assert len(words) == 123
+  assert [word['id'] for word in words] == sorted(word['id'] for word in words)
+  assert words[0]['group_ids'] and isinstance(words[0]['parts'], list)
+
+def test_reviews_export_since_and_resume(client, session_id):
+  client.post(f'/study_sessions/{session_id}/reviews', json=[
+    {'word_id': 1, 'correct': True, 'answered_at': '2025-01-01T10:00:00Z'},
+    {'word_id': 2, 'correct': False, 'answered_at': '2025-01-02T10:00:00Z'},
+    {'word_id': 3, 'correct': True, 'answered_at': '2025-01-02T10:00:00Z'},
+  ])
+  reviews = read_lines(client.get('/export/reviews.ndjson'))
+  assert [review['word_id'] for review in reviews] == [1, 2, 3]
+  assert reviews[1] == {'id': reviews[1]['id'], 'word_id': 2, 'study_session_id': session_id, 'group_id': 1,
+                        'study_activity_id': 1, 'correct': False, 'created_at': '2025-01-02 10:00:00'}
+
+  since = read_lines(client.get('/export/reviews.ndjson?since=2025-01-02T10:00:00Z'))
+  assert [review['word_id'] for review in since] == [2, 3]
+
+  # Resuming after the last synced row skips it, and picks up reviews
+  # posted later with an older answered_at
+  last = since[0]
+  client.post(f'/study_sessions/{session_id}/reviews', json=[
+    {'word_id': 4, 'correct': True, 'answered_at': '2024-12-31T10:00:00Z'},
+  ])
+  resumed = read_lines(client.get(f"/export/reviews.ndjson?after_id={last['id']}"))
+  assert [review['word_id'] for review in resumed] == [3, 4]
+  assert read_lines(client.get(f"/export/reviews.ndjson?after_id={resumed[-1]['id']}")) == []
+
+  words = read_lines(client.get('/export/words.ndjson?since=2025-01-02'))
+  assert [(word['id'], word['correct_count'], word['wrong_count']) for word in words] == [(2, 0, 1), (3, 1, 0)]
+
+def test_gzip_when_accepted(client):
+  response = client.get('/export/words.ndjson', headers={'Accept-Encoding': 'gzip'})
+  assert response.headers['Content-Encoding'] == 'gzip'
+  assert 'Accept-Encoding' in response.headers['Vary']
+  lines = gzip.decompress(response.get_data()).decode('utf-8').splitlines()
+  assert len(lines) == 123
+
+def test_invalid_parameters(client):
+  assert client.get('/export/reviews.ndjson?since=yesterday').status_code == 400
+  assert client.get('/export/reviews.ndjson?after_id=abc').status_code == 400
+  assert client.get('/export/reviews.ndjson?after_id=-1').status_code == 400
+  assert client.get('/export/reviews.ndjson?after_id=3').status_code == 400
+  assert client.get('/export/reviews.ndjson?after_id=0').status_code == 200
+  assert client.get('/export/reviews.ndjson?since=2025-01-01&after_id=0').status_code == 400
@@ -0,0 +1,60 @@
+"""Tests for conditional GET support on /api/groups/<id>/words/raw."""
+import pytest
+from lib.importer import import_words
+
+@pytest.fixture
+def statements(app, monkeypatch):
+  # Every SQL statement the app runs during the test
+  executed = []
+  connect = app.db.connect
+  def traced_connect(*args, **kwargs):
+    connection = connect(*args, **kwargs)
+    connection.set_trace_callback(executed.append)
+    return connection
+  monkeypatch.setattr(app.db, 'connect', traced_connect)
+  return executed
+
+def reads_words(statements):
+  return any('JOIN words' in sql for sql in statements)
+
+def test_response_carries_validators(client):
+  response = client.get('/api/groups/1/words/raw')
+  assert response.status_code == 200
+  assert response.headers['ETag'].startswith('"group-1-v')
+  assert response.headers['Last-Modified']
+  data = response.get_json()
+  assert data['group_name'] == 'Core Verbs' and len(data['words']) == 60
+  assert isinstance(data['words'][0]['parts'], list)
+
+def test_matching_etag_returns_304_without_reading_words(client, statements):
+  etag = client.get('/api/groups/1/words/raw').headers['ETag']
+  statements.clear()
+  response = client.get('/api/groups/1/words/raw', headers={'If-None-Match': etag})
+  assert response.status_code == 304 and response.data == b''
+  assert response.headers['ETag'] == etag
+  assert not reads_words(statements)
+
+def test_body_is_cached_per_version(client, statements):
+  first = client.get('/api/groups/1/words/raw').data
+  statements.clear()
+  assert client.get('/api/groups/1/words/raw').data == first
+  assert not reads_words(statements)
+
+def test_membership_changes_bump_the_version(app, client, tmp_path):
+  etag = client.get('/api/groups/2/words/raw').headers['ETag']
+  path = tmp_path / 'new.ndjson'
+  path.write_text('{"kanji": "眩しい", "romaji": "mabushii", "english": "dazzling"}\n', encoding='utf-8')
+  connection = app.db.connect()
+  import_words(connection, str(path), group_names=['Core Adjectives'])
+  connection.close()
+
+  response = client.get('/api/groups/2/words/raw', headers={'If-None-Match': etag})
+  assert response.status_code == 200 and response.headers['ETag'] != etag
+  assert len(response.get_json()['words']) == 64
+
+def test_if_modified_since(client):
+  last_modified = client.get('/api/groups/1/words/raw').headers['Last-Modified']
+  assert client.get('/api/groups/1/words/raw', headers={'If-Modified-Since': last_modified}).status_code == 304
+
+def test_unknown_group(client):
+  assert client.get('/api/groups/999/words/raw').status_code == 404
@@ -0,0 +1,133 @@
+"""Tests for review history archival and the chunked history reset."""
+import time
+
+import pytest
+
+from app import create_app
+from lib import history, stats
+
+OLD_REVIEWS = [
+  {'word_id': 1, 'correct': True, 'answered_at': '2020-03-01T10:00:00Z'},
+  {'word_id': 1, 'correct': False, 'answered_at': '2020-03-01T10:01:00Z'},
+  {'word_id': 2, 'correct': True, 'answered_at': '2020-03-02T10:00:00Z'},
+  {'word_id': 3, 'correct': True, 'answered_at': '2020-03-02T10:01:00Z'},
+  {'word_id': 2, 'correct': True, 'answered_at': '2020-03-02T10:02:00Z'},
+]
+
+@pytest.fixture
+def archived_app(db_path, tmp_path):
+  app = create_app({'DATABASE': db_path, 'TESTING': True, 'ARCHIVE_DATABASE': str(tmp_path / 'archive.db')})
+  yield app
+  app.history_reset.close()
+  app.db.close_pool()
+
+def log_session(client, reviews):
+  session_id = client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1}).get_json()['session_id']
+  assert client.post(f'/study_sessions/{session_id}/reviews', json=reviews).status_code == 201
+  return session_id
+
+def count(connection, table, session_id=None):
+  if session_id is None:
+    return connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+  return connection.execute(f'SELECT COUNT(*) FROM {table} WHERE study_session_id = ?', (session_id,)).fetchone()[0]
+
+def test_archive_moves_idle_sessions(archived_app):
+  client = archived_app.test_client()
+  old = log_session(client, OLD_REVIEWS)
+  recent = log_session(client, [{'word_id': 4, 'correct': True}])
+  dashboard = client.get('/dashboard/stats').get_json()
+  detail = client.get(f'/api/study-sessions/{old}').get_json()
+  assert detail['total'] == 3
+
+  connection = archived_app.db.connect()
+  try:
+    result = history.archive(connection, days=90, chunk_rows=2)
+    assert result == {'sessions': 1, 'reviews': 5, 'finished': True}
+    assert count(connection, 'main.word_review_items', old) == 0
+    assert count(connection, 'archive.word_review_items', old) == 5
+    assert count(connection, 'main.word_review_items', recent) == 1
+    days = connection.execute('SELECT word_id, correct, wrong FROM word_review_days ORDER BY word_id').fetchall()
+    assert [tuple(row) for row in days] == [(1, 1, 1), (2, 2, 0), (3, 1, 0)]
+    assert stats.drift(connection) == []
+    # Nothing left to archive
+    assert history.archive(connection, days=90) == {'sessions': 0, 'reviews': 0, 'finished': True}
+  finally:
+    connection.close()
+
+  # Summaries and the session's words are read as before
+  assert client.get('/dashboard/stats').get_json() == dashboard
+  assert client.get(f'/api/study-sessions/{old}').get_json() == detail
+
+def test_archive_stops_at_the_deadline_and_resumes(archived_app):
+  client = archived_app.test_client()
+  log_session(client, OLD_REVIEWS)
+  connection = archived_app.db.connect()
+  try:
+    assert history.archive(connection, days=90, deadline=time.monotonic())['finished'] is False
+    assert count(connection, 'archive.word_review_items') == 0
+    assert history.archive(connection, days=90)['reviews'] == 5
+  finally:
+    connection.close()
+
+def test_archive_requires_the_archive_database(app):
+  connection = app.db.connect()
+  try:
+    with pytest.raises(ValueError):
+      history.archive(connection, days=90)
+  finally:
+    connection.close()
+
+def test_reset_clears_main_and_archived_history(archived_app):
+  client = archived_app.test_client()
+  log_session(client, OLD_REVIEWS)
+  log_session(client, [{'word_id': 4, 'correct': True}])
+  connection = archived_app.db.connect()
+  try:
+    history.archive(connection, days=90)
+    response = client.post('/api/study-sessions/reset')
+    assert response.status_code == 200
+    for table in ('study_sessions', 'main.word_review_items', 'archive.word_review_items', 'word_review_days'):
+      assert count(connection, table) == 0
+    assert stats.drift(connection) == []
+  finally:
+    connection.close()
+  status = client.get('/api/study-sessions/reset').get_json()
+  assert status['pending'] is False and status['finished_at']
+
+def test_reset_runs_in_chunks_and_keeps_newer_reviews(archived_app):
+  client = archived_app.test_client()
+  for _ in range(3):
+    log_session(client, OLD_REVIEWS)
+  connection = archived_app.db.connect()
+  try:
+    history.start_reset(connection)
+    assert client.get('/dashboard/stats').get_json()['total_sessions'] == 0
+    assert history.reset_step(connection, chunk_rows=2) == 2
+    assert history.reset_status(connection)['pending'] is True
+    # Reviews logged meanwhile survive the reset, and the summaries agree
+    # with the history at every step
+    kept = log_session(client, [{'word_id': 5, 'correct': True}])
+    assert stats.drift(connection) == []
+    assert history.run_reset(connection, chunk_rows=2) is True
+    assert stats.drift(connection) == []
+    assert [row[0] for row in connection.execute('SELECT id FROM study_sessions')] == [kept]
+    assert count(connection, 'main.word_review_items') == 1
+  finally:
+    connection.close()
+  dashboard = client.get('/dashboard/stats').get_json()
+  assert (dashboard['total_sessions'], dashboard['total_words_studied']) == (1, 1)
+
+def test_reset_over_budget_finishes_in_the_background(db_path):
+  app = create_app({'DATABASE': db_path, 'TESTING': True, 'RESET_BUDGET_MS': 0})
+  client = app.test_client()
+  log_session(client, OLD_REVIEWS)
+  response = client.post('/api/study-sessions/reset')
+  assert response.status_code == 202 and response.get_json()['reset']['pending'] is True
+  for _ in range(500):
+    if not client.get('/api/study-sessions/reset').get_json()['pending']:
+      break
+    time.sleep(0.01)
+  assert client.get('/api/study-sessions/reset').get_json()['pending'] is False
+  assert client.get('/api/study-sessions').get_json()['items'] == []
+  app.history_reset.close()
+  app.db.close_pool()
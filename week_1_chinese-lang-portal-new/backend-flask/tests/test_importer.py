@@ -0,0 +1,85 @@
+"""Tests for the streaming bulk word importer."""
+import io
+import json
+import pytest
+from lib.importer import import_words, iter_json_array
+
+WORDS = [
+  {'kanji': '犬', 'romaji': 'inu', 'english': 'dog', 'parts': [{'kanji': '犬', 'romaji': ['i', 'nu']}]},
+  {'kanji': '猫', 'romaji': 'neko', 'english': 'cat'},
+  {'kanji': '犬', 'romaji': 'inu', 'english': 'dog (again)'},
+]
+
+def test_json_array_is_parsed_across_chunk_boundaries():
+  text = json.dumps(WORDS, ensure_ascii=False, indent=2)
+  assert list(iter_json_array(io.StringIO(text), chunk_size=7)) == WORDS
+  assert list(iter_json_array(io.StringIO('[]'))) == []
+  with pytest.raises(ValueError):
+    list(iter_json_array(io.StringIO('[{"kanji": "x"}'), chunk_size=4))
+
+@pytest.mark.parametrize('extension', ['json', 'ndjson', 'csv'])
+def test_import_dedupes_and_attaches_to_several_groups(app, tmp_path, extension):
+  path = tmp_path / f'words.{extension}'
+  if extension == 'json':
+    path.write_text(json.dumps(WORDS, ensure_ascii=False), encoding='utf-8')
+  elif extension == 'ndjson':
+    path.write_text('\n'.join(json.dumps(word, ensure_ascii=False) for word in WORDS), encoding='utf-8')
+  else:
+    lines = ['kanji,romaji,english,parts,groups', '犬,inu,dog,,Pets', '猫,neko,cat,,Pets|Animals', '犬,inu,dog,,']
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+  connection = app.db.connect()
+  result = import_words(connection, str(path), group_names=['HSK1', 'Core Verbs'], batch_size=1, defer_after=1)
+  assert (result['read'], result['inserted'], result['duplicates']) == (3, 2, 1)
+  assert result['rows_per_sec'] > 0
+
+  hsk1 = result['group_ids']['HSK1']
+  assert result['group_ids']['Core Verbs'] == 1
+  counts = dict(connection.execute('SELECT name, words_count FROM groups').fetchall())
+  assert counts['HSK1'] == 2 and counts['Core Verbs'] == 62
+  if extension == 'csv':
+    assert counts['Pets'] == 2 and counts['Animals'] == 1
+  members = connection.execute('SELECT COUNT(*) FROM word_groups WHERE group_id = ?', (hsk1,)).fetchone()[0]
+  assert members == 2
+
+  # The deferred indexes are back and a re-import changes nothing
+  indexes = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+  assert {'idx_words_kanji', 'idx_word_groups_group_word', 'idx_word_groups_word_group'} <= indexes
+  again = import_words(connection, str(path), group_names=['HSK1'])
+  assert (again['inserted'], again['memberships']) == (0, 0)
+  assert connection.execute('SELECT total_vocabulary FROM dashboard_stats').fetchone()[0] == 125
+  connection.close()
+
+def test_failed_import_rolls_back(app, tmp_path):
+  path = tmp_path / 'broken.ndjson'
+  path.write_text('{"kanji": "犬", "romaji": "inu", "english": "dog"}\n{"kanji": "猫"}\n', encoding='utf-8')
+  connection = app.db.connect()
+  with pytest.raises(ValueError):
+    import_words(connection, str(path), group_names=['Broken'], defer_after=1)
+  assert connection.execute('SELECT COUNT(*) FROM words').fetchone()[0] == 123
+  assert connection.execute("SELECT COUNT(*) FROM groups WHERE name = 'Broken'").fetchone()[0] == 0
+  assert connection.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'idx_words_kanji'").fetchone()[0] == 1
+  connection.close()
+
+def test_groups_must_be_a_list(app, tmp_path):
+  path = tmp_path / 'words.ndjson'
+  path.write_text('{"kanji": "犬", "romaji": "inu", "english": "dog", "groups": "Pets"}\n', encoding='utf-8')
+  connection = app.db.connect()
+  with pytest.raises(ValueError, match='groups must be a list'):
+    import_words(connection, str(path))
+  assert connection.execute("SELECT COUNT(*) FROM groups WHERE name IN ('P', 'Pets')").fetchone()[0] == 0
+  connection.close()
+
+def test_import_joins_the_callers_transaction(app, tmp_path):
+  path = tmp_path / 'words.ndjson'
+  path.write_text('{"kanji": "犬", "romaji": "inu", "english": "dog"}\n', encoding='utf-8')
+  connection = app.db.connect()
+  connection.execute("INSERT INTO groups (name) VALUES ('Pending')")
+  assert import_words(connection, str(path), defer_after=1)['inserted'] == 1
+  # Neither the caller's insert nor the import was committed behind its back
+  assert connection.in_transaction
+  connection.rollback()
+  assert connection.execute('SELECT COUNT(*) FROM words').fetchone()[0] == 123
+  assert connection.execute("SELECT COUNT(*) FROM groups WHERE name = 'Pending'").fetchone()[0] == 0
+  assert connection.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'idx_words_kanji'").fetchone()[0] == 1
+  connection.close()
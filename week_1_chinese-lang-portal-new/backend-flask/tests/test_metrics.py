@@ -0,0 +1,68 @@
+"""Tests for the per-request SQL accounting and the Prometheus metrics."""
+import json
+import logging
+import re
+import sqlite3
+
+from app import create_app
+from lib.metrics import InstrumentedConnection, QueryStats, normalize
+
+def metric(text, name, **labels):
+  # Value of one sample of the exposition text
+  wanted = ','.join(f'{key}="{value}"' for key, value in labels.items())
+  match = re.search(rf'^{re.escape(name)}{{{re.escape(wanted)}}} (\S+)$', text, re.M)
+  return float(match.group(1)) if match else None
+
+def test_cursor_accounts_statements_and_rows():
+  connection = sqlite3.connect(':memory:', factory=InstrumentedConnection)
+  connection.stats = stats = QueryStats(slow_seconds=10)
+  connection.execute('CREATE TABLE t (id INTEGER PRIMARY KEY)')
+  connection.executemany('INSERT INTO t (id) VALUES (?)', ((i,) for i in range(10)))
+  assert len(connection.execute('SELECT id FROM t').fetchall()) == 10
+  assert len(list(connection.execute('SELECT id FROM t WHERE id < 4'))) == 4
+  cursor = connection.cursor()
+  cursor.execute('SELECT id FROM t')
+  assert len(cursor.fetchmany(3)) == 3 and cursor.fetchone() is not None
+  assert (stats.queries, stats.rows) == (5, 18)
+  assert stats.seconds > 0 and stats.slow == []
+
+def test_normalize():
+  assert normalize("SELECT *\n  FROM words WHERE id = 12 AND kanji = 'it''s'") == 'SELECT * FROM words WHERE id = ? AND kanji = ?'
+  assert normalize('SELECT * FROM idx_2') == 'SELECT * FROM idx_2'
+
+def test_metrics_endpoint(client):
+  response = client.get('/words?page=1')
+  assert response.headers['Server-Timing'].startswith('sql;dur=')
+  client.get('/words?page=2')
+  client.get('/words/99999')
+
+  response = client.get('/metrics')
+  assert response.status_code == 200 and response.mimetype == 'text/plain'
+  text = response.get_data(as_text=True)
+  assert metric(text, 'portal_requests_total', route='/words', method='GET', status='200') == 2
+  assert metric(text, 'portal_requests_total', route='/words/<int:word_id>', method='GET', status='404') == 1
+  assert metric(text, 'portal_request_duration_seconds_count', route='/words', method='GET') == 2
+  assert metric(text, 'portal_request_duration_seconds_bucket', route='/words', method='GET', le='+Inf') == 2
+  assert metric(text, 'portal_sql_queries_total', route='/words') >= 4
+  assert metric(text, 'portal_sql_rows_total', route='/words') >= 100
+  assert metric(text, 'portal_sqlite_lock_timeouts_total', route='/words') == 0
+  assert '# TYPE portal_request_duration_seconds histogram' in text
+
+def test_slow_queries_are_logged_with_their_plan(db_path, caplog):
+  app = create_app({'DATABASE': db_path, 'TESTING': True, 'SLOW_QUERY_MS': 0})
+  with caplog.at_level(logging.WARNING, logger='portal.slow_queries'):
+    assert app.test_client().get('/groups/1/words').status_code == 200
+  entries = [json.loads(record.getMessage()) for record in caplog.records]
+  assert entries and all(entry['route'] == '/groups/<int:id>/words' for entry in entries)
+  assert any('word_groups' in entry['sql'] and entry['plan'] for entry in entries)
+  assert all('\n' not in entry['sql'] for entry in entries)
+
+  text = app.test_client().get('/metrics').get_data(as_text=True)
+  assert metric(text, 'portal_slow_queries_total', route='/groups/<int:id>/words') == len(entries)
+  app.db.close_pool()
+
+def test_metrics_can_be_disabled(db_path):
+  app = create_app({'DATABASE': db_path, 'TESTING': True, 'METRICS': False})
+  client = app.test_client()
+  assert 'Server-Timing' not in client.get('/words').headers
+  assert client.get('/metrics').status_code == 404
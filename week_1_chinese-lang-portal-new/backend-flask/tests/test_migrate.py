@@ -0,0 +1,28 @@
+"""Tests for the versioned migration runner."""
+import sqlite3
+from flask import Flask
+from lib.db import Db
+from migrate import run_migrations
+
+def test_migrations_are_recorded_and_not_rerun(db_path):
+  assert run_migrations(db_path) == []
+  connection = sqlite3.connect(db_path)
+  versions = [row[0] for row in connection.execute('SELECT version FROM schema_migrations ORDER BY version')]
+  connection.close()
+  assert versions[:2] == ['001', '002']
+
+def test_duplicate_word_reviews_are_merged(tmp_path):
+  path = str(tmp_path / 'legacy.db')
+  db = Db(database=path)
+  with Flask(__name__).app_context():
+    db.setup_tables(db.cursor())
+    db.cursor().executescript('''
+      INSERT INTO words (kanji, romaji, english, parts) VALUES ('a', 'a', 'a', '[]'), ('b', 'b', 'b', '[]');
+      INSERT INTO word_reviews (word_id, correct_count, wrong_count) VALUES (1, 2, 1), (1, 3, 0), (2, 1, 1);
+    ''')
+    db.close()
+  run_migrations(path)
+  connection = sqlite3.connect(path)
+  rows = connection.execute('SELECT word_id, correct_count, wrong_count FROM word_reviews ORDER BY word_id').fetchall()
+  connection.close()
+  assert rows == [(1, 5, 1), (2, 1, 1)]
@@ -0,0 +1,53 @@
+"""Tests for keyset (cursor=) pagination of the listing routes."""
+import pytest
+
+def walk(client, url):
+  rows, token, pages = [], '', 0
+  while token is not None:
+    separator = '&' if '?' in url else '?'
+    data = client.get(f'{url}{separator}cursor={token}').get_json()
+    key = 'items' if 'items' in data else 'words'
+    rows.extend(data[key])
+    token = data['next_cursor']
+    pages += 1
+  return rows, pages
+
+@pytest.mark.parametrize('sort_by', ['kanji', 'romaji', 'english'])
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_word_cursor_walk_visits_every_word_in_order(client, sort_by, order):
+  rows, pages = walk(client, f'/words?sort_by={sort_by}&order={order}')
+  assert len(rows) == 123 and len({row['id'] for row in rows}) == 123
+  assert pages == 3
+  keys = [(row[sort_by], row['id']) for row in rows]
+  assert keys == sorted(keys, reverse=order == 'desc')
+
+def test_word_cursor_sorted_by_review_counts(client, session_id):
+  for word_id in (5, 5, 9):
+    client.post(f'/study_sessions/{session_id}/review', json={'word_id': word_id, 'correct': True})
+  rows, _ = walk(client, '/words?sort_by=correct_count&order=desc')
+  assert [row['id'] for row in rows[:2]] == [5, 9]
+  assert len({row['id'] for row in rows}) == 123
+
+def test_word_cursor_total_is_opt_in(client):
+  assert 'total_words' not in client.get('/words?cursor=').get_json()
+  assert client.get('/words?cursor=&include_total=true').get_json()['total_words'] == 123
+
+def test_invalid_cursor_is_rejected(client):
+  assert client.get('/words?cursor=not-a-cursor').status_code == 400
+
+def test_page_parameter_still_works(client):
+  data = client.get('/words?page=2').get_json()
+  assert data['current_page'] == 2 and data['total_pages'] == 3
+
+def test_group_words_cursor_walk(client):
+  rows, pages = walk(client, '/groups/1/words')
+  assert len(rows) == 60 and pages == 6
+  first = client.get('/groups/1/words?cursor=').get_json()
+  assert first['total_words'] == 60
+
+def test_study_sessions_cursor_walk(client):
+  for _ in range(12):
+    client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1})
+  rows, pages = walk(client, '/api/study-sessions')
+  assert len(rows) == 12 and pages == 2
+  assert [row['id'] for row in rows] == list(range(12, 0, -1))
@@ -0,0 +1,27 @@
+"""Checks that every portal route query is served by an index."""
+from lib.query_plans import check_query_plans, explain, plan_problems
+
+def test_route_queries_do_not_scan_tables(app):
+  failures = check_query_plans(app)
+  assert failures == [], '\n'.join(f'{route}: {problems} {sql}' for route, sql, problems in failures)
+
+def test_bare_scans_are_reported():
+  tables = {'words', 'study_activities'}
+  assert plan_problems(['SCAN words'], tables) == ['SCAN words']
+  assert plan_problems(['SCAN words USING COVERING INDEX idx_words_kanji'], tables) == []
+  assert plan_problems(['SEARCH r USING AUTOMATIC COVERING INDEX (word_id=?)'], tables) != []
+  assert plan_problems(['SCAN study_activities', 'SCAN word_stats'], tables) == []
+
+def test_scans_of_aliased_tables_are_reported(app):
+  tables = {'words', 'word_groups', 'study_activities'}
+  assert plan_problems(['SCAN wg'], tables, 'SELECT 1 FROM word_groups AS wg') == ['SCAN wg']
+  # CTEs and subqueries keep their names in the plan
+  assert plan_problems(['SCAN m'], tables, 'WITH m AS (SELECT 1) SELECT * FROM m') == []
+  assert plan_problems(['SCAN sa'], tables, 'SELECT * FROM study_activities sa') == []
+
+  connection = app.db.connect()
+  try:
+    sql = "SELECT w.kanji FROM words AS w WHERE w.parts LIKE '%ta%'"
+    assert plan_problems(explain(connection, sql), tables, sql) == ['SCAN w']
+  finally:
+    connection.close()
@@ -0,0 +1,96 @@
+"""Tests for the route response cache and its write invalidation."""
+import threading
+import pytest
+from app import create_app
+from lib.cache import LocalCacheBackend, cache_server
+
+@pytest.fixture
+def cached_app(db_path):
+  app = create_app({'DATABASE': db_path, 'TESTING': True, 'RESPONSE_CACHE': True})
+  yield app
+  app.db.close_pool()
+
+@pytest.fixture
+def cached_client(cached_app):
+  return cached_app.test_client()
+
+def route_stats(client, rule):
+  return client.get('/api/cache/stats').get_json()['routes'].get(rule, {'hits': 0, 'misses': 0, 'stores': 0})
+
+def test_disabled_by_default(client):
+  client.get('/groups')
+  client.get('/groups')
+  stats = client.get('/api/cache/stats').get_json()
+  assert stats['enabled'] is False and stats['hits'] == 0
+
+def test_repeated_get_is_a_hit(cached_client):
+  first = cached_client.get('/groups')
+  second = cached_client.get('/groups')
+  assert second.status_code == 200 and second.data == first.data
+  assert route_stats(cached_client, '/groups') == {'hits': 1, 'misses': 1, 'stores': 1}
+
+def test_query_args_are_normalized(cached_client):
+  cached_client.get('/words?page=2&sort_by=english')
+  cached_client.get('/words?sort_by=english&page=2')
+  cached_client.get('/words?sort_by=english&page=3')
+  assert route_stats(cached_client, '/words') == {'hits': 1, 'misses': 2, 'stores': 2}
+
+def test_errors_are_not_cached(cached_client):
+  cached_client.get('/groups/999')
+  assert cached_client.get('/groups/999').status_code == 404
+  assert route_stats(cached_client, '/groups/<int:id>')['stores'] == 0
+
+def test_create_session_invalidates_session_listings(cached_client):
+  before = cached_client.get('/api/study-sessions').get_json()['total']
+  cached_client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1})
+  assert cached_client.get('/api/study-sessions').get_json()['total'] == before + 1
+
+def test_review_invalidates_word_counts(cached_client):
+  session_id = cached_client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1}).get_json()['session_id']
+  assert cached_client.get('/words/1').get_json()['word']['correct_count'] == 0
+  cached_client.post(f'/study_sessions/{session_id}/review', json={'word_id': 1, 'correct': True})
+  assert cached_client.get('/words/1').get_json()['word']['correct_count'] == 1
+
+  # Unrelated tags are left alone
+  cached_client.get('/groups')
+  cached_client.post(f'/study_sessions/{session_id}/reviews', json=[{'word_id': 1, 'correct': True}])
+  cached_client.get('/groups')
+  assert route_stats(cached_client, '/groups')['hits'] == 1
+  assert cached_client.get('/words/1').get_json()['word']['correct_count'] == 2
+
+def test_backend_is_bounded():
+  backend = LocalCacheBackend(max_entries=3, max_bytes=10)
+  for key in 'abcd':
+    backend.store(key, {}, 200, 'application/json', b'xx')
+  assert backend.lookup('a') is None and backend.info()['entries'] == 3
+  backend.store('big', {}, 200, 'application/json', b'x' * 9)
+  assert backend.info()['bytes'] <= 10 and backend.lookup('big') is not None
+  assert not backend.store('huge', {}, 200, 'application/json', b'x' * 11)
+
+def test_stale_generations_are_not_stored():
+  backend = LocalCacheBackend()
+  generations = backend.generations(['words'])
+  backend.invalidate(['words'])
+  assert not backend.store('k', generations, 200, 'application/json', b'{}')
+
+def test_shared_backend(db_path):
+  server = cache_server(('127.0.0.1', 0), b'test')
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  config = {'DATABASE': db_path, 'TESTING': True, 'RESPONSE_CACHE': True,
+            'RESPONSE_CACHE_ADDRESS': server.address, 'RESPONSE_CACHE_AUTHKEY': b'test'}
+  first, second = create_app(config), create_app(config)
+  try:
+    first.test_client().get('/groups/1')
+    assert route_stats(second.test_client(), '/groups/<int:id>')['misses'] == 0
+    second.test_client().get('/groups/1')
+    assert route_stats(second.test_client(), '/groups/<int:id>')['hits'] == 1
+
+    # A write in one worker invalidates the other's entries
+    session_id = first.test_client().post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1}).get_json()['session_id']
+    listing = second.test_client().get('/api/study-sessions').get_json()
+    first.test_client().post(f'/study_sessions/{session_id}/review', json={'word_id': 1, 'correct': True})
+    assert second.test_client().get('/api/study-sessions').get_json() != listing
+    assert second.test_client().get('/api/cache/stats').get_json()['backend']['entries'] >= 1
+  finally:
+    first.db.close_pool()
+    second.db.close_pool()
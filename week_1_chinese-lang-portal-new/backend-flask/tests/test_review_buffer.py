@@ -0,0 +1,130 @@
+"""Tests for the write-behind review buffer."""
+import json
+import logging
+import os
+import time
+
+import pytest
+from app import create_app
+from lib import stats
+from lib.review_buffer import BufferFull, ReviewBuffer
+
+@pytest.fixture
+def buffered_app(db_path, tmp_path):
+  app = create_app({
+    'DATABASE': db_path,
+    'TESTING': True,
+    'REVIEW_BUFFER': True,
+    'REVIEW_BUFFER_PATH': str(tmp_path / 'reviews.ndjson'),
+    'REVIEW_BUFFER_FLUSH_MS': 60000,
+    'REVIEW_BUFFER_MAX_ITEMS': 3,
+  })
+  yield app
+  app.review_buffer.close()
+
+def review_count(app):
+  connection = app.db.connect()
+  count = connection.execute('SELECT COUNT(*) FROM word_review_items').fetchone()[0]
+  connection.close()
+  return count
+
+def test_reviews_are_acknowledged_then_flushed(buffered_app):
+  client = buffered_app.test_client()
+  session_id = client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1}).get_json()['session_id']
+  for word_id in (1, 2):
+    response = client.post(f'/study_sessions/{session_id}/review', json={'word_id': word_id, 'correct': True})
+    assert response.status_code == 202
+  assert review_count(buffered_app) == 0
+  assert client.get('/api/review-buffer').get_json()['queue_depth'] == 2
+
+  assert buffered_app.review_buffer.flush() == 2
+  assert review_count(buffered_app) == 2
+  metrics = client.get('/api/review-buffer').get_json()
+  assert metrics['queue_depth'] == 0 and metrics['flushes_total'] == 1
+  connection = buffered_app.db.connect()
+  assert stats.drift(connection) == []
+  connection.close()
+
+def test_full_buffer_rejects_with_503(buffered_app):
+  client = buffered_app.test_client()
+  session_id = client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1}).get_json()['session_id']
+  codes = [client.post(f'/study_sessions/{session_id}/review', json={'word_id': 1, 'correct': True}).status_code
+           for _ in range(4)]
+  assert codes == [202, 202, 202, 503]
+
+def test_close_drains_the_queue(app, session_id, tmp_path):
+  buffer = ReviewBuffer(app.db, str(tmp_path / 'reviews.ndjson'), flush_interval_ms=60000).start()
+  buffer.submit(session_id, 1, True)
+  buffer.close()
+  assert review_count(app) == 1
+  assert not os.path.exists(tmp_path / 'reviews.ndjson')
+  with pytest.raises(BufferFull):
+    buffer.submit(session_id, 1, True)
+
+def test_crash_replay_writes_each_review_once(app, session_id, tmp_path):
+  spill = tmp_path / 'reviews.ndjson'
+  # A segment that committed but was not deleted before the crash...
+  done = ReviewBuffer(app.db, str(spill), flush_interval_ms=60000).start()
+  done.submit(session_id, 1, True)
+  done.flush()
+  done.close()
+  connection = app.db.connect()
+  name = connection.execute('SELECT name FROM review_buffer_segments').fetchone()[0]
+  connection.close()
+  (tmp_path / name).write_text(json.dumps([session_id, 1, 1, '2025-01-01 00:00:00']) + '\n')
+  # ...and an active spill file with a torn last line
+  spill.write_text(json.dumps([session_id, 2, 0, '2025-01-01 00:00:01']) + '\n[' )
+
+  buffer = ReviewBuffer(app.db, str(spill), flush_interval_ms=60000).start()
+  assert buffer.metrics()['replayed_total'] == 1
+  buffer.close()
+  assert review_count(app) == 2
+  assert list(tmp_path.glob('*.flushing')) == []
+
+def test_background_flush_writes_the_reviews(db_path, tmp_path):
+  # The connection is opened by start() on this thread and written to by
+  # the flusher thread
+  app = create_app({
+    'DATABASE': db_path,
+    'TESTING': True,
+    'REVIEW_BUFFER': True,
+    'REVIEW_BUFFER_PATH': str(tmp_path / 'reviews.ndjson'),
+    'REVIEW_BUFFER_FLUSH_MS': 10,
+  })
+  try:
+    client = app.test_client()
+    session_id = client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1}).get_json()['session_id']
+    for word_id in (1, 2, 3):
+      assert client.post(f'/study_sessions/{session_id}/review', json={'word_id': word_id, 'correct': True}).status_code == 202
+    deadline = time.monotonic() + 5
+    while app.review_buffer.metrics()['flushed_total'] < 3 and time.monotonic() < deadline:
+      time.sleep(0.01)
+    metrics = app.review_buffer.metrics()
+    assert (metrics['flushed_total'], metrics['flush_errors_total']) == (3, 0)
+    assert review_count(app) == 3
+  finally:
+    app.review_buffer.close()
+
+def test_failed_flushes_are_logged_and_cap_the_backlog(app, session_id, tmp_path, caplog):
+  buffer = ReviewBuffer(app.db, str(tmp_path / 'reviews.ndjson'), flush_interval_ms=60000, max_items=2).start()
+  connection = app.db.connect()
+  connection.execute('ALTER TABLE review_buffer_segments RENAME TO segments_moved')
+  connection.commit()
+
+  buffer.submit(session_id, 1, True)
+  with caplog.at_level(logging.ERROR, logger='lib.review_buffer'):
+    assert buffer.flush() == 0
+  assert 'Review buffer flush failed' in caplog.text
+  metrics = buffer.metrics()
+  assert (metrics['flush_errors_total'], metrics['pending_reviews']) == (1, 1)
+  # The failed segment still counts against max_items
+  buffer.submit(session_id, 2, True)
+  with pytest.raises(BufferFull):
+    buffer.submit(session_id, 3, True)
+
+  connection.execute('ALTER TABLE segments_moved RENAME TO review_buffer_segments')
+  connection.commit()
+  connection.close()
+  assert buffer.flush() == 2
+  buffer.close()
+  assert review_count(app) == 2
@@ -0,0 +1,40 @@
+"""Tests for random sampling over the dense group positions."""
+
+def positions(app, group_id):
+  connection = app.db.connect()
+  rows = connection.execute('SELECT position FROM word_groups WHERE group_id = ? ORDER BY position', (group_id,)).fetchall()
+  connection.close()
+  return [row[0] for row in rows]
+
+def test_sample_returns_distinct_group_words(client):
+  words = client.get('/groups/1/words/sample?n=25').get_json()['words']
+  ids = [word['id'] for word in words]
+  assert len(ids) == 25 and len(set(ids)) == 25
+  assert all(1 <= word_id <= 60 for word_id in ids)
+  assert isinstance(words[0]['parts'], list)
+
+def test_sample_is_capped_by_the_group_size(client):
+  words = client.get('/groups/1/words/sample?n=100').get_json()['words']
+  assert sorted(word['id'] for word in words) == list(range(1, 61))
+
+def test_positions_stay_dense(app, client, tmp_path):
+  assert positions(app, 1) == list(range(1, 61))
+
+  connection = app.db.connect()
+  connection.execute('DELETE FROM word_groups WHERE group_id = 1 AND word_id IN (5, 60)')
+  connection.execute('INSERT INTO word_groups (word_id, group_id) VALUES (61, 1)')
+  connection.commit()
+  connection.close()
+  assert positions(app, 1) == list(range(1, 60))
+
+  # The importer numbers its new members itself
+  path = tmp_path / 'words.ndjson'
+  path.write_text('{"kanji": "鳥", "romaji": "tori", "english": "bird"}\n', encoding='utf-8')
+  from lib.importer import import_words
+  connection = app.db.connect()
+  import_words(connection, str(path), group_names=['Core Verbs'])
+  connection.close()
+  assert positions(app, 1) == list(range(1, 61))
+
+def test_sample_of_unknown_group(client):
+  assert client.get('/groups/999/words/sample').status_code == 404
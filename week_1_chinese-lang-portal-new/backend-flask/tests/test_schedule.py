@@ -0,0 +1,57 @@
+"""Tests for the spaced repetition schedule and the due queue."""
+from datetime import datetime, timedelta
+import pytest
+
+from lib import schedule
+
+def test_sm2_intervals():
+  answered = datetime(2025, 3, 1, 10, 0, 0)
+  ease, interval, repetitions, due = schedule.next_schedule(2.5, 0, 0, True, answered)
+  assert (ease, interval, repetitions, due) == (2.5, 1, 1, answered + timedelta(days=1))
+  ease, interval, repetitions, due = schedule.next_schedule(ease, interval, repetitions, True, answered)
+  assert (interval, repetitions) == (6, 2)
+  ease, interval, repetitions, due = schedule.next_schedule(ease, interval, repetitions, True, answered)
+  assert (interval, repetitions) == (15, 3)
+
+  # A wrong answer starts the word over, soon, with a lower ease
+  ease, interval, repetitions, due = schedule.next_schedule(ease, interval, repetitions, False, answered)
+  assert ease == pytest.approx(2.18) and (interval, repetitions) == (0, 0)
+  assert due == answered + schedule.RELEARN_DELAY
+  assert schedule.next_schedule(1.4, 0, 0, False, answered)[0] == schedule.MIN_EASE
+
+def test_new_words_come_in_order(client, session_id):
+  data = client.get(f'/study_sessions/{session_id}/next?n=3').get_json()
+  assert data['group_id'] == 1
+  assert [word['id'] for word in data['words']] == [1, 2, 3]
+  assert data['words'][0]['due_at'] is None and isinstance(data['words'][0]['parts'], list)
+
+def test_reviews_move_words_through_the_queue(client, session_id):
+  client.post(f'/study_sessions/{session_id}/review', json={'word_id': 1, 'correct': True})
+  client.post(f'/study_sessions/{session_id}/reviews', json=[
+    {'word_id': 2, 'correct': False, 'answered_at': '2025-03-01T10:00:00Z'},
+    {'word_id': 3, 'correct': True, 'answered_at': '2025-03-01T10:00:00Z'},
+    {'word_id': 3, 'correct': True, 'answered_at': '2025-03-02T10:00:00Z'},
+  ])
+
+  words = client.get(f'/study_sessions/{session_id}/next?n=100').get_json()['words']
+  ids = [word['id'] for word in words]
+  # Overdue first (the missed word, then word 3 due six days after its
+  # second review), then the new words, then word 1 due tomorrow
+  assert ids[:3] == [2, 3, 4]
+  assert words[0]['due_at'] == '2025-03-01 10:10:00'
+  assert words[1]['due_at'] == '2025-03-08 10:00:00'
+  assert ids[-1] == 1 and len(ids) == 60
+
+def test_schedule_follows_group_membership(app, client, session_id):
+  client.post(f'/study_sessions/{session_id}/reviews', json=[{'word_id': 1, 'correct': False, 'answered_at': '2025-03-01T10:00:00Z'}])
+  connection = app.db.connect()
+  connection.execute('INSERT INTO word_groups (word_id, group_id) VALUES (1, 2)')
+  connection.commit()
+  connection.close()
+
+  other = client.post('/study_sessions', json={'group_id': 2, 'study_activity_id': 1}).get_json()['session_id']
+  first = client.get(f'/study_sessions/{other}/next?n=1').get_json()['words'][0]
+  assert (first['id'], first['due_at']) == (1, '2025-03-01 10:10:00')
+
+def test_next_requires_a_session(client):
+  assert client.get('/study_sessions/999/next').status_code == 404
@@ -0,0 +1,74 @@
+"""Tests for GET /words/search."""
+from lib.importer import import_words
+from lib.search import match_query
+
+def search(client, query):
+  response = client.get('/words/search', query_string=query)
+  assert response.status_code == 200
+  return response.get_json()['words']
+
+def test_match_query_quotes_tokens():
+  assert match_query('tabe') == '"tabe"*'
+  assert match_query('to eat', prefix=False) == '"to" "eat"'
+  assert match_query('NEAR(" OR *') == '"NEAR"* "OR"*'
+  assert match_query(' -" ') is None
+
+def test_search_by_romaji_english_and_kanji(client):
+  assert [word['romaji'] for word in search(client, {'q': 'taberu'})] == ['taberu']
+  assert 'taberu' in [word['romaji'] for word in search(client, {'q': 'tabe'})]
+  assert 'taberu' in [word['romaji'] for word in search(client, {'q': 'eat'})]
+  assert [word['romaji'] for word in search(client, {'q': '食べる'})] == ['taberu']
+
+def test_whole_terms_rank_before_prefixes(app, client, tmp_path):
+  path = tmp_path / 'hana.ndjson'
+  path.write_text(
+    '{"kanji": "花火", "romaji": "hanabi", "english": "fireworks"}\n'
+    '{"kanji": "花", "romaji": "hana", "english": "flower"}\n', encoding='utf-8')
+  connection = app.db.connect()
+  import_words(connection, str(path))
+  connection.close()
+  assert [word['kanji'] for word in search(client, {'q': 'hana'})][:2] == ['花', '花火']
+
+def test_whole_terms_keep_the_best_matches_past_the_cap(app, client, tmp_path, monkeypatch):
+  monkeypatch.setattr('routes.words.MAX_RANKED_MATCHES', 2)
+  path = tmp_path / 'kiwi.ndjson'
+  path.write_text(
+    ''.join(f'{{"kanji": "キウイパイ{n}", "romaji": "kiwipai{n}", "english": "kiwi pie with cream and sugar"}}\n' for n in range(3)) +
+    '{"kanji": "キウイ", "romaji": "kiwi", "english": "kiwi"}\n', encoding='utf-8')
+  connection = app.db.connect()
+  import_words(connection, str(path))
+  connection.close()
+  assert search(client, {'q': 'kiwi'})[0]['kanji'] == 'キウイ'
+
+def test_group_filter_and_counts(client, session_id):
+  client.post(f'/study_sessions/{session_id}/review', json={'word_id': 1, 'correct': True})
+  word = client.get('/words/1').get_json()['word']
+  found = search(client, {'q': word['romaji']})
+  assert {'correct_count': 1, 'wrong_count': 0}.items() <= found[0].items()
+
+  adjective_group = next(group['id'] for group in client.get('/words/1').get_json()['word']['groups'])
+  other_group = 3 - adjective_group
+  assert search(client, {'q': word['romaji'], 'group_id': adjective_group})
+  assert not search(client, {'q': word['romaji'], 'group_id': other_group})
+
+def test_imported_words_are_searchable(app, client, tmp_path):
+  path = tmp_path / 'new.ndjson'
+  path.write_text('{"kanji": "眩しい", "romaji": "mabushii", "english": "dazzling"}\n', encoding='utf-8')
+  connection = app.db.connect()
+  import_words(connection, str(path), group_names=['Core Adjectives'])
+  connection.close()
+  assert [word['kanji'] for word in search(client, {'q': 'dazz'})] == ['眩しい']
+
+def test_updates_and_deletes_are_reindexed(app, client):
+  connection = app.db.connect()
+  connection.execute("UPDATE words SET english = 'to devour' WHERE romaji = 'taberu'")
+  connection.commit()
+  assert [word['romaji'] for word in search(client, {'q': 'devour'})] == ['taberu']
+  connection.execute("DELETE FROM word_groups WHERE word_id IN (SELECT id FROM words WHERE romaji = 'taberu')")
+  connection.execute("DELETE FROM words WHERE romaji = 'taberu'")
+  connection.commit()
+  connection.close()
+  assert search(client, {'q': 'devour'}) == []
+
+def test_requires_a_query(client):
+  assert client.get('/words/search?q=%20').status_code == 400
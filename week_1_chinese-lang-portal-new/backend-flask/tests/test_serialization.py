@@ -0,0 +1,63 @@
+"""Tests for the orjson provider and the SQL-built raw group payload."""
+import json
+import shutil
+from datetime import datetime
+
+import pytest
+
+from app import create_app
+from lib.serialization import JSONProvider, OrjsonProvider, json_provider
+
+ROUTES = [
+  '/words?page=1',
+  '/words?ids=3,1,2',
+  '/groups/1/words?page=1',
+  '/dashboard/stats',
+  '/api/groups/1/words/raw',
+]
+
+def responses(seeded_db, path, use_orjson, urls):
+  db_path = str(path)
+  shutil.copyfile(seeded_db, db_path)
+  app = create_app({'DATABASE': db_path, 'TESTING': True, 'JSON_ORJSON': use_orjson})
+  client = app.test_client()
+  session_id = client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1}).get_json()['session_id']
+  bodies = {}
+  for url in urls + [f'/study_sessions/{session_id}/next?n=5']:
+    response = client.get(url)
+    assert response.status_code == 200, url
+    bodies[url.replace(str(session_id), '<id>')] = json.loads(response.data)
+  app.db.close_pool()
+  return bodies
+
+def test_raw_words_payload(client):
+  data = client.get('/api/groups/1/words/raw').get_json()
+  assert data['group_id'] == 1 and isinstance(data['group_name'], str)
+  ids = [word['id'] for word in data['words']]
+  assert ids and ids == sorted(ids)
+  for word in data['words']:
+    assert sorted(word) == ['english', 'id', 'kanji', 'parts', 'romaji']
+    assert isinstance(word['parts'], list)
+
+def test_stdlib_provider_without_orjson_option(app):
+  assert isinstance(json_provider(app, use_orjson=False), JSONProvider)
+  assert not isinstance(json_provider(app, use_orjson=False), OrjsonProvider)
+  assert json_provider(app, use_orjson=False).fragment('[{"kanji": "一"}]') == [{'kanji': '一'}]
+
+def test_providers_give_the_same_documents(seeded_db, tmp_path):
+  pytest.importorskip('orjson')
+  with_orjson = responses(seeded_db, tmp_path / 'orjson.db', True, ROUTES)
+  assert with_orjson == responses(seeded_db, tmp_path / 'stdlib.db', False, ROUTES)
+
+def test_orjson_provider_matches_flask_conventions(app):
+  pytest.importorskip('orjson')
+  provider = json_provider(app)
+  assert isinstance(provider, OrjsonProvider)
+  value = {'b': 1, 'a': datetime(2024, 1, 2, 3, 4, 5), 'c': '中文'}
+  assert json.loads(provider.dumps(value)) == json.loads(JSONProvider(app).dumps(value))
+  assert list(provider.loads(provider.dumps(value))) == ['a', 'b', 'c']
+  with app.test_request_context():
+    response = provider.response(value)
+  assert response.mimetype == 'application/json'
+  assert json.loads(response.data)['a'] == 'Tue, 02 Jan 2024 03:04:05 GMT'
+  assert provider.dumps([1], indent=2) == '[\n  1\n]'
@@ -0,0 +1,58 @@
+"""Tests for the review summaries maintained on study_sessions."""
+from datetime import datetime, timedelta
+from lib import stats
+
+def test_summaries_follow_reviews(app, client, session_id):
+  client.post(f'/study_sessions/{session_id}/review', json={'word_id': 1, 'correct': True})
+  client.post(f'/study_sessions/{session_id}/reviews', json=[
+    {'word_id': 2, 'correct': False, 'answered_at': '2099-01-01T00:00:00Z'},
+    {'word_id': 3, 'correct': True},
+  ])
+
+  session = client.get(f'/api/study-sessions/{session_id}').get_json()['session']
+  assert (session['review_items_count'], session['correct_count'], session['wrong_count']) == (3, 2, 1)
+  assert session['end_time'] == '2099-01-01 00:00:00'
+
+  listed = client.get('/api/study-sessions').get_json()['items'][0]
+  assert listed['id'] == session_id and listed['review_items_count'] == 3
+  by_activity = client.get('/api/study-activities/1/sessions').get_json()['items'][0]
+  assert by_activity['review_items_count'] == 3 and by_activity['end_time'] == '2099-01-01 00:00:00'
+
+  recent = client.get('/dashboard/recent-session').get_json()
+  assert (recent['correct_count'], recent['wrong_count']) == (2, 1)
+
+  connection = app.db.connect()
+  assert stats.drift(connection) == []
+  connection.close()
+
+def test_group_listing_sorts_on_summaries(client):
+  quiet = client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1}).get_json()['session_id']
+  busy = client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1}).get_json()['session_id']
+  client.post(f'/study_sessions/{busy}/reviews', json=[{'word_id': 1, 'correct': True}] * 3)
+
+  sessions = client.get('/groups/1/study_sessions?sort_by=reviewItemsCount&order=desc').get_json()['study_sessions']
+  assert [(session['id'], session['review_items_count']) for session in sessions] == [(busy, 3), (quiet, 0)]
+
+  # A session without reviews is shown as lasting 30 minutes
+  start = datetime.fromisoformat(sessions[1]['start_time'])
+  assert sessions[1]['end_time'] == (start + timedelta(minutes=30)).strftime('%Y-%m-%d %H:%M:%S')
+
+def test_group_listing_sorts_on_the_end_time_shown(client):
+  quiet = client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1}).get_json()['session_id']
+  old = client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1}).get_json()['session_id']
+  client.post(f'/study_sessions/{old}/reviews', json=[{'word_id': 1, 'correct': True, 'answered_at': '2020-01-01T00:00:00Z'}])
+
+  for order, expected in (('desc', [quiet, old]), ('asc', [old, quiet])):
+    sessions = client.get(f'/groups/1/study_sessions?sort_by=endTime&order={order}').get_json()['study_sessions']
+    assert [session['id'] for session in sessions] == expected
+
+def test_rebuild_repairs_summaries(app, client, session_id):
+  client.post(f'/study_sessions/{session_id}/review', json={'word_id': 1, 'correct': False})
+  connection = app.db.connect()
+  connection.execute('UPDATE study_sessions SET review_items_count = 7, wrong_count = 0')
+  connection.commit()
+  differences = stats.drift(connection)
+  assert len(differences) == 1 and differences[0].startswith(f'study_sessions[{session_id}] summary: (7, 0, 0,')
+  stats.rebuild(connection)
+  assert stats.drift(connection) == []
+  connection.close()
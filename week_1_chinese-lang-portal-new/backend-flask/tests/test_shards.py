@@ -0,0 +1,183 @@
+"""Tests for the learner shards and the cross-learner dashboard."""
+import sqlite3
+
+import pytest
+
+from app import create_app
+from lib import schedule, stats
+from lib.shards import SCHEMA_VERSION, Shards
+
+ALICE = {'X-Learner-Id': 'alice'}
+BOB = {'X-Learner-Id': 'bob'}
+
+@pytest.fixture
+def sharded_app(db_path, tmp_path):
+  app = create_app({'DATABASE': db_path, 'TESTING': True, 'SHARDS_DIRECTORY': str(tmp_path / 'shards')})
+  yield app
+  app.history_reset.close()
+  app.db.close_pool()
+
+def log_session(client, headers, reviews):
+  response = client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1}, headers=headers)
+  session_id = response.get_json()['session_id']
+  assert client.post(f'/study_sessions/{session_id}/reviews', json=reviews, headers=headers).status_code == 201
+  return session_id
+
+def test_learner_history_is_written_to_its_shard(sharded_app, db_path):
+  client = sharded_app.test_client()
+  session_id = log_session(client, ALICE, [{'word_id': 1, 'correct': True}, {'word_id': 1, 'correct': False}])
+
+  main = sqlite3.connect(db_path)
+  try:
+    assert main.execute('SELECT COUNT(*) FROM study_sessions').fetchone()[0] == 0
+    assert main.execute('SELECT correct_count, wrong_count FROM words WHERE id = 1').fetchone() == (0, 0)
+  finally:
+    main.close()
+  connection = sharded_app.db.connect(shard='learner_alice')
+  try:
+    assert connection.execute('SELECT COUNT(*) FROM main.word_review_items').fetchone()[0] == 2
+    assert stats.drift(connection) == []
+  finally:
+    connection.close()
+
+  # The learner's counters are laid over the shared words
+  assert client.get('/words/1', headers=ALICE).get_json()['word']['correct_count'] == 1
+  assert client.get('/words/1', headers=BOB).get_json()['word']['correct_count'] == 0
+  assert client.get('/words/1').get_json()['word']['correct_count'] == 0
+  assert client.get('/dashboard/stats', headers=ALICE).get_json()['total_sessions'] == 1
+  assert client.get('/dashboard/stats', headers=BOB).get_json()['total_sessions'] == 0
+  assert client.get(f'/api/study-sessions/{session_id}', headers=ALICE).get_json()['total'] == 1
+  assert client.get(f'/api/study-sessions/{session_id}', headers=BOB).status_code == 404
+
+  response = client.get(f'/study_sessions/{session_id}/next?n=3', headers=ALICE)
+  assert response.status_code == 200 and len(response.get_json()['words']) == 3
+
+def test_learner_ids_are_validated_and_cohorts_are_stable(sharded_app, tmp_path):
+  response = sharded_app.test_client().get('/dashboard/stats', headers={'X-Learner-Id': '../main'})
+  assert response.status_code == 400
+  cohorts = Shards(str(tmp_path / 'cohorts'), cohorts=16)
+  assert cohorts.route('alice') == cohorts.route('alice') != cohorts.route('bob')
+  assert cohorts.route('alice').startswith('cohort_') and cohorts.route(None) is None
+
+def test_reset_clears_one_learner(sharded_app):
+  client = sharded_app.test_client()
+  log_session(client, ALICE, [{'word_id': 1, 'correct': True}])
+  log_session(client, BOB, [{'word_id': 2, 'correct': True}])
+  assert client.post('/api/study-sessions/reset', headers=ALICE).status_code == 200
+  assert client.get('/api/study-sessions', headers=ALICE).get_json()['items'] == []
+  assert len(client.get('/api/study-sessions', headers=BOB).get_json()['items']) == 1
+
+def test_cached_responses_are_kept_per_learner(db_path, tmp_path):
+  app = create_app({
+    'DATABASE': db_path, 'TESTING': True, 'RESPONSE_CACHE': True,
+    'SHARDS_DIRECTORY': str(tmp_path / 'shards')
+  })
+  client = app.test_client()
+  log_session(client, ALICE, [{'word_id': 1, 'correct': True}])
+  for _ in range(2):
+    assert len(client.get('/api/study-sessions', headers=ALICE).get_json()['items']) == 1
+    assert client.get('/api/study-sessions', headers=BOB).get_json()['items'] == []
+  app.db.close_pool()
+
+def test_pooled_shard_connections_are_evicted(db_path, tmp_path):
+  app = create_app({
+    'DATABASE': db_path, 'TESTING': True, 'DB_POOL': True, 'SHARD_CONNECTIONS': 2,
+    'SHARDS_DIRECTORY': str(tmp_path / 'shards')
+  })
+  client = app.test_client()
+  for learner in ('a', 'b', 'c', 'a'):
+    response = client.post('/study_sessions', json={'group_id': 1, 'study_activity_id': 1}, headers={'X-Learner-Id': learner})
+    assert response.status_code == 201
+  assert list(app.db._local.shards) == [('learner_c', False), ('learner_a', False)]
+  assert client.get('/dashboard/stats', headers={'X-Learner-Id': 'a'}).get_json()['total_sessions'] == 2
+  app.db.close_pool()
+
+def test_learners_dashboard_sums_every_shard(sharded_app):
+  client = sharded_app.test_client()
+  log_session(client, ALICE, [{'word_id': 1, 'correct': True}, {'word_id': 2, 'correct': False}])
+  log_session(client, BOB, [{'word_id': 1, 'correct': True}])
+  log_session(client, {}, [{'word_id': 3, 'correct': True}])
+
+  response = client.get('/dashboard/learners')
+  assert response.status_code == 200
+  dashboard = response.get_json()
+  assert (dashboard['shards'], dashboard['active_shards']) == (3, 3)
+  assert (dashboard['total_sessions'], dashboard['total_reviews'], dashboard['correct_reviews']) == (3, 4, 3)
+  assert dashboard['success_rate'] == 0.75 and dashboard['errors'] == []
+  assert [day['learners'] for day in dashboard['days']] == [3]
+  assert [learner['shard'] for learner in dashboard['learners']] == [None, 'learner_alice', 'learner_bob']
+  assert client.get('/dashboard/learners?days=0').status_code == 400
+
+# Shard tables without a counterpart in the main database
+SHARD_ONLY_TABLES = {'learner_dashboard_stats', 'word_group_due', 'word_group_due_sync'}
+
+def schema(path, tables=None):
+  # Columns and index definitions per table
+  connection = sqlite3.connect(path)
+  try:
+    names = tables or {row[0] for row in connection.execute(
+      "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")}
+    return {
+      name: (
+        [tuple(row)[1:] for row in connection.execute(f'PRAGMA table_info("{name}")')],
+        sorted(' '.join(row[0].split()) for row in connection.execute(
+          "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (name,)))
+      )
+      for name in names
+    }
+  finally:
+    connection.close()
+
+def test_shard_schema_matches_the_migrations(sharded_app, db_path):
+  # sql/shard/schema.sql is written by hand; the learner tables must keep
+  # the columns and indexes the migrations give them in the main database
+  sharded_app.test_client().get('/dashboard/stats', headers=ALICE)
+  shard = schema(sharded_app.db.shards.path('learner_alice'))
+  learner_tables = set(shard) - SHARD_ONLY_TABLES
+  assert shard.keys() >= SHARD_ONLY_TABLES
+  assert {name: shard[name] for name in learner_tables} == schema(db_path, learner_tables)
+
+def test_due_queue_reads_the_shard_index(sharded_app, db_path):
+  client = sharded_app.test_client()
+  log_session(client, ALICE, [{'word_id': 1, 'correct': False}, {'word_id': 2, 'correct': True}])
+  # A membership added to the shared vocabulary after word 1 was scheduled
+  main = sqlite3.connect(db_path)
+  try:
+    group_id = main.execute("INSERT INTO groups (name) VALUES ('Later')").lastrowid
+    main.execute('INSERT INTO word_groups (word_id, group_id) VALUES (1, ?)', (group_id,))
+    main.commit()
+  finally:
+    main.close()
+  log_session(client, ALICE, [{'word_id': 3, 'correct': True}])
+
+  connection = sharded_app.db.connect(shard='learner_alice')
+  try:
+    rows = connection.execute('SELECT group_id, word_id, due_at FROM word_group_due ORDER BY word_id, group_id').fetchall()
+    expected = connection.execute('''
+      SELECT wg.group_id, wg.word_id, s.due_at FROM shared.word_groups wg
+      JOIN main.word_schedules s ON s.word_id = wg.word_id
+      ORDER BY wg.word_id, wg.group_id
+    ''').fetchall()
+    assert [tuple(row) for row in rows] == [tuple(row) for row in expected]
+    assert (group_id, 1) in [tuple(row)[:2] for row in rows]
+    plan = ' '.join(row[3] for row in connection.execute(
+      'EXPLAIN QUERY PLAN SELECT word_id FROM word_group_due WHERE group_id = 1 AND due_at <= ? ORDER BY due_at, word_id', ('x',)))
+    assert 'SEARCH word_group_due USING PRIMARY KEY' in plan and 'TEMP B-TREE' not in plan
+
+    # Word 1 was answered wrong and comes back first; later answers move it
+    assert [row['id'] for row in schedule.due_words(connection.cursor(), group_id, 5, at='2100-01-01 00:00:00')] == [1]
+    connection.execute("UPDATE word_schedules SET due_at = '2000-01-01 00:00:00' WHERE word_id = 2")
+    assert [row['due_at'] for row in connection.execute('SELECT due_at FROM word_group_due WHERE word_id = 2')] == ['2000-01-01 00:00:00']
+    connection.rollback()
+
+    # Shards from before word_group_due are backfilled on their next connection
+    connection.execute('DELETE FROM word_group_due')
+    connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION - 1}')
+    connection.commit()
+  finally:
+    connection.close()
+  connection = sharded_app.db.connect(shard='learner_alice')
+  try:
+    assert connection.execute('SELECT COUNT(*) FROM word_group_due').fetchone()[0] == len(rows)
+  finally:
+    connection.close()
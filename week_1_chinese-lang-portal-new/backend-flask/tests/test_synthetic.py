@@ -0,0 +1,82 @@
+"""Tests for the synthetic data generator and the load test driver."""
+import shutil
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from app import create_app
+from lib import loadtest, stats, synthetic
+
+END = datetime(2025, 6, 30)
+SIZES = {'words': 300, 'groups': 6, 'sessions': 20, 'reviews': 500}
+
+def generate(path, seed=7):
+  connection = sqlite3.connect(path)
+  connection.row_factory = sqlite3.Row
+  synthetic.generate(connection, seed=seed, end=END, **SIZES)
+  return connection
+
+def dump(connection):
+  return [
+    [tuple(row) for row in connection.execute('SELECT kanji, romaji, english, parts FROM words ORDER BY id')],
+    [tuple(row) for row in connection.execute('SELECT word_id, study_session_id, correct, created_at FROM word_review_items ORDER BY id')],
+  ]
+
+def test_generated_data_is_consistent_and_skewed(db_path):
+  connection = generate(db_path)
+  count = lambda sql: connection.execute(sql).fetchone()[0]
+  assert count("SELECT COUNT(*) FROM groups WHERE name LIKE 'Synthetic %'") == 6
+  assert count('SELECT COUNT(*) FROM words') == 123 + 300
+  assert count('SELECT COUNT(*) FROM study_sessions') == 20
+  assert count('SELECT COUNT(*) FROM word_review_items') == 500
+  assert count("SELECT MAX(created_at) FROM word_review_items") < '2025-07-01'
+  # The summary tables agree with the generated history
+  assert stats.drift(connection) == []
+  assert count('SELECT COUNT(*) FROM word_schedules') == count('SELECT COUNT(DISTINCT word_id) FROM word_review_items')
+
+  sizes = [row[0] for row in connection.execute("SELECT words_count FROM groups WHERE name LIKE 'Synthetic %' ORDER BY name")]
+  assert sizes[0] > 2 * sizes[-1]
+  connection.close()
+
+def test_generator_is_reproducible(db_path, tmp_path):
+  copies = [str(tmp_path / f'copy{index}.db') for index in range(2)]
+  for copy in copies:
+    shutil.copyfile(db_path, copy)
+  first, second, third = generate(db_path), generate(copies[0]), generate(copies[1], seed=8)
+  assert dump(first) == dump(second)
+  assert dump(third) != dump(first)
+
+def test_indexes_come_back_when_a_run_fails(db_path, monkeypatch):
+  def failing(self, session_rows, group_members):
+    yield (1, session_rows[0][0], 1, session_rows[0][2])
+    raise RuntimeError('interrupted')
+  monkeypatch.setattr(synthetic.Generator, 'reviews', failing)
+  connection = sqlite3.connect(db_path)
+  indexes = lambda: {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")}
+  before = indexes()
+  with pytest.raises(RuntimeError):
+    synthetic.Generator(connection, seed=7, end=END, defer_after=1, **SIZES).run()
+  assert indexes() == before
+  connection.close()
+
+def test_load_test_reports_percentiles_per_route(db_path):
+  generate(db_path).close()
+  app = create_app({'DATABASE': db_path, 'TESTING': True, 'SLOW_QUERY_MS': 10000})
+  report = loadtest.run(app, requests=200, threads=2, seed=3)
+  app.db.close_pool()
+
+  assert sum(row['count'] for row in report['routes'].values()) == 200
+  assert all(row['errors'] == 0 for row in report['routes'].values()), report['routes']
+  row = report['routes']['GET /dashboard/stats']
+  assert row['p50'] <= row['p95'] <= row['p99']
+
+  slower = {'routes': {route: dict(row, p99=row['p99'] * 3 + 1) for route, row in report['routes'].items()}}
+  lines, regressions = loadtest.compare(report, slower)
+  assert len(regressions) == len(report['routes']) and 'REGRESSION' in lines[2]
+  assert loadtest.compare(report, report)[1] == []
+
+def test_percentile():
+  values = list(range(1, 101))
+  assert [loadtest.percentile(values, p) for p in (0.5, 0.95, 0.99)] == [50, 95, 99]
+  assert loadtest.percentile([4.0], 0.99) == 4.0
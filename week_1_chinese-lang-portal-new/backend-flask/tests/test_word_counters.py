@@ -0,0 +1,103 @@
+"""Tests for the review counters maintained on words."""
+import sqlite3
+import pytest
+from flask import Flask
+
+from lib import stats
+from lib.db import Db
+from migrate import run_migrations
+
+def walk(client, url):
+  rows, token = [], ''
+  while token is not None:
+    data = client.get(f'{url}&cursor={token}').get_json()
+    rows.extend(data['words'])
+    token = data['next_cursor']
+  return rows
+
+def test_counters_follow_reviews(app, client, session_id):
+  client.post(f'/study_sessions/{session_id}/review', json={'word_id': 1, 'correct': True})
+  client.post(f'/study_sessions/{session_id}/reviews', json=[
+    {'word_id': 1, 'correct': False, 'answered_at': '2099-01-01T00:00:00Z'},
+    {'word_id': 1, 'correct': True},
+    {'word_id': 2, 'correct': False},
+  ])
+
+  word = client.get('/words/1').get_json()['word']
+  assert (word['correct_count'], word['wrong_count']) == (2, 1)
+  assert word['accuracy'] == pytest.approx(2 / 3)
+  assert word['last_reviewed'] == '2099-01-01 00:00:00'
+  unreviewed = client.get('/words/3').get_json()['word']
+  assert (unreviewed['correct_count'], unreviewed['accuracy'], unreviewed['last_reviewed']) == (0, None, None)
+
+  connection = app.db.connect()
+  assert stats.drift(connection) == []
+  connection.close()
+
+def test_single_reviews_validate_correct_like_batches(client, session_id):
+  url = f'/study_sessions/{session_id}/review'
+  for correct in ('false', 'true', 2):
+    assert client.post(url, json={'word_id': 1, 'correct': correct}).status_code == 400
+    assert client.post(url + 's', json=[{'word_id': 1, 'correct': correct}]).status_code == 400
+  assert client.post(url, json={'word_id': 1, 'correct': 0}).status_code == 200
+  word = client.get('/words/1').get_json()['word']
+  assert (word['correct_count'], word['wrong_count']) == (0, 1)
+
+@pytest.mark.parametrize('sort_by', ['accuracy', 'last_reviewed'])
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_cursor_walk_over_nullable_sort_keys(client, session_id, sort_by, order):
+  # Reviewed words land on different pages than the unreviewed (NULL) ones
+  client.post(f'/study_sessions/{session_id}/reviews', json=[
+    {'word_id': word_id, 'correct': word_id % 3 == 0, 'answered_at': f'2025-03-{word_id % 28 + 1:02d}T10:00:00Z'}
+    for word_id in range(1, 123, 2)
+  ])
+  rows = walk(client, f'/words?sort_by={sort_by}&order={order}')
+  assert len(rows) == 123 and len({row['id'] for row in rows}) == 123
+
+  # NULLs sort first ascending and last descending
+  keys = [(row[sort_by] is not None, row[sort_by] or 0, row['id']) for row in rows]
+  assert keys == sorted(keys, reverse=order == 'desc')
+
+def test_page_listing_sorts_on_counters(client, session_id):
+  client.post(f'/study_sessions/{session_id}/reviews', json=[{'word_id': 7, 'correct': False}] * 2 + [{'word_id': 4, 'correct': False}])
+  words = client.get('/words?sort_by=wrong_count&order=desc').get_json()['words']
+  assert [(word['id'], word['wrong_count']) for word in words[:2]] == [(7, 2), (4, 1)]
+  group_words = client.get('/groups/1/words?sort_by=wrong_count&order=desc').get_json()['words']
+  assert group_words[0]['id'] == 7 and group_words[0]['accuracy'] == 0
+
+def test_cursor_page_seeks_the_sort_index(app):
+  connection = app.db.connect()
+  plan = ' '.join(row[3] for row in connection.execute('''
+    EXPLAIN QUERY PLAN SELECT * FROM words w
+    WHERE COALESCE(w.accuracy, -1) <= ? AND (COALESCE(w.accuracy, -1), w.id) < (?, ?)
+    ORDER BY COALESCE(w.accuracy, -1) DESC, w.id DESC LIMIT 50
+  ''', (0.5, 0.5, 10)))
+  connection.close()
+  assert plan.startswith('SEARCH w USING INDEX idx_words_accuracy') and 'TEMP B-TREE' not in plan
+
+def test_migration_backfills_counters(tmp_path):
+  path = str(tmp_path / 'legacy.db')
+  db = Db(database=path)
+  with Flask(__name__).app_context():
+    db.setup_tables(db.cursor())
+    db.cursor().executescript('''
+      INSERT INTO words (kanji, romaji, english, parts) VALUES ('a', 'a', 'a', '[]'), ('b', 'b', 'b', '[]');
+      INSERT INTO word_reviews (word_id, correct_count, wrong_count, last_reviewed) VALUES (2, 3, 1, '2025-03-01 10:00:00');
+    ''')
+    db.close()
+  run_migrations(path)
+  connection = sqlite3.connect(path)
+  rows = connection.execute('SELECT id, correct_count, wrong_count, accuracy, last_reviewed FROM words ORDER BY id').fetchall()
+  connection.close()
+  assert rows == [(1, 0, 0, None, None), (2, 3, 1, 0.75, '2025-03-01 10:00:00')]
+
+def test_rebuild_repairs_counters(app, client, session_id):
+  client.post(f'/study_sessions/{session_id}/review', json={'word_id': 1, 'correct': True})
+  connection = app.db.connect()
+  connection.execute('UPDATE words SET correct_count = 9 WHERE id = 1')
+  connection.commit()
+  differences = stats.drift(connection)
+  assert len(differences) == 1 and differences[0].startswith('words[1] counters: (9, 0,')
+  stats.rebuild(connection)
+  assert stats.drift(connection) == []
+  connection.close()
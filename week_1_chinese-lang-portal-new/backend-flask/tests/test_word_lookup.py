@@ -0,0 +1,30 @@
+"""Tests for the batch word lookup."""
+
+def test_get_lookup_keeps_the_order_of_the_ids(client):
+  data = client.get('/words?ids=61,1,61,999999').get_json()
+  assert [word['id'] for word in data['words']] == [61, 1]
+  assert data['missing'] == [999999]
+  assert data['words'][0]['groups'] == [{'id': 2, 'name': 'Core Adjectives'}]
+  assert set(data['words'][1]) >= {'kanji', 'romaji', 'english', 'correct_count', 'accuracy', 'groups'}
+
+def test_post_lookup_resolves_thousands_of_ids(app, client):
+  connection = app.db.connect()
+  connection.execute('INSERT INTO word_groups (word_id, group_id) VALUES (1, 2)')
+  connection.commit()
+  connection.close()
+
+  ids = list(range(1, 5001))
+  data = client.post('/words/lookup', json={'ids': ids}).get_json()
+  assert [word['id'] for word in data['words']] == list(range(1, 124))
+  assert data['missing'] == list(range(124, 5001))
+  assert [group['id'] for group in data['words'][0]['groups']] == [1, 2]
+
+  # The single word route returns the same structure
+  assert client.get('/words/1').get_json()['word'] == data['words'][0]
+
+def test_invalid_lookups_are_rejected(client):
+  assert client.get('/words?ids=1,x').status_code == 400
+  assert client.get('/words?ids=').status_code == 400
+  assert client.post('/words/lookup', json={'ids': list(range(5001))}).status_code == 400
+  assert client.post('/words/lookup', json={'ids': [1, True]}).status_code == 400
+  assert client.post('/words/lookup', json=[1, 2]).status_code == 400
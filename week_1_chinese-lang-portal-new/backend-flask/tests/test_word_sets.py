@@ -0,0 +1,118 @@
+"""Tests for multi-group study sessions over word id bitmaps."""
+import time
+import pytest
+
+from lib import word_sets
+
+def create(client, expression):
+  return client.post('/study_sessions', json={'study_activity_id': 1, 'word_set': expression})
+
+def session_words(client, session_id, **args):
+  query = '&'.join(f'{key}={value}' for key, value in args.items())
+  return client.get(f'/study_sessions/{session_id}/words?{query}').get_json()
+
+def test_bitmap_roundtrip():
+  bits = word_sets.bitmap([3, 1, 700, 8, 3])
+  assert bits.bit_count() == 4
+  assert word_sets.members(bits) == [1, 3, 8, 700]
+  assert word_sets.members(bits, after=3, limit=2) == [8, 700]
+  assert word_sets.decompress(word_sets.compress(bits)) == bits
+  data = word_sets.to_bytes(bits)
+  assert word_sets.contains(data, 700) and not word_sets.contains(data, 701)
+  assert word_sets.members(word_sets.bitmap([])) == []
+
+def test_union_of_groups(client):
+  response = create(client, {'union': [{'group': 1}, {'group': 2}]})
+  assert response.status_code == 201 and response.get_json()['word_count'] == 123
+
+  session_id = response.get_json()['session_id']
+  first = session_words(client, session_id, limit=50)
+  assert [word['id'] for word in first['words']] == list(range(1, 51))
+  assert first['group_id'] == 1 and first['word_count'] == 123
+  assert first['words'][0]['groups'][0]['id'] == 1
+
+  last = session_words(client, session_id, after_id=100, limit=50)
+  assert [word['id'] for word in last['words']] == list(range(101, 124))
+  assert last['next_after_id'] is None and first['next_after_id'] == 50
+
+def test_intersection_with_review_states(client, session_id):
+  client.post(f'/study_sessions/{session_id}/reviews', json=[
+    {'word_id': 2, 'correct': False},
+    {'word_id': 5, 'correct': True},
+    {'word_id': 70, 'correct': False},
+  ])
+
+  wrong = create(client, {'intersect': [{'group': 1}, {'state': 'wrong'}]}).get_json()
+  assert [word['id'] for word in session_words(client, wrong['session_id'])['words']] == [2]
+
+  fresh = create(client, {'difference': [{'group': 1}, {'state': 'reviewed'}]}).get_json()
+  assert fresh['word_count'] == 58
+  assert create(client, {'intersect': [{'group': 1}, {'state': 'new'}]}).get_json()['word_count'] == 58
+
+  # Missed words come back ten minutes later, so they are not due yet
+  assert create(client, {'intersect': [{'group': 2}, {'state': 'due'}]}).get_json()['word_count'] == 0
+
+  # The state bitmaps follow new reviews
+  client.post(f'/study_sessions/{session_id}/review', json={'word_id': 3, 'correct': False})
+  again = create(client, {'intersect': [{'group': 1}, {'state': 'wrong'}]}).get_json()
+  assert again['word_count'] == 2
+
+def test_due_queue_of_a_word_set(client, session_id):
+  client.post(f'/study_sessions/{session_id}/reviews', json=[
+    {'word_id': 62, 'correct': False, 'answered_at': '2025-03-01T10:00:00Z'},
+    {'word_id': 1, 'correct': True, 'answered_at': '2025-03-01T10:00:00Z'},
+  ])
+  set_session = create(client, {'union': [{'group': 2}, {'group': 1}]}).get_json()['session_id']
+  words = client.get(f'/study_sessions/{set_session}/next?n=4').get_json()['words']
+  # Overdue first (both reviews are long past due), then new words in id order
+  assert [word['id'] for word in words] == [62, 1, 2, 3]
+  assert words[0]['due_at'] == '2025-03-01 10:10:00' and words[2]['due_at'] is None
+  assert isinstance(words[0]['parts'], list)
+
+def test_group_bitmaps_follow_memberships(app, client):
+  create(client, {'group': 1})
+  builds = app.word_sets.builds
+  create(client, {'group': 1})
+  assert app.word_sets.builds == builds
+
+  connection = app.db.connect()
+  connection.execute('INSERT INTO word_groups (word_id, group_id) VALUES (61, 1)')
+  connection.commit()
+  connection.close()
+  assert create(client, {'group': 1}).get_json()['word_count'] == 61
+  assert app.word_sets.builds == builds + 1
+
+@pytest.mark.parametrize('expression', [
+  {'group': 'verbs'},
+  {'state': 'forgotten'},
+  {'union': []},
+  {'xor': [{'group': 1}]},
+  {'group': 1, 'state': 'new'},
+  {'union': [{'group': 1}] * (word_sets.MAX_EXPRESSION_TERMS + 1)},
+])
+def test_invalid_expressions(client, expression):
+  assert create(client, expression).status_code == 400
+
+def test_unknown_group_and_state_only_sets(client):
+  assert create(client, {'union': [{'group': 1}, {'group': 999}]}).status_code == 404
+  # A set naming no group needs the group to file the session under
+  assert create(client, {'state': 'new'}).status_code == 400
+  response = client.post('/study_sessions', json={'group_id': 2, 'study_activity_id': 1, 'word_set': {'state': 'new'}})
+  assert response.status_code == 201 and response.get_json()['word_count'] == 123
+
+def test_single_group_session_words(client, session_id):
+  data = session_words(client, session_id, limit=10)
+  assert [word['id'] for word in data['words']] == list(range(1, 11))
+  assert data['word_count'] is None and data['next_after_id'] == 10
+  assert client.get('/study_sessions/999/words').status_code == 404
+
+def test_set_operations_on_large_groups_are_fast():
+  verbs = word_sets.bitmap(range(1, 200000, 2))
+  adjectives = word_sets.bitmap(range(1, 300000, 3))
+  started = time.perf_counter()
+  for _ in range(100):
+    union = verbs | adjectives
+    both = verbs & adjectives
+  elapsed = (time.perf_counter() - started) / 200
+  assert union.bit_count() == 166666 and both.bit_count() == 33334
+  assert elapsed < 0.001